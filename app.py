@@ -60,7 +60,7 @@ import webbrowser
 from db import fire_db
 
 #retrival
-from retrival import re_and_exc, intent, avatar_text
+from retrival import re_and_exc, intent, avatar_text, ChatContext, COMBINED_SPEECH
 
 #kimi
 from agent import moonshot_agent
@@ -73,6 +73,9 @@ from quiz_app import QuizApp
 
 #login
 from auth_system import AuthSystem
+from request_trace import RequestTrace
+import async_runtime
+from async_runtime import run_blocking, ExecutorSaturated
 from aiohttp_wsgi import WSGIHandler
 
 app = Flask(__name__)
@@ -400,6 +403,48 @@ async def human(request):
         )
 """
 
+async def route_and_retrieve(rae, input_intent, text, trace):
+    """
+    意图识别与 RAG 检索推测并行: 查询向量只算一次, 同时喂给意图引擎和 FAISS;
+    NORMAL_CHAT (最常见) 直接复用检索结果, 其他意图则取消并丢弃检索任务。
+    """
+    course_rag = rae.course_rag
+    try:
+        query_vector = await trace.measure("embed", run_blocking(course_rag.embed_query, text))
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        print(f"Speculative retrieval disabled for this request: {e}")
+        answer_intent = await trace.measure("intent", input_intent.aroute_intent(text))
+        return answer_intent, None
+
+    # 向量检索是 CPU 任务, 放到有界线程池; 意图判断本地完成, LLM 兜底为原生异步
+    retrieval = asyncio.create_task(trace.measure(
+        "retrieve", run_blocking(course_rag.retrieve, text, query_vector=query_vector)))
+    try:
+        answer_intent = await trace.measure("intent", input_intent.aroute_intent(text, query_vector))
+    except BaseException:
+        _discard_task(retrieval)
+        raise
+
+    if answer_intent != "NORMAL_CHAT":
+        _discard_task(retrieval)
+        return answer_intent, None
+    return answer_intent, await retrieval
+
+def _discard_task(task):
+    """取消不再需要的任务; 已经结束的任务取走其异常, 避免 "Task exception was never retrieved" """
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+async def answer_and_speech(rae, avatar_input, ctx, text, answer_intent, retrieved=None):
+    """生成 (展示答案, 播报文本); 默认一次 LLM 调用完成, COMBINED_SPEECH=0 时回退到两段式"""
+    if COMBINED_SPEECH:
+        return await rae.user_answer_with_speech_async(ctx, text, answer_intent, None, retrieved)
+    rae_answer = await run_blocking(rae.user_answer, ctx, text, answer_intent, retrieved)
+    avatar_answer = await run_blocking(avatar_input.user_answer, rae_answer, answer_intent)
+    return rae_answer, avatar_answer
+
 async def human(request):
     try:
         # 从请求头获取 session_id
@@ -439,7 +484,7 @@ async def human(request):
                 text=json.dumps({"code": 401, "error": "Session expired or invalid"}),
             )
             
-        # 使用用户特定的组件
+        # 共享的问答服务 + 本次请求的用户上下文
         rae = components['rae']
         input_intent = components['input_intent']
         avatar_input = components['avatar_input']
@@ -450,26 +495,40 @@ async def human(request):
         params = await request.json()
         sessionid = params.get('sessionid',0)
         
-        # 获取对话历史（如果有）
-        conversation_history = params.get('history', [])
-        print(f"User {user.username}: received history with {len(conversation_history)} messages")
+        # 对话历史保存在服务端的会话记忆里 (摘要 + 最近轮次, 有 token 上限);
+        # 仍上传 history 的旧客户端只在记忆为空时导入一次
+        memory = components['memory']
+        memory.seed(params.get('history'))
+
+        if params['type'] == 'clear':
+            memory.clear()
+            return web.Response(
+                content_type="application/json",
+                text=json.dumps({"code": 0, "data": "cleared"}),
+            )
+
+        ctx = ChatContext(user, memory.messages())
+        print(f"User {user.username}: {len(ctx.history)} history messages (~{memory.prompt_tokens()} tokens)")
             
         if params.get('interrupt'):
             pass
                 
         if params['type'] == 'echo':
             print(f"User {user.username}: answer generating!")
-            answer_intent = await asyncio.to_thread(input_intent.route_intent, params['text'])
+            trace = RequestTrace(f"/human {user.username}")
+            answer_intent, retrieved = await route_and_retrieve(rae, input_intent, params['text'], trace)
                 
             if answer_intent == "QUIZ":
                 # 获取用户访问的主机名，用于生成正确的跳转URL
                 request_host = request.host
-                quiz_url = await asyncio.to_thread(quiz_APP.start_in_background, request_host)
+                quiz_url = await run_blocking(quiz_APP.start_in_background, request_host)
                 print(f"User {user.username}: Quiz system ready at: {quiz_url}")
 
                 # 传递对话历史给 rae
-                rae_answer = await asyncio.to_thread(rae.user_answer, params['text'], answer_intent, conversation_history)
-                avatar_answer = await asyncio.to_thread(avatar_input.user_answer, rae_answer, answer_intent)
+                rae_answer, avatar_answer = await trace.measure("answer", answer_and_speech(
+                    rae, avatar_input, ctx, params['text'], answer_intent))
+                trace.report()
+                memory.append(params['text'], rae_answer)
                     
                 return web.Response(
                     content_type="application/json",
@@ -478,21 +537,28 @@ async def human(request):
                         "data": "quiz_started", 
                         "speaking": False, 
                         "reply": rae_answer, 
+                        "speech": avatar_answer,
                         "quiz_url": quiz_url,
                         "action": "open_quiz"
                     }),
                 )
 
             # 传递对话历史给 rae
-            rae_answer = await asyncio.to_thread(rae.user_answer, params['text'], answer_intent, conversation_history)
-            avatar_answer = await asyncio.to_thread(avatar_input.user_answer, rae_answer, answer_intent)
+            rae_answer, avatar_answer = await trace.measure("answer", answer_and_speech(
+                rae, avatar_input, ctx, params['text'], answer_intent, retrieved))
+            trace.report()
             print(f"User {user.username}: {avatar_answer}")
-                
+            # 追加本轮; 超出预算时在后台折叠成摘要, 不影响本次响应
+            memory.append(params['text'], rae_answer)
+
+            result = {"code": 0, "data": "ok", "speaking": False, "reply": rae_answer, "speech": avatar_answer}
+            if answer_intent == "LEARNING_REPORT" and ctx.report_status:
+                # 报告是预先生成的; refreshing 表示后台正在用最新作答重新生成
+                result["report_version"] = ctx.report_status["version"]
+                result["report_refreshing"] = ctx.report_status["refreshing"]
             return web.Response(
                 content_type="application/json",
-                text=json.dumps(
-                    {"code": 0, "data": "ok", "speaking": False, "reply": rae_answer}
-                ),
+                text=json.dumps(result),
             )
     
     except json.JSONDecodeError:
@@ -500,6 +566,13 @@ async def human(request):
             content_type="application/json",
             text=json.dumps({"code": 400, "error": "Invalid JSON"}),
         )
+    except ExecutorSaturated as e:
+        print(f"Rejecting /human request: {e}")
+        return web.Response(
+            status=503,
+            content_type="application/json",
+            text=json.dumps({"code": 503, "error": "Server busy, please retry"}),
+        )
     except Exception as e:
         print(f"Error in human function: {e}")
         import traceback
@@ -764,6 +837,10 @@ if __name__ == '__main__':
     ### dataset options
     parser.add_argument('--color_space', type=str, default='srgb', help="Color space, supports (linear, srgb)")
     parser.add_argument('--preload', type=int, default=0, help="0 means load data from disk on-the-fly, 1 means preload to CPU, 2 means GPU.")
+    parser.add_argument('--pose_cache_mb', type=int, default=1024, help="memory budget (MB, on the render device) of the per-pose rays/bg cache, 0 to disable")
+    parser.add_argument('--render_cache_mb', type=int, default=512, help="memory budget (MB, on the render device) of the rendered frame cache keyed by (pose, audio feature, eye area), 0 to disable")
+    parser.add_argument('--render_cache_aud_step', type=float, default=1e-2, help="quantization step of the audio feature in the render cache key")
+    parser.add_argument('--render_cache_eye_step', type=float, default=1e-2, help="quantization step of the eye area in the render cache key")
     # (the default value is for the fox dataset)
     parser.add_argument('--bound', type=float, default=1, help="assume the scene is bounded in box[-bound, bound]^3, if > 1, will invoke adaptive ray marching.")
     parser.add_argument('--scale', type=float, default=4, help="scale camera location into box[-bound, bound]^3")
@@ -831,6 +908,9 @@ if __name__ == '__main__':
     parser.add_argument('--fullbody_height', type=int, default=1080)
     parser.add_argument('--fullbody_offset_x', type=int, default=0)
     parser.add_argument('--fullbody_offset_y', type=int, default=0)
+    parser.add_argument('--idle_cycle', type=str, default='', help="ernerf: packed silent frame file (.npy), silent frames are served from it instead of rendered")
+    parser.add_argument('--bake_idle', action='store_true', help="ernerf: render the silent pose cycle into --idle_cycle and exit")
+    parser.add_argument('--render_batch', type=int, default=1, help="ernerf: number of consecutive frames rendered together in one ray march, adds (render_batch-1)*40ms latency")
 
     #musetalk opt
     parser.add_argument('--avatar_id', type=str, default='avator_1')
@@ -865,6 +945,8 @@ if __name__ == '__main__':
 
     async def run_integrated_server():
         """创建整合的 aiohttp 应用"""
+        # 剩余的同步调用 (to_thread / run_in_executor) 统一走有界线程池
+        async_runtime.install()
         appasync = web.Application()
 
         # 添加原有的 aiohttp 路由
@@ -882,7 +964,7 @@ if __name__ == '__main__':
 
 
         # 创建 WSGI handler 来处理 Flask 应用
-        wsgi_handler = WSGIHandler(app)
+        wsgi_handler = WSGIHandler(app, executor=async_runtime.get_wsgi_executor())
 
         # 添加 Flask 路由到 aiohttp
         async def flask_handler(request):
@@ -959,7 +1041,12 @@ if __name__ == '__main__':
         # from nerfreal import NeRFReal,load_model,load_avatar
         # model = load_model(opt)
         # avatar = load_avatar(opt) 
-        pass
+        if opt.bake_idle:
+            from nerfreal import load_model,load_avatar,bake_idle_cycle
+            if opt.idle_cycle=='':
+                opt.idle_cycle = os.path.join(opt.workspace, 'idle_cycle.npy')
+            bake_idle_cycle(opt, load_model(opt), load_avatar(opt), opt.idle_cycle)
+            sys.exit(0)
         
         # we still need test_loader to provide audio features for testing.
         # for k in range(opt.max_session):
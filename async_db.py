@@ -0,0 +1,138 @@
+# async_db.py
+"""
+aiohttp handler 使用的异步数据访问
+
+- firestore 后端: firebase_admin.firestore_async 的 AsyncClient (原生 gRPC 异步, 不占线程)
+- sqlite 后端: 对 sqlite_store 的异步包装; 本地查询很快, 放在单独的小线程池里执行,
+  不和 BLOCKING_POOL (向量化 / 检索) 抢线程
+
+两者接口一致 (与 Firestore AsyncClient 相同):
+    snap = await adb.collection('users').document(u).get()
+    await ref.set({...}, merge=True)
+    async for doc in adb.collection('answer_records').where('user_id', '==', u).stream(): ...
+    batch = adb.batch(); batch.set(ref, data); await batch.commit()
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db import STORAGE_BACKEND
+
+SQLITE_ASYNC_WORKERS = int(os.getenv("SQLITE_ASYNC_WORKERS", "4"))
+
+_sqlite_executor = None
+_async_db = None
+_async_db_lock = threading.Lock()
+
+
+def _sqlite_pool():
+    global _sqlite_executor
+    if _sqlite_executor is None:
+        _sqlite_executor = ThreadPoolExecutor(max_workers=SQLITE_ASYNC_WORKERS, thread_name_prefix="sqlite")
+    return _sqlite_executor
+
+
+async def _in_pool(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_sqlite_pool(), lambda: fn(*args, **kwargs))
+
+
+def _unwrap(ref):
+    return ref._target if isinstance(ref, _AsyncProxy) else ref
+
+
+class _AsyncProxy:
+    """包装 sqlite_store 的 Collection / Document / Query 引用: 链式方法同步返回, I/O 方法变成协程"""
+
+    _CHAIN = {"collection", "document", "where", "order_by", "limit", "select", "collection_group"}
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in self._CHAIN:
+            return lambda *a, **kw: _AsyncProxy(attr(*a, **kw))
+        if name in ("parent",):
+            return _AsyncProxy(attr) if attr is not None else None
+        return attr
+
+    async def get(self, *args, **kwargs):
+        result = await _in_pool(self._target.get, *args, **kwargs)
+        if isinstance(result, list):
+            for snap in result:
+                snap.reference = _AsyncProxy(snap.reference)
+        else:
+            result.reference = _AsyncProxy(result.reference)
+        return result
+
+    async def set(self, document_data, merge=False):
+        return await _in_pool(self._target.set, document_data, merge=merge)
+
+    async def update(self, field_updates):
+        return await _in_pool(self._target.update, field_updates)
+
+    async def delete(self):
+        return await _in_pool(self._target.delete)
+
+    async def add(self, document_data, document_id=None):
+        ts, ref = await _in_pool(self._target.add, document_data, document_id)
+        return ts, _AsyncProxy(ref)
+
+    async def stream(self):
+        snaps = await _in_pool(lambda: list(self._target.stream()))
+        for snap in snaps:
+            snap.reference = _AsyncProxy(snap.reference)
+            yield snap
+
+
+class _AsyncWriteBatch:
+    def __init__(self, batch):
+        self._batch = batch
+
+    def set(self, reference, document_data, merge=False):
+        self._batch.set(_unwrap(reference), document_data, merge=merge)
+
+    def update(self, reference, field_updates):
+        self._batch.update(_unwrap(reference), field_updates)
+
+    def delete(self, reference):
+        self._batch.delete(_unwrap(reference))
+
+    async def commit(self):
+        return await _in_pool(self._batch.commit)
+
+
+class AsyncSQLiteClient:
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, collection_id):
+        return _AsyncProxy(self._client.collection(collection_id))
+
+    def collection_group(self, collection_id):
+        return _AsyncProxy(self._client.collection_group(collection_id))
+
+    def document(self, document_path):
+        return _AsyncProxy(self._client.document(document_path))
+
+    def batch(self):
+        return _AsyncWriteBatch(self._client.batch())
+
+
+def get_async_db():
+    """进程内共享的异步客户端, 后端与 fire_db 相同 (STORAGE_BACKEND)"""
+    global _async_db
+    if _async_db is None:
+        with _async_db_lock:
+            if _async_db is None:
+                if STORAGE_BACKEND == "sqlite":
+                    from sqlite_store import get_sqlite_client
+                    _async_db = AsyncSQLiteClient(get_sqlite_client())
+                else:
+                    from firebase_admin import firestore_async
+                    from db import init_firebase
+                    init_firebase()
+                    _async_db = firestore_async.client()
+    return _async_db
@@ -0,0 +1,106 @@
+# async_runtime.py
+"""
+aiohttp 事件循环里的阻塞调用管理
+
+- BoundedExecutor: 固定线程数 + 最大排队数。超过排队上限的请求直接报 ExecutorSaturated,
+  由 handler 返回 503, 而不是在无界队列里越排越久
+- 安装为事件循环的默认 executor, 剩余的 asyncio.to_thread / run_in_executor(None, ...) 也受同样限制
+- Flask (aiohttp_wsgi) 使用单独的线程池, 页面请求不会和 /human 的 CPU 任务 (向量化 / 检索) 互相挤占
+
+配置 (环境变量):
+    BLOCKING_POOL_SIZE    阻塞任务线程数 (默认 32)
+    BLOCKING_QUEUE_LIMIT  允许排队等待的任务数 (默认 256)
+    WSGI_POOL_SIZE        Flask 页面线程数 (默认 32)
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+BLOCKING_QUEUE_LIMIT = int(os.getenv("BLOCKING_QUEUE_LIMIT", "256"))
+WSGI_POOL_SIZE = int(os.getenv("WSGI_POOL_SIZE", "32"))
+
+
+class ExecutorSaturated(RuntimeError):
+    """阻塞任务的排队数超过 BLOCKING_QUEUE_LIMIT"""
+
+
+class BoundedExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor 的队列本身是无界的; 这里用信号量限制 "运行中 + 排队中" 的任务总数。
+    submit 在满载时立即抛 ExecutorSaturated (不阻塞事件循环)。
+    """
+
+    def __init__(self, max_workers, queue_limit, thread_name_prefix="blocking"):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.capacity = max_workers + queue_limit
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._count_lock = threading.Lock()
+        self.rejected = 0
+
+    def submit(self, fn, /, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ExecutorSaturated(f"blocking executor saturated ({self.capacity} tasks in flight)")
+        with self._count_lock:
+            self._in_flight += 1
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._count_lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def stats(self):
+        return {"in_flight": self._in_flight, "capacity": self.capacity, "rejected": self.rejected}
+
+
+_blocking_executor = None
+_wsgi_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_blocking_executor():
+    global _blocking_executor
+    if _blocking_executor is None:
+        with _executor_lock:
+            if _blocking_executor is None:
+                _blocking_executor = BoundedExecutor(BLOCKING_POOL_SIZE, BLOCKING_QUEUE_LIMIT)
+    return _blocking_executor
+
+
+def get_wsgi_executor():
+    """aiohttp_wsgi.WSGIHandler(app, executor=...) 使用的线程池"""
+    global _wsgi_executor
+    if _wsgi_executor is None:
+        with _executor_lock:
+            if _wsgi_executor is None:
+                _wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_POOL_SIZE, thread_name_prefix="wsgi")
+    return _wsgi_executor
+
+
+def install(loop=None):
+    """把有界线程池设为事件循环的默认 executor (在服务启动时调用一次)"""
+    loop = loop or asyncio.get_running_loop()
+    loop.set_default_executor(get_blocking_executor())
+    print(f"✓ Blocking executor: {BLOCKING_POOL_SIZE} threads, queue limit {BLOCKING_QUEUE_LIMIT}; "
+          f"WSGI pool: {WSGI_POOL_SIZE} threads")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """在有界线程池里执行同步函数 (CPU 任务或尚未异步化的 I/O)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_blocking_executor(), functools.partial(fn, *args, **kwargs))
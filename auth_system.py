@@ -6,45 +6,31 @@ import time
 import uuid
 import psutil
 import os
+from conversation_memory import ConversationMemory
+from session_store import ExpiringLRU, get_session_store, SESSION_IDLE_TIMEOUT, SESSION_REAP_INTERVAL
 
 class SessionComponentProxy(dict):
-    """Lazy session component holder to avoid eager heavy instantiation."""
-    __slots__ = ("_manager", "_user", "_username", "_component_cache", "_components_acquired")
+    """
+    Per-session view of the components: only the user and the conversation memory are session specific.
+    rae / input_intent / avatar_input are shared stateless services, created on first use.
+    """
+    __slots__ = ("_manager",)
 
     def __init__(self, manager, user):
         super().__init__(
             quiz_app=manager._shared_quiz_app,
             user=user,
             username=user.username,
+            memory=ConversationMemory(),
             last_accessed=time.time(),
         )
         self._manager = manager
-        self._user = user
-        self._username = user.username
-        self._component_cache = None
-        self._components_acquired = False
-
-    def _ensure_components(self):
-        if not self._components_acquired:
-            pool = self._manager._get_or_create_user_component_pool(self._user)
-            self._manager._acquire_user_components(self._username)
-            self._manager._enforce_user_cache_limit()
-            self._component_cache = pool
-            self._components_acquired = True
-        return self._component_cache
 
     def __getitem__(self, key):
         if key in ("rae", "input_intent", "avatar_input"):
-            components = self._ensure_components()
-            return components.get(key)
+            return self._manager._get_shared_services()[key]
         return super().__getitem__(key)
 
-    def release(self):
-        if self._components_acquired:
-            self._manager._release_user_components(self._username)
-            self._component_cache = None
-            self._components_acquired = False
-
 
 class AuthSystem:
     def __init__(self, user_class, flask_app=None, secret_key='demo123'):
@@ -53,22 +39,21 @@ class AuthSystem:
         self.bp = Blueprint('auth', __name__)
         self.flask_app = flask_app
         
-        # Session ID 到用户组件的映射
-        self._session_components_lock = threading.RLock()
-        self._session_components = {}  # session_id -> components
+        # Session ID 到用户组件的映射 (按最近访问排序, 空闲超过 SESSION_IDLE_TIMEOUT 后释放)
+        self._session_components = ExpiringLRU(ttl=SESSION_IDLE_TIMEOUT, on_evict=self._on_session_evicted)
+        # 多进程部署时的共享会话元数据 (SESSION_BACKEND=sqlite/redis), 默认 None
+        self._session_store = get_session_store()
         
         # 全局共享的 QuizApp 实例（路由仅需注册一次）
         self._shared_quiz_app = None
-        # 用户级组件缓存（避免重复创建占用内存的对象）
-        self._user_component_cache = {}
-        self._user_component_refcount = {}
-        self._user_component_cache_lock = threading.RLock()
-        self._user_component_cache_limit = 50  # 增加到50，避免频繁创建和销毁
         self._quiz_app_routes_registered = False
         
         # 全局共享的重型组件（所有用户共享，大幅减少内存占用）
         self._shared_rag = None
         self._shared_rag_lock = threading.Lock()
+        # 问答 / 意图 / 播报服务: 无用户状态, 所有会话共用一份; 用户与对话历史按请求传入 (retrival.ChatContext)
+        self._shared_services = None
+        self._shared_services_lock = threading.Lock()
         
         self._setup_routes()
         self._setup_middleware()
@@ -170,100 +155,60 @@ class AuthSystem:
                     print("✓ Shared RAG instance initialized successfully")
         return self._shared_rag
     
-    def _get_or_create_user_component_pool(self, user):
-        """按用户名缓存和复用重型组件，减少内存占用"""
-        from retrival import re_and_exc, intent, avatar_text
-        username = user.username
-        with self._user_component_cache_lock:
-            cached = self._user_component_cache.get(username)
-            if not cached:
-                # 使用共享 RAG 实例
-                shared_rag = self._get_shared_rag()
-                
-                cached = {
-                    'rae': re_and_exc(user, shared_rag=shared_rag),  # 传入共享 RAG
-                    'input_intent': intent(user),
-                    'avatar_input': avatar_text(user),
-                    'last_accessed': time.time()
-                }
-                self._user_component_cache[username] = cached
-                self._user_component_refcount[username] = 0
-                print(f"✓ Created components for user '{username}' (using shared RAG)")
-            else:
-                cached['last_accessed'] = time.time()
-                # 确保缓存的组件使用最新的 user 引用
-                rae = cached.get('rae')
-                if rae:
-                    setattr(rae, 'user', user)
-                    analysis = getattr(rae, 'analysis', None)
-                    if analysis:
-                        setattr(analysis, 'user', user)
-                        setattr(analysis, 'username', str(user.username))
-        return cached
-
-    def _acquire_user_components(self, username):
-        with self._user_component_cache_lock:
-            self._user_component_refcount[username] = self._user_component_refcount.get(username, 0) + 1
-
-    def _release_user_components(self, username):
-        with self._user_component_cache_lock:
-            if username in self._user_component_refcount:
-                self._user_component_refcount[username] -= 1
-                if self._user_component_refcount[username] <= 0:
-                    self._user_component_refcount.pop(username, None)
-                    self._user_component_cache.pop(username, None)
+    def _get_shared_services(self):
+        """获取全局共享的 rae / input_intent / avatar_input（第一次使用时创建）"""
+        if self._shared_services is None:
+            with self._shared_services_lock:
+                if self._shared_services is None:  # Double-check locking
+                    from retrival import re_and_exc, intent, avatar_text
+                    shared_rag = self._get_shared_rag()
+                    self._shared_services = {
+                        'rae': re_and_exc(shared_rag=shared_rag),
+                        'input_intent': intent(shared_rag=shared_rag),
+                        'avatar_input': avatar_text(),
+                    }
+                    print("✓ Shared chat services initialized (rae / intent / avatar_text)")
+        return self._shared_services
     
     def _release_session_components(self, session_id):
         """释放会话占用的资源引用"""
-        with self._session_components_lock:
-            components = self._session_components.pop(session_id, None)
-        if not components:
-            return
-        if isinstance(components, SessionComponentProxy):
-            components.release()
+        self._session_components.pop(session_id)
+        if self._session_store:
+            self._session_store.delete(session_id)
+
+    def _on_session_evicted(self, session_id, components):
+        """会话空闲超时被移出"""
+        print(f"  • Session {session_id[:8]}... released (inactive)")
 
-    
-    def _enforce_user_cache_limit(self):
-        """限制用户组件缓存大小，避免内存无限增长"""
-        limit = self._user_component_cache_limit
-        if limit is None or limit <= 0:
-            return
-        with self._user_component_cache_lock:
-            if len(self._user_component_cache) <= limit:
-                return
-            # 按 last_accessed 排序，淘汰最旧且无人引用的缓存
-            candidates = sorted(
-                self._user_component_cache.items(),
-                key=lambda kv: kv[1].get('last_accessed', 0)
-            )
-            for username, _ in candidates:
-                if len(self._user_component_cache) <= limit:
-                    break
-                if self._user_component_refcount.get(username, 0) > 0:
-                    continue
-                self._user_component_cache.pop(username, None)
-                self._user_component_refcount.pop(username, None)
-                print(f"🗑️ Evicted cached components for '{username}' due to cache limit")
     def _get_or_create_session_components(self, session_id, user):
         """获取或创建Session特定的用户组件"""
-        with self._session_components_lock:
-            if session_id not in self._session_components:
-                components = SessionComponentProxy(self, user)
-                self._session_components[session_id] = components
-                print(f"✓ Session {session_id[:8]}... for user '{user.username}' initialized (lazy components)")
-            
-            # 更新最后访问时间
-            self._session_components[session_id]['last_accessed'] = time.time()
-            
-            return self._session_components[session_id]
+        components, created = self._session_components.get_or_create(
+            session_id, lambda: SessionComponentProxy(self, user))
+        if created:
+            print(f"✓ Session {session_id[:8]}... for user '{user.username}' initialized (lazy components)")
+        
+        # 更新最后访问时间
+        components['last_accessed'] = time.time()
+        if self._session_store:
+            self._session_store.touch(session_id, user.username, force=created)
+        return components
     
     def get_user_components_by_session(self, session_id):
         """根据session_id获取用户组件"""
-        with self._session_components_lock:
-            components = self._session_components.get(session_id)
-            if components:
-                components['last_accessed'] = time.time()
+        components = self._session_components.get(session_id)
+        if components is not None:
+            components['last_accessed'] = time.time()
+            if self._session_store:
+                self._session_store.touch(session_id, components.get('username'))
             return components
+        if not self._session_store:
+            return None
+        # 会话可能由另一个前端进程创建: 从共享存储查到用户后在本进程懒创建组件
+        username = self._session_store.get(session_id)
+        user = self.user_class.get_by_username(username) if username else None
+        if not user:
+            return None
+        return self._get_or_create_session_components(session_id, user)
     
     def get_user_components(self):
         """从请求上下文中获取当前用户的组件"""
@@ -434,16 +379,16 @@ class AuthSystem:
             # 系统总内存
             system_memory = psutil.virtual_memory()
             
-            with self._session_components_lock:
-                active_sessions = len(self._session_components)
-                sessions_info = []
-                for sid, comp in self._session_components.items():
-                    user = comp.get('user')
-                    sessions_info.append({
-                        'session_id': sid[:8] + '...',
-                        'username': user.username if user else 'unknown',
-                        'last_accessed': time.strftime('%H:%M:%S', time.localtime(comp.get('last_accessed', 0)))
-                    })
+            sessions = self._session_components.items()
+            active_sessions = len(sessions)
+            sessions_info = []
+            for sid, comp, last_accessed in sessions:
+                user = comp.get('user')
+                sessions_info.append({
+                    'session_id': sid[:8] + '...',
+                    'username': user.username if user else 'unknown',
+                    'last_accessed': time.strftime('%H:%M:%S', time.localtime(last_accessed))
+                })
             
             status = {
                 'memory': {
@@ -457,7 +402,8 @@ class AuthSystem:
                     'details': sessions_info
                 },
                 'shared_components': {
-                    'quiz_app_id': id(self._shared_quiz_app) if self._shared_quiz_app else None
+                    'quiz_app_id': id(self._shared_quiz_app) if self._shared_quiz_app else None,
+                    'chat_services_ready': self._shared_services is not None
                 }
             }
             
@@ -465,35 +411,25 @@ class AuthSystem:
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
-    def cleanup_expired_sessions(self, max_inactive_time=3600):
-        """清理过期的Session，返回清理数量"""
-        current_time = time.time()
-        
-        expired_sessions = []
-        with self._session_components_lock:
-            for session_id, components in list(self._session_components.items()):
-                if current_time - components.get('last_accessed', 0) > max_inactive_time:
-                    expired_sessions.append(session_id)
-        
-        for session_id in expired_sessions:
-            self._release_session_components(session_id)
-            print(f"  • Session {session_id[:8]}... released (inactive)")
-        
-        return len(expired_sessions)
+    def cleanup_expired_sessions(self, max_inactive_time=None):
+        """清理过期的Session，返回清理数量 (只从 LRU 表头弹出过期条目, 不扫描活跃会话)"""
+        expired = self._session_components.expire(max_idle=max_inactive_time)
+        if self._session_store:
+            self._session_store.expire()
+        return len(expired)
     
     def get_all_sessions(self):
         """获取所有活跃会话用于调试"""
-        with self._session_components_lock:
-            return list(self._session_components.keys())
+        return self._session_components.keys()
     
     def _start_session_cleanup_thread(self):
         """启动后台线程定期清理过期会话"""
         def cleanup_worker():
             while True:
-                time.sleep(120)  # 每2分钟清理一次
+                time.sleep(SESSION_REAP_INTERVAL)
                 try:
-                    # 清理10分钟不活动的会话
-                    expired_count = self.cleanup_expired_sessions(max_inactive_time=600)
+                    # 清理空闲超过 SESSION_IDLE_TIMEOUT 的会话 (访问时也会顺带清理已过期的条目)
+                    expired_count = self.cleanup_expired_sessions()
                     if expired_count > 0:
                         print(f"🧹 Cleaned up {expired_count} inactive session(s)")
                     
@@ -501,10 +437,11 @@ class AuthSystem:
                     import psutil
                     process = psutil.Process()
                     memory_mb = process.memory_info().rss / 1024 / 1024
-                    print(f"📊 Memory usage: {memory_mb:.1f} MB, Active sessions: {len(self._session_components)}, Cached users: {len(self._user_component_cache)}")
+                    print(f"📊 Memory usage: {memory_mb:.1f} MB, Active sessions: {len(self._session_components)}")
                 except Exception as e:
                     print(f"❌ Error in session cleanup: {e}")
         
         cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True, name="SessionCleanup")
         cleanup_thread.start()
-        print("✓ Session cleanup thread started (checks every 2 min, removes after 10 min inactivity)")
\ No newline at end of file
+        print(f"✓ Session cleanup thread started (checks every {SESSION_REAP_INTERVAL:.0f}s, "
+              f"removes after {SESSION_IDLE_TIMEOUT:.0f}s inactivity)")
\ No newline at end of file
@@ -46,6 +46,59 @@ def read_imgs(img_list):
         frames.append(frame)
     return frames
 
+class FrameRecord:
+    """推理线程送到 process_frames 的一帧"""
+    __slots__ = ('face', 'idx', 'pcm', 'types')
+
+    def __init__(self, face, idx, pcm, types):
+        self.face = face    # uint8 人脸预测 [h, w, 3], 全静音的 batch 为 None
+        self.idx = idx      # 在 frame_list_cycle 中的下标
+        self.pcm = pcm      # int16 [2, chunk], 这一视频帧对应的两个 20ms 音频, 连续存放
+        self.types = types  # [2], 音频类型, 0 为说话
+
+    def is_silent(self)->bool:
+        return self.types[0]!=0 and self.types[1]!=0
+
+class FrameBatch:
+    """
+    推理线程每个 batch 的预分配缓冲: 人脸预测在推理侧整批转成 uint8, 音频整批转成 int16, FrameRecord 只引用其中的切片.
+    缓冲按 batch 轮转 slots 份: res_frame_queue 最多 2*batch 帧, 加上 process_frames 正在处理的一帧,
+    最多引用前 3 个 batch, 所以默认 4 份时正在写入的 slot 已不再被引用
+    """
+    def __init__(self, batch_size, chunk, slots=4):
+        self.batch_size = batch_size
+        self.slots = slots
+        self.slot = -1
+        self.pcm = np.zeros((slots, batch_size, 2, chunk), dtype=np.int16)
+        self.types = np.zeros((slots, batch_size, 2), dtype=np.int32)
+        self.faces = None # [slots, batch_size, h, w, 3], 第一次 put_faces 时按预测的尺寸分配
+
+    def put_audio(self, audio_frames)->bool:
+        # audio_frames: batch_size*2 个 (float pcm, type), 写入下一个 slot, 返回是否全为静音
+        self.slot = (self.slot + 1) % self.slots
+        pcm = self.pcm[self.slot].reshape(-1, self.pcm.shape[-1])
+        types = self.types[self.slot].reshape(-1)
+        for i, (frame, type) in enumerate(audio_frames):
+            # 自定义音频结尾可能不足 chunk, 不足部分补 0
+            n = min(len(frame), pcm.shape[-1])
+            np.multiply(frame[:n], 32767, out=pcm[i, :n], casting='unsafe') # 同 (frame * 32767).astype(np.int16), 不产生临时数组
+            pcm[i, n:] = 0
+            types[i] = type
+        return bool((types!=0).all())
+
+    def put_faces(self, pred, scale=None):
+        # pred: [batch, h, w, 3], 乘 scale 后 (截断) 转成 uint8 写入当前 slot
+        if self.faces is None or self.faces.shape[2:] != pred.shape[1:]:
+            self.faces = np.zeros((self.slots, self.batch_size) + tuple(pred.shape[1:]), dtype=np.uint8)
+        out = self.faces[self.slot][:len(pred)]
+        if scale is None:
+            np.copyto(out, pred, casting='unsafe')
+        else:
+            np.multiply(pred, scale, out=out, casting='unsafe')
+
+    def record(self, i, idx, face=True)->FrameRecord:
+        return FrameRecord(self.faces[self.slot][i] if face else None, idx, self.pcm[self.slot][i], self.types[self.slot][i])
+
 class BaseReal:
     def __init__(self, opt):
         self.opt = opt
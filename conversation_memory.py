@@ -0,0 +1,190 @@
+# conversation_memory.py
+"""
+服务端会话记忆 (每个会话一份, 挂在 SessionComponentProxy['memory'] 上)
+
+客户端不再每次请求都上传完整 history; 服务端保存:
+    summary  较早对话的滚动摘要
+    turns    最近的若干轮, 逐字保留, 总 token 不超过 MEMORY_TOKEN_BUDGET
+
+提示词布局: [固定 system] [摘要 system] [turns ...] [本次问题 + 检索片段]
+- turns 只在末尾追加, 两次请求之间前缀完全相同, 可以命中模型服务端的前缀缓存 (prompt caching);
+  旧实现的 history[-8:] 每轮都滑动, 前缀每次都变
+- 超出预算时一次性把最早的若干轮折叠到只剩 budget * MEMORY_FOLD_TARGET,
+  前缀只在折叠时变化一次, 而不是每轮都变
+- 折叠 (调用模型写摘要) 在后台线程池执行, 不在请求的关键路径上; 摘要完成前这些轮次仍原样放进提示词,
+  模型调用失败时退化为截断拼接, 保证记忆始终有界
+
+配置: MEMORY_TOKEN_BUDGET (默认 1200), MEMORY_FOLD_TARGET (默认 0.5),
+      MEMORY_SUMMARY_TOKENS (默认 300), MEMORY_WORKERS (默认 2)
+"""
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1200"))
+MEMORY_FOLD_TARGET = float(os.getenv("MEMORY_FOLD_TARGET", "0.5"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "2"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation with this student:\n"
+
+_RE_CJK = re.compile(r"[　-鿿가-힯＀-￯]")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数 (英文约 4 字符 / token, 中日韩字符约 1 字 / token), 只用于预算控制"""
+    if not text:
+        return 0
+    cjk = len(_RE_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def clip_to_tokens(text, max_tokens, keep_end=False):
+    """按估算 token 数截断; 默认保留开头, keep_end=True 时保留结尾"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        part = text[-mid:] if keep_end else text[:mid]
+        if estimate_tokens(part) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    if keep_end:
+        return "... " + text[len(text) - lo:].lstrip()
+    return text[:lo].rstrip() + " ..."
+
+
+def fallback_summary(summary, turns, max_tokens=MEMORY_SUMMARY_TOKENS):
+    """模型不可用时的摘要: 旧摘要 + 每轮第一句, 截断到 max_tokens"""
+    lines = [summary] if summary else []
+    for turn in turns:
+        first = re.split(r"(?<=[.?!。？！])\s", turn["content"].strip(), maxsplit=1)[0]
+        lines.append(f"{turn['role']}: {first}")
+    # 保留最新的内容
+    return clip_to_tokens("\n".join(lines), max_tokens, keep_end=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _summary_pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MEMORY_WORKERS, thread_name_prefix="memory")
+    return _executor
+
+
+def _default_summarizer(summary, turns):
+    from retrival import summarize_conversation
+    return summarize_conversation(summary, turns, max_tokens=MEMORY_SUMMARY_TOKENS)
+
+
+class ConversationMemory:
+    def __init__(self, budget=MEMORY_TOKEN_BUDGET, fold_target=MEMORY_FOLD_TARGET,
+                 summarizer=None, background=True):
+        self.budget = budget
+        self.fold_target = fold_target
+        self.summarizer = summarizer or _default_summarizer
+        self.background = background
+        self.summary = ""
+        self.turns = []            # [{"role", "content", "tokens"}] 逐字保留的最近轮次
+        self._folding = []         # 正在后台写入摘要的轮次 (完成前仍放进提示词)
+        self._turn_tokens = 0
+        self._generation = 0       # clear() 时 +1; 清空前已经开始的摘要完成后直接丢弃
+        self._lock = threading.Lock()
+        self.folds = 0
+
+    def __len__(self):
+        return len(self._folding) + len(self.turns)
+
+    def messages(self):
+        """给模型的历史消息: [摘要 (system)] + 逐字轮次; 格式与客户端 history 相同"""
+        with self._lock:
+            out = []
+            if self.summary:
+                out.append({"role": "system", "content": SUMMARY_PREFIX + self.summary})
+            for turn in self._folding + self.turns:
+                out.append({"role": turn["role"], "content": turn["content"]})
+            return out
+
+    def prompt_tokens(self):
+        with self._lock:
+            return (estimate_tokens(self.summary) + self._turn_tokens +
+                    sum(t["tokens"] for t in self._folding))
+
+    def seed(self, history):
+        """兼容仍然上传 history 的旧客户端: 记忆为空时导入一次"""
+        if not history or len(self):
+            return
+        for turn in history:
+            if turn.get("role") in ("user", "assistant") and turn.get("content"):
+                self._add(turn["role"], str(turn["content"]))
+        self._maybe_fold()
+
+    def append(self, user_text, assistant_text):
+        """一轮问答结束后调用 (在响应返回之后, 不影响本次延迟)"""
+        self._add("user", user_text or "")
+        self._add("assistant", assistant_text or "")
+        self._maybe_fold()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.summary = ""
+            self.turns = []
+            self._folding = []
+            self._turn_tokens = 0
+
+    def _add(self, role, content):
+        tokens = estimate_tokens(content)
+        with self._lock:
+            self.turns.append({"role": role, "content": content, "tokens": tokens})
+            self._turn_tokens += tokens
+
+    def _maybe_fold(self):
+        with self._lock:
+            if self._folding or self._turn_tokens <= self.budget:
+                return
+            # 从最早的轮次开始折叠, 直到剩余不超过 budget * fold_target (至少保留最近一轮问答)
+            target = self.budget * self.fold_target
+            cut = 0
+            remaining = self._turn_tokens
+            while cut < len(self.turns) - 2 and remaining > target:
+                remaining -= self.turns[cut]["tokens"]
+                cut += 1
+            if cut % 2:     # 按 user/assistant 成对折叠
+                cut += 1
+            if cut == 0:
+                return
+            self._folding = self.turns[:cut]
+            self.turns = self.turns[cut:]
+            self._turn_tokens = sum(t["tokens"] for t in self.turns)
+            summary, folding, generation = self.summary, list(self._folding), self._generation
+        if self.background:
+            _summary_pool().submit(self._fold, summary, folding, generation)
+        else:
+            self._fold(summary, folding, generation)
+
+    def _fold(self, summary, turns, generation):
+        try:
+            new_summary = (self.summarizer(summary, turns) or "").strip()
+        except Exception as e:
+            print(f"[memory] summarization failed, using fallback: {e}")
+            new_summary = ""
+        if not new_summary:
+            new_summary = fallback_summary(summary, turns)
+        with self._lock:
+            if generation != self._generation:
+                # 摘要期间会话已被清空, 不能把清空前的内容写回
+                return
+            self.summary = clip_to_tokens(new_summary, MEMORY_SUMMARY_TOKENS * 2)
+            self._folding = []
+            self.folds += 1
+        # 摘要期间可能又积累了超出预算的轮次
+        self._maybe_fold()
@@ -1,31 +1,64 @@
-import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+import os
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(
-        r'./quizsite-fb97c-firebase-adminsdk-fbsvc-76a794e54f.json'
-    )
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
+# 存储后端: firestore (默认) 或 sqlite (本地嵌入式, 见 sqlite_store.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore").lower()
+FIREBASE_CREDENTIALS = os.getenv(
+    "FIREBASE_CREDENTIALS", r'./quizsite-fb97c-firebase-adminsdk-fbsvc-76a794e54f.json'
+)
 
-print("database activate!!!!")
+if STORAGE_BACKEND == "sqlite":
+    from sqlite_store import Increment, DELETE_FIELD
+else:
+    from firebase_admin import firestore
+    Increment = firestore.Increment
+    DELETE_FIELD = firestore.DELETE_FIELD
+
+
+def init_firebase():
+    """第一次使用时才初始化 firebase_admin (sqlite 后端不需要凭据文件)"""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+        firebase_admin.initialize_app(cred)
+        print("database activate!!!!")
+
+
+def _firestore_client():
+    from firebase_admin import firestore
+    init_firebase()
+    return firestore.client()
 
 
 class fire_db():
-    def __init__(self):
-        self.db = firestore.client()
-    
+    def __init__(self, sqlite_path=None):
+        # 后端按进程选择: Increment / DELETE_FIELD 哨兵要和客户端对应
+        self.backend = STORAGE_BACKEND
+        if self.backend == "sqlite":
+            from sqlite_store import get_sqlite_client, SQLITE_PATH
+            self.db = get_sqlite_client(sqlite_path or SQLITE_PATH)
+        else:
+            self.db = _firestore_client()
+
     # 添加缺失的方法以兼容原始代码
     def collection(self, collection_name):
         """直接访问集合"""
         return self.db.collection(collection_name)
-    
+
     def collection_group(self, collection_name):
         """访问集合组"""
         return self.db.collection_group(collection_name)
-    
+
+    @property
+    def supports_snapshots(self):
+        """后端是否支持 on_snapshot 变更推送 (sqlite 后端不支持)"""
+        return getattr(self.db, 'supports_snapshots', True)
+
+    def batch(self):
+        """批量写 (WriteBatch), 多次写入一次提交"""
+        return self.db.batch()
+
     def document(self, collection_name, doc_name):
         """访问文档"""
         return self.db.collection(collection_name).document(doc_name)
@@ -34,8 +67,8 @@ class fire_db():
     def read_wq(self, collection_1, username, collection_2):
         wq_doc = self.db.collection(collection_1).document(username).collection(collection_2)
         return wq_doc
-    
+
     def read_doc(self, collection, username):
         doc = self.db.collection(collection).document(username).get()
         return doc
-    
\ No newline at end of file
+
@@ -0,0 +1,37 @@
+import os
+import importlib
+
+import torch
+
+# backend of the compiled extensions (raymarching / gridencoder / freqencoder / shencoder):
+#   auto:  CUDA extension when a GPU is available and the extension loads (or builds), otherwise pure PyTorch
+#   cuda:  CUDA extension only, fail loudly if it cannot be loaded
+#   torch: pure PyTorch (runs on CPU, used for CPU-only nodes and for checking the kernels)
+ERNERF_BACKEND = os.getenv('ERNERF_BACKEND', 'auto').lower()
+
+
+def load_backend(package, prebuilt):
+    ''' pick the backend of an extension package
+    Args:
+        package: str, e.g. 'ernerf.raymarching', must contain backend.py (JIT build) and torch_backend.py
+        prebuilt: str, name of the prebuilt extension module, e.g. '_raymarching_face'
+    Returns:
+        backend: module implementing the bindings
+        is_cuda: bool, True for the CUDA extension (inputs are moved to GPU)
+    '''
+    if ERNERF_BACKEND not in ('auto', 'cuda', 'torch'):
+        raise ValueError(f'Unknown ERNERF_BACKEND: {ERNERF_BACKEND}, choose from [auto, cuda, torch]')
+
+    if ERNERF_BACKEND == 'cuda' or (ERNERF_BACKEND == 'auto' and torch.cuda.is_available()):
+        try:
+            return importlib.import_module(prebuilt), True
+        except ImportError:
+            pass
+        try:
+            return importlib.import_module('.backend', package)._backend, True
+        except Exception as e: # no nvcc / no toolkit / build failure
+            if ERNERF_BACKEND == 'cuda':
+                raise
+            print(f'[WARN] {package}: CUDA extension unavailable ({type(e).__name__}: {e}), falling back to the PyTorch backend')
+
+    return importlib.import_module('.torch_backend', package), False
@@ -2,15 +2,47 @@ import os
 import glob
 import tqdm
 import json
+import time
+import hashlib
 import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import cv2
 import numpy as np
 
+
+def run_cmd(cmd):
+    # like os.system, but a failed command fails its stage (so it is not recorded as done, and reruns next time)
+    ret = os.system(cmd)
+    if ret != 0:
+        raise RuntimeError(f'command failed ({ret}): {cmd}')
+
+
+def map_chunks(func, items, args=(), workers=1, chunk=16, desc=None):
+    # run func(items[i:i+chunk], *args) for every chunk, in a process pool if workers > 1, results in order
+    chunks = [items[i:i + chunk] for i in range(0, len(items), chunk)]
+    if workers <= 1 or len(chunks) <= 1:
+        return [func(c, *args) for c in tqdm.tqdm(chunks, desc=desc)]
+    # spawn: stages run in threads, forking a threaded process is not safe
+    with ProcessPoolExecutor(min(workers, len(chunks)), mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(func, c, *args) for c in chunks]
+        return [future.result() for future in tqdm.tqdm(futures, desc=desc)]
+
+
+def is_fresh(out_path, *in_paths):
+    # out_path exists and is newer than all inputs, used to resume per-frame stages
+    if not os.path.exists(out_path):
+        return False
+    mtime = os.path.getmtime(out_path)
+    return all(os.path.getmtime(p) <= mtime for p in in_paths if os.path.exists(p))
+
+
 def extract_audio(path, out_path, sample_rate=16000):
     
     print(f'[INFO] ===== extract audio from {path} to {out_path} =====')
-    cmd = f'ffmpeg -i {path} -f wav -ar {sample_rate} {out_path}'
-    os.system(cmd)
+    cmd = f'ffmpeg -y -i {path} -f wav -ar {sample_rate} {out_path}'
+    run_cmd(cmd)
     print(f'[INFO] ===== extracted audio =====')
 
 
@@ -21,7 +53,7 @@ def extract_audio_features(path, mode='wav2vec'):
         cmd = f'python nerf/asr.py --wav {path} --save_feats'
     else: # deepspeech
         cmd = f'python data_utils/deepspeech_features/extract_ds_features.py --input {path}'
-    os.system(cmd)
+    run_cmd(cmd)
     print(f'[INFO] ===== extracted audio labels =====')
 
 
@@ -29,8 +61,8 @@ def extract_audio_features(path, mode='wav2vec'):
 def extract_images(path, out_path, fps=25):
 
     print(f'[INFO] ===== extract images from {path} to {out_path} =====')
-    cmd = f'ffmpeg -i {path} -vf fps={fps} -qmin 1 -q:v 1 -start_number 0 {os.path.join(out_path, "%d.jpg")}'
-    os.system(cmd)
+    cmd = f'ffmpeg -y -i {path} -vf fps={fps} -qmin 1 -q:v 1 -start_number 0 {os.path.join(out_path, "%d.jpg")}'
+    run_cmd(cmd)
     print(f'[INFO] ===== extracted images =====')
 
 
@@ -38,7 +70,7 @@ def extract_semantics(ori_imgs_dir, parsing_dir):
 
     print(f'[INFO] ===== extract semantics from {ori_imgs_dir} to {parsing_dir} =====')
     cmd = f'python data_utils/face_parsing/test.py --respath={parsing_dir} --imgpath={ori_imgs_dir}'
-    os.system(cmd)
+    run_cmd(cmd)
     print(f'[INFO] ===== extracted semantics =====')
 
 
@@ -49,6 +81,8 @@ def extract_landmarks(ori_imgs_dir):
     import face_alignment
     fa = face_alignment.FaceAlignment(face_alignment.LandmarksType._2D, flip_input=False)
     image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
+    # resume: skip frames whose landmarks are already extracted
+    image_paths = [p for p in image_paths if not is_fresh(p.replace('jpg', 'lms'), p)]
     for image_path in tqdm.tqdm(image_paths):
         input = cv2.imread(image_path, cv2.IMREAD_UNCHANGED) # [H, W, 3]
         input = cv2.cvtColor(input, cv2.COLOR_BGR2RGB)
@@ -60,75 +94,98 @@ def extract_landmarks(ori_imgs_dir):
     print(f'[INFO] ===== extracted face landmarks =====')
 
 
-def extract_background(base_dir, ori_imgs_dir):
+def background_chunk(image_paths):
+    # for a chunk of frames: per-pixel max squared distance to the foreground, and the color of the (first) frame reaching it
+    max_dist, bc_img = None, None
+    for image_path in image_paths:
+        parse_img = cv2.imread(image_path.replace('ori_imgs', 'parsing').replace('.jpg', '.png'))
+        bg = (parse_img[..., 0] == 255) & (parse_img[..., 1] == 255) & (parse_img[..., 2] == 255)
+        # euclidean distance of every pixel to the nearest foreground (zero) pixel
+        dist = cv2.distanceTransform(bg.astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE) # [H, W]
+        # the float32 result is only within ~1e-7 relative of sqrt(dx^2 + dy^2), so equal distances in two frames
+        # can compare unequal; compare the (integer) squared distances instead, exact up to ~1500 px
+        dist = np.rint(dist.astype(np.float64) ** 2).astype(np.int64)
+        img = cv2.imread(image_path)
+        if max_dist is None:
+            max_dist, bc_img = dist, img
+        else:
+            update = dist > max_dist # strict, keeps the first frame on ties like argmax
+            max_dist[update] = dist[update]
+            bc_img[update] = img[update]
+    return max_dist, bc_img
+
+
+def fill_background(bc_img, bc_pixs):
+    # fill the pixels outside bc_pixs (in-place) with the nearest bc_pixs pixel, via the label (nearest zero pixel) of the distance transform;
+    # DIST_MASK_5 distances are approximate, so a pixel may take a slightly farther source than the exact nearest one
+    # returns the filled pixels [K, 2] and their source pixels [K, 2]
+    _, labels = cv2.distanceTransformWithLabels((~bc_pixs).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_5, labelType=cv2.DIST_LABEL_PIXEL)
+    fg_xys = np.stack(np.nonzero(bc_pixs)).transpose()
+    label_xys = np.zeros((labels.max() + 1, 2), dtype=np.int64)
+    label_xys[labels[bc_pixs]] = fg_xys # every seed pixel carries its own label
+    bg_xys = np.stack(np.nonzero(~bc_pixs)).transpose()
+    bg_fg_xys = label_xys[labels[~bc_pixs]]
+    bc_img[bg_xys[:, 0], bg_xys[:, 1], :] = bc_img[bg_fg_xys[:, 0], bg_fg_xys[:, 1], :]
+    return bg_xys, bg_fg_xys
+
+
+def extract_background(base_dir, ori_imgs_dir, workers=1, chunk=16):
     
     print(f'[INFO] ===== extract background image from {ori_imgs_dir} =====')
 
-    from sklearn.neighbors import NearestNeighbors
-
     image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
     # only use 1/20 image_paths 
     image_paths = image_paths[::20]
-    # read one image to get H/W
-    tmp_image = cv2.imread(image_paths[0], cv2.IMREAD_UNCHANGED) # [H, W, 3]
-    h, w = tmp_image.shape[:2]
-
-    # nearest neighbors
-    all_xys = np.mgrid[0:h, 0:w].reshape(2, -1).transpose()
-    distss = []
-    for image_path in tqdm.tqdm(image_paths):
-        parse_img = cv2.imread(image_path.replace('ori_imgs', 'parsing').replace('.jpg', '.png'))
-        bg = (parse_img[..., 0] == 255) & (parse_img[..., 1] == 255) & (parse_img[..., 2] == 255)
-        fg_xys = np.stack(np.nonzero(~bg)).transpose(1, 0)
-        nbrs = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(fg_xys)
-        dists, _ = nbrs.kneighbors(all_xys)
-        distss.append(dists)
-
-    distss = np.stack(distss)
-    max_dist = np.max(distss, 0)
-    max_id = np.argmax(distss, 0)
 
-    bc_pixs = max_dist > 5
-    bc_pixs_id = np.nonzero(bc_pixs)
-    bc_ids = max_id[bc_pixs]
+    # reduce chunk by chunk (in order), only [H, W] max distance and color are kept in memory
+    max_dist, bc_img = None, None
+    for dist, img in map_chunks(background_chunk, image_paths, (), workers, chunk, desc='background'):
+        if max_dist is None:
+            max_dist, bc_img = dist, img
+        else:
+            update = dist > max_dist
+            max_dist[update] = dist[update]
+            bc_img[update] = img[update]
 
-    imgs = []
-    num_pixs = distss.shape[1]
-    for image_path in image_paths:
-        img = cv2.imread(image_path)
-        imgs.append(img)
-    imgs = np.stack(imgs).reshape(-1, num_pixs, 3)
+    # pixels far enough from the foreground in some frame are background (distance > 5)
+    bc_pixs = max_dist > 25
+    bc_img[~bc_pixs] = 0
 
-    bc_img = np.zeros((h*w, 3), dtype=np.uint8)
-    bc_img[bc_pixs_id, :] = imgs[bc_ids, bc_pixs_id, :]
-    bc_img = bc_img.reshape(h, w, 3)
-
-    max_dist = max_dist.reshape(h, w)
-    bc_pixs = max_dist > 5
-    bg_xys = np.stack(np.nonzero(~bc_pixs)).transpose()
-    fg_xys = np.stack(np.nonzero(bc_pixs)).transpose()
-    nbrs = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(fg_xys)
-    distances, indices = nbrs.kneighbors(bg_xys)
-    bg_fg_xys = fg_xys[indices[:, 0]]
-    bc_img[bg_xys[:, 0], bg_xys[:, 1], :] = bc_img[bg_fg_xys[:, 0], bg_fg_xys[:, 1], :]
+    # fill the rest with the nearest background pixel
+    fill_background(bc_img, bc_pixs)
 
     cv2.imwrite(os.path.join(base_dir, 'bc.jpg'), bc_img)
 
     print(f'[INFO] ===== extracted background image =====')
 
 
-def extract_torso_and_gt(base_dir, ori_imgs_dir):
+def extract_torso_and_gt(base_dir, ori_imgs_dir, workers=1, chunk=16):
 
     print(f'[INFO] ===== extract torso and gt images for {base_dir} =====')
 
+    bg_path = os.path.join(base_dir, 'bc.jpg')
+    image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
+
+    # resume: skip frames whose gt and torso images are newer than their inputs
+    def done(image_path):
+        inputs = (image_path, image_path.replace('ori_imgs', 'parsing').replace('.jpg', '.png'), bg_path)
+        return is_fresh(image_path.replace('ori_imgs', 'gt_imgs'), *inputs) and is_fresh(image_path.replace('ori_imgs', 'torso_imgs').replace('.jpg', '.png'), *inputs)
+    image_paths = [p for p in image_paths if not done(p)]
+
+    map_chunks(torso_and_gt, image_paths, (bg_path,), workers, chunk, desc='torso_and_gt')
+
+    print(f'[INFO] ===== extracted torso and gt images =====')
+
+
+def torso_and_gt(image_paths, bg_path):
+    # gt and torso images for a chunk of frames
+
     from scipy.ndimage import binary_erosion, binary_dilation
 
     # load bg
-    bg_image = cv2.imread(os.path.join(base_dir, 'bc.jpg'), cv2.IMREAD_UNCHANGED)
-    
-    image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
+    bg_image = cv2.imread(bg_path, cv2.IMREAD_UNCHANGED)
 
-    for image_path in tqdm.tqdm(image_paths):
+    for image_path in image_paths:
         # read ori image
         ori_image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED) # [H, W, 3]
 
@@ -236,8 +293,6 @@ def extract_torso_and_gt(base_dir, ori_imgs_dir):
 
         cv2.imwrite(image_path.replace('ori_imgs', 'torso_imgs').replace('.jpg', '.png'), np.concatenate([torso_image, torso_alpha], axis=-1))
 
-    print(f'[INFO] ===== extracted torso and gt images =====')
-
 
 def face_tracking(ori_imgs_dir):
 
@@ -251,7 +306,7 @@ def face_tracking(ori_imgs_dir):
 
     cmd = f'python data_utils/face_tracking/face_tracker.py --path={ori_imgs_dir} --img_h={h} --img_w={w} --frame_num={len(image_paths)}'
 
-    os.system(cmd)
+    run_cmd(cmd)
 
     print(f'[INFO] ===== finished face tracking =====')
 
@@ -342,11 +397,102 @@ def save_transforms(base_dir, ori_imgs_dir):
     print(f'[INFO] ===== finished saving transforms =====')
 
 
+class StageCache:
+    # input fingerprint of every finished stage, stored in <base_dir>/process_cache.json.
+    # a stage is skipped when its inputs and params did not change since it last finished and its outputs still exist.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.stages = json.load(f)
+
+    @staticmethod
+    def fingerprint(inputs, params=None):
+        # name / size / mtime of every input file (glob patterns), plus the stage params
+        h = hashlib.sha1()
+        for pattern in inputs:
+            files = sorted(glob.glob(pattern))
+            if len(files) == 0:
+                h.update(f'{pattern}:missing;'.encode())
+            for file in files:
+                st = os.stat(file)
+                h.update(f'{os.path.basename(file)}:{st.st_size}:{st.st_mtime_ns};'.encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def done(self, name, key, outputs):
+        with self.lock:
+            record = self.stages.get(name)
+        return record is not None and record['key'] == key and all(len(glob.glob(p)) > 0 for p in outputs)
+
+    def finish(self, name, key, seconds, frames):
+        with self.lock:
+            self.stages[name] = {'key': key, 'seconds': seconds, 'frames': frames}
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.stages, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def run_stages(stages, tasks, cache, force=False):
+    # stages: {task: (name, deps, inputs, outputs, params, count_frames, func)}
+    # every task runs in its own thread as soon as its dependencies finished, so independent chains
+    # (audio / parsing + background + torso / landmarks + tracking) overlap.
+    futures = {}
+    report = {}
+
+    def run(task):
+        name, deps, inputs, outputs, params, count_frames, func = stages[task]
+        for dep in deps:
+            if dep in futures:
+                futures[dep].result() # raises if a dependency failed
+
+        key = StageCache.fingerprint(inputs, params)
+        if not force and cache.done(name, key, outputs):
+            print(f'[INFO] ===== skip {name}, inputs unchanged since last run =====')
+            report[task] = 'cached'
+            return
+
+        t = time.time()
+        func()
+        seconds = time.time() - t
+        frames = count_frames() if count_frames is not None else None
+        cache.finish(name, key, seconds, frames)
+        report[task] = (seconds, frames)
+
+    with ThreadPoolExecutor(len(tasks)) as pool:
+        for task in sorted(tasks):
+            futures[task] = pool.submit(run, task)
+
+    failed = []
+    print(f'[INFO] ===== stage summary =====')
+    for task in sorted(tasks):
+        name = stages[task][0]
+        error = futures[task].exception()
+        if error is not None:
+            failed.append(task)
+            print(f'[INFO] {task}. {name}: failed ({error})')
+        elif report[task] == 'cached':
+            print(f'[INFO] {task}. {name}: cached')
+        else:
+            seconds, frames = report[task]
+            speed = f', {frames} frames, {frames / max(seconds, 1e-6):.2f} frames/s' if frames else ''
+            print(f'[INFO] {task}. {name}: {seconds:.1f}s{speed}')
+
+    return failed
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('path', type=str, help="path to video file")
     parser.add_argument('--task', type=int, default=-1, help="-1 means all")
     parser.add_argument('--asr', type=str, default='wav2vec', help="wav2vec or deepspeech")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="processes for the per-frame stages (background, torso and gt)")
+    parser.add_argument('--chunk', type=int, default=16, help="frames per work unit sent to a worker")
+    parser.add_argument('--force', action='store_true', help="rerun stages even if their inputs did not change (a single --task always reruns)")
 
     opt = parser.parse_args()
 
@@ -363,40 +509,45 @@ if __name__ == '__main__':
     os.makedirs(gt_imgs_dir, exist_ok=True)
     os.makedirs(torso_imgs_dir, exist_ok=True)
 
-
-    # extract audio
-    if opt.task == -1 or opt.task == 1:
-        extract_audio(opt.path, wav_path)
-
-    # extract audio features
-    if opt.task == -1 or opt.task == 2:
-        extract_audio_features(wav_path, mode=opt.asr)
-
-    # extract images
-    if opt.task == -1 or opt.task == 3:
-        extract_images(opt.path, ori_imgs_dir)
-
-    # face parsing
-    if opt.task == -1 or opt.task == 4:
-        extract_semantics(ori_imgs_dir, parsing_dir)
-
-    # extract bg
-    if opt.task == -1 or opt.task == 5:
-        extract_background(base_dir, ori_imgs_dir)
-
-    # extract torso images and gt_images
-    if opt.task == -1 or opt.task == 6:
-        extract_torso_and_gt(base_dir, ori_imgs_dir)
-
-    # extract face landmarks
-    if opt.task == -1 or opt.task == 7:
-        extract_landmarks(ori_imgs_dir)
-
-    # face tracking
-    if opt.task == -1 or opt.task == 8:
-        face_tracking(ori_imgs_dir)
-
-    # save transforms.json
-    if opt.task == -1 or opt.task == 9:
-        save_transforms(base_dir, ori_imgs_dir)
-
+    ori_imgs = os.path.join(ori_imgs_dir, '*.jpg')
+    parsing_imgs = os.path.join(parsing_dir, '*.png')
+    count_frames = lambda: len(glob.glob(ori_imgs))
+
+    # task: (name, deps, inputs, outputs, params, count_frames, func)
+    stages = {
+        # extract audio
+        1: ('audio', [], [opt.path], [wav_path], None, None,
+            lambda: extract_audio(opt.path, wav_path)),
+        # extract audio features
+        2: ('audio_features', [1], [wav_path], [os.path.join(base_dir, 'aud*.npy')], {'asr': opt.asr}, None,
+            lambda: extract_audio_features(wav_path, mode=opt.asr)),
+        # extract images
+        3: ('images', [], [opt.path], [ori_imgs], None, count_frames,
+            lambda: extract_images(opt.path, ori_imgs_dir)),
+        # face parsing
+        4: ('semantics', [3], [ori_imgs], [parsing_imgs], None, count_frames,
+            lambda: extract_semantics(ori_imgs_dir, parsing_dir)),
+        # extract bg
+        5: ('background', [4], [ori_imgs, parsing_imgs], [os.path.join(base_dir, 'bc.jpg')], None, count_frames,
+            lambda: extract_background(base_dir, ori_imgs_dir, opt.workers, opt.chunk)),
+        # extract torso images and gt_images
+        6: ('torso_and_gt', [5], [ori_imgs, parsing_imgs, os.path.join(base_dir, 'bc.jpg')], [os.path.join(gt_imgs_dir, '*.jpg'), os.path.join(torso_imgs_dir, '*.png')], None, count_frames,
+            lambda: extract_torso_and_gt(base_dir, ori_imgs_dir, opt.workers, opt.chunk)),
+        # extract face landmarks
+        7: ('landmarks', [3], [ori_imgs], [os.path.join(ori_imgs_dir, '*.lms')], None, count_frames,
+            lambda: extract_landmarks(ori_imgs_dir)),
+        # face tracking
+        8: ('face_tracking', [7], [ori_imgs, os.path.join(ori_imgs_dir, '*.lms')], [os.path.join(base_dir, 'track_params.pt')], None, count_frames,
+            lambda: face_tracking(ori_imgs_dir)),
+        # save transforms.json
+        9: ('transforms', [8], [os.path.join(base_dir, 'track_params.pt')], [os.path.join(base_dir, 'transforms_*.json')], None, count_frames,
+            lambda: save_transforms(base_dir, ori_imgs_dir)),
+    }
+
+    tasks = list(stages.keys()) if opt.task == -1 else [opt.task]
+    cache = StageCache(os.path.join(base_dir, 'process_cache.json'))
+
+    failed = run_stages(stages, tasks, cache, force=opt.force or opt.task != -1)
+    if len(failed) > 0:
+        print(f'[ERROR] failed stages: {failed}, rerun to resume (finished stages and frames are skipped)')
+        exit(1)
@@ -6,10 +6,9 @@ from torch.autograd import Function
 from torch.autograd.function import once_differentiable
 from torch.cuda.amp import custom_bwd, custom_fwd 
 
-try:
-    import _freqencoder as _backend
-except ImportError:
-    from .backend import _backend
+from ..backends import load_backend
+
+_backend, _use_cuda = load_backend(__package__, '_freqencoder')
 
 
 class _freq_encoder(Function):
@@ -19,7 +18,7 @@ class _freq_encoder(Function):
         # inputs: [B, input_dim], float 
         # RETURN: [B, F], float
 
-        if not inputs.is_cuda: inputs = inputs.cuda()
+        if _use_cuda and not inputs.is_cuda: inputs = inputs.cuda()
         inputs = inputs.contiguous()
 
         B, input_dim = inputs.shape # batch size, coord dim
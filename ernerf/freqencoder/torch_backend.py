@@ -0,0 +1,22 @@
+''' Pure PyTorch implementation of the _freqencoder bindings (src/freqencoder.cu). '''
+import math
+
+import torch
+
+
+def freq_encode_forward(inputs, B, D, deg, C, outputs):
+    # outputs: [B, C], C = D + D * deg * 2, layout: x, sin(x), cos(x), sin(2x), cos(2x), ...
+    freqs = 2 ** torch.arange(deg, dtype=inputs.dtype, device=inputs.device) # [deg]
+    x = inputs[:, None, :] * freqs[:, None] # [B, deg, D]
+    sincos = torch.stack([torch.sin(x), torch.sin(x + math.pi / 2)], dim=2) # [B, deg, 2, D]
+    outputs[:, :D] = inputs
+    outputs[:, D:] = sincos.reshape(B, deg * 2 * D)
+
+
+def freq_encode_backward(grad, outputs, B, D, deg, C, grad_inputs):
+    # d/dx sin(2^f x) = 2^f cos(2^f x), d/dx cos(2^f x) = -2^f sin(2^f x)
+    freqs = 2 ** torch.arange(deg, dtype=grad.dtype, device=grad.device) # [deg]
+    g = grad[:, D:].reshape(B, deg, 2, D)
+    o = outputs[:, D:].reshape(B, deg, 2, D)
+    result = (g[:, :, 0] * o[:, :, 1] - g[:, :, 1] * o[:, :, 0]) * freqs[:, None]
+    grad_inputs.copy_(grad[:, :D] + result.sum(1))
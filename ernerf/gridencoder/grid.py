@@ -6,10 +6,9 @@ from torch.autograd import Function
 from torch.autograd.function import once_differentiable
 from torch.cuda.amp import custom_bwd, custom_fwd 
 
-try:
-    import _gridencoder as _backend
-except ImportError:
-    from .backend import _backend
+from ..backends import load_backend
+
+_backend, _use_cuda = load_backend(__package__, '_gridencoder')
 
 _gridtype_to_id = {
     'hash': 0,
@@ -0,0 +1,80 @@
+''' Pure PyTorch implementation of the _gridencoder bindings (src/gridencoder.cu).
+
+Same function names and arguments as the CUDA extension, outputs are written in-place.
+The backward recomputes the (vectorized) forward with autograd, which gives the same gradients
+as the hand written backward kernel. dy_dx is only consumed by grid_encode_backward, so the
+forward just zeros it.
+'''
+import numpy as np
+
+import torch
+
+PRIMES = [1, 2654435761, 805459861, 3674653429, 2097192037, 1434869437, 2165219737]
+
+
+def _grid_index(gridtype, align_corners, hashmap_size, resolution, pos_grid):
+    # pos_grid: int64, [B, D] --> int64 [B] row index into the level's embeddings
+    D = pos_grid.shape[-1]
+    stride = 1
+    index = torch.zeros_like(pos_grid[:, 0])
+    for d in range(D):
+        if stride > hashmap_size:
+            break
+        index = index + pos_grid[:, d] * stride
+        stride *= resolution if align_corners else (resolution + 1)
+
+    if gridtype == 0 and stride > hashmap_size:
+        index = torch.zeros_like(index)
+        for d in range(D):
+            index = index ^ ((pos_grid[:, d] * PRIMES[d]) & 0xFFFFFFFF)
+
+    return index % hashmap_size
+
+
+def _encode(inputs, embeddings, offsets, D, C, L, S, H, gridtype, align_corners):
+    ''' differentiable forward, returns [L, B, C] '''
+    B = inputs.shape[0]
+    offsets = [int(o) for o in offsets.tolist()]
+    oob = ((inputs < 0) | (inputs > 1)).any(-1) # out of bound inputs give 0
+    corners = torch.tensor([[(idx >> d) & 1 for d in range(D)] for idx in range(1 << D)], device=inputs.device) # [2^D, D]
+
+    outputs = []
+    for level in range(L):
+        hashmap_size = offsets[level + 1] - offsets[level]
+        scale = float(np.exp2(np.float32(level * S), dtype=np.float32) * np.float32(H) - np.float32(1))
+        resolution = int(np.ceil(scale)) + 1
+        grid = embeddings[offsets[level]:offsets[level + 1]]
+
+        pos = inputs * scale + (0.0 if align_corners else 0.5)
+        pos_grid = torch.floor(pos)
+        frac = pos - pos_grid
+        pos_grid = pos_grid.long().clamp(min=0)
+
+        results = 0
+        for corner in corners:
+            w = torch.where(corner.bool(), frac, 1 - frac).prod(-1) # [B]
+            index = _grid_index(gridtype, align_corners, hashmap_size, resolution, pos_grid + corner)
+            results = results + w[:, None] * grid[index].float()
+
+        outputs.append(torch.where(oob[:, None], torch.zeros_like(results), results))
+
+    return torch.stack(outputs, dim=0) if outputs else inputs.new_zeros(0, B, C)
+
+
+def grid_encode_forward(inputs, embeddings, offsets, outputs, B, D, C, L, S, H, dy_dx, gridtype, align_corners):
+    outputs.copy_(_encode(inputs, embeddings, offsets, D, C, L, S, H, gridtype, align_corners))
+    if dy_dx is not None:
+        dy_dx.zero_()
+
+
+def grid_encode_backward(grad, inputs, embeddings, offsets, grad_embeddings, B, D, C, L, S, H, dy_dx, grad_inputs, gridtype, align_corners):
+    with torch.enable_grad():
+        x = inputs.detach().requires_grad_(grad_inputs is not None)
+        emb = embeddings.detach().requires_grad_()
+        outputs = _encode(x, emb, offsets, D, C, L, S, H, gridtype, align_corners)
+        leaves = [emb, x] if grad_inputs is not None else [emb]
+        grads = torch.autograd.grad(outputs, leaves, grad.to(outputs.dtype), allow_unused=True)
+
+    grad_embeddings.copy_(grads[0])
+    if grad_inputs is not None:
+        grad_inputs.copy_(grads[1] if grads[1] is not None else torch.zeros_like(grad_inputs))
@@ -249,9 +249,9 @@ class NeRFNetwork(NeRFRenderer):
     def forward(self, x, d, enc_a, c, e=None):
         # x: [N, 3], in [-bound, bound]
         # d: [N, 3], nomalized in [-1, 1]
-        # enc_a: [1, aud_dim]
+        # enc_a: [1, aud_dim], or [N, aud_dim] per point when several frames are rendered together
         # c: [1, ind_dim], individual code
-        # e: [1, 1], eye feature
+        # e: [1, 1] or [N, 1], eye feature
         enc_x = self.encode_x(x, bound=self.bound)
 
         sigma_result = self.density(x, enc_a, e, enc_x)
@@ -282,7 +282,8 @@ class NeRFNetwork(NeRFRenderer):
         if enc_x is None:
             enc_x = self.encode_x(x, bound=self.bound)
 
-        enc_a = enc_a.repeat(enc_x.shape[0], 1)
+        if enc_a.shape[0] == 1:
+            enc_a = enc_a.repeat(enc_x.shape[0], 1)
         aud_ch_att = self.aud_ch_att_net(enc_x)
         enc_w = enc_a * aud_ch_att
 
@@ -81,6 +81,51 @@ def visualize_poses(poses, size=0.1):
     trimesh.Scene(objects).show()
 
 
+class PoseCache:
+    """
+    Per-pose cache for live streaming.
+
+    The test loader only cycles through a fixed set of head poses (replayed via mirror_index),
+    and everything collate derives from a pose (rays_d, the composited torso + bg image, eye area)
+    does not depend on the audio, so it is computed once per pose instead of at every frame.
+
+    Entries are stored as float16 on the render device. rays_o is not stored: it is the pose
+    translation broadcast over all rays, rebuilt as an expanded view on lookup.
+    The budget is in bytes; since the playback order is cyclic, an LRU would evict every entry
+    right before it is needed again, so the cache is admit-until-full (no eviction).
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _nbytes(entry):
+        return sum(t.numel() * t.element_size() for t in entry if t is not None)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return tuple(t.float() if t is not None else None for t in entry)
+
+    def put(self, key, rays_d, bg_color, eye):
+        entry = tuple(t.half() if t is not None else None for t in (rays_d, bg_color, eye))
+        size = self._nbytes(entry)
+        if self.used + size > self.budget:
+            return False
+        self.entries[key] = entry
+        self.used += size
+        return True
+
+    def stats(self):
+        return {'entries': len(self.entries), 'mb': self.used / 2**20, 'hits': self.hits, 'misses': self.misses}
+
+
 class NeRFDataset_Test:
     def __init__(self, opt, device, downscale=1):
         super().__init__()
@@ -272,6 +317,10 @@ class NeRFDataset_Test:
 
         # directly build the coordinate meshgrid in [-1, 1]^2
         self.bg_coords = get_bg_coords(self.H, self.W, self.device) # [1, H*W, 2] in [-1, 1]
+
+        # per-pose rays / bg / eye cache (live streaming replays the same poses), 0 to disable
+        cache_mb = getattr(self.opt, 'pose_cache_mb', 1024)
+        self.pose_cache = PoseCache(cache_mb * 2**20) if cache_mb > 0 else None
     
     def mirror_index(self, index):
         size = self.poses.shape[0]
@@ -284,8 +333,9 @@ class NeRFDataset_Test:
 
     def collate(self, index):
 
-        B = len(index) # a list of length 1
-        # assert B == 1
+        B = len(index) # a list of length 1, or consecutive frames for batched rendering
+        if B > 1:
+            return self.collate_frames(index)
 
         results = {}
 
@@ -298,19 +348,62 @@ class NeRFDataset_Test:
         index[0] = self.mirror_index(index[0])
 
         poses = self.poses[index].to(self.device) # [B, 4, 4]
-        
-        rays = get_rays(poses, self.intrinsics, self.H, self.W, self.num_rays, self.opt.patch_size)
+
+        # everything below only depends on the pose: look it up in the per-pose cache
+        cacheable = self.pose_cache is not None and B == 1 and self.num_rays <= 0 # random ray sampling is not cacheable
+        cached = self.pose_cache.get(index[0]) if cacheable else None
+        if cached is None:
+            rays_d, bg_img, eye = self.pose_data(index, poses)
+            if cacheable:
+                self.pose_cache.put(index[0], rays_d, bg_img, eye)
+        else:
+            rays_d, bg_img, eye = cached
 
         results['index'] = index # for ind. code
         results['H'] = self.H
         results['W'] = self.W
-        results['rays_o'] = rays['rays_o']
-        results['rays_d'] = rays['rays_d']
+        results['rays_o'] = poses[..., :3, 3][..., None, :].expand_as(rays_d) # [B, N, 3]
+        results['rays_d'] = rays_d
+        results['eye'] = eye
+        results['bg_color'] = bg_img
+
+        bg_coords = self.bg_coords # [1, N, 2]
+        results['bg_coords'] = bg_coords
+
+        # results['poses'] = convert_poses(poses) # [B, 6]
+        # results['poses_matrix'] = poses # [B, 4, 4]
+        results['poses'] = poses # [B, 4, 4]
+
+        return results
+
+    def collate_frames(self, index):
+        # several frames rendered together (NeRFRenderer.run_cuda with B > 1):
+        # collate each frame on its own (so the per-pose cache is used) and stack along the batch dim
+        frames = [self.collate([i]) for i in index]
+
+        results = {
+            'index': [frame['index'][0] for frame in frames],
+            'H': self.H,
+            'W': self.W,
+            'bg_coords': self.bg_coords, # [1, N, 2], shared by all frames
+        }
+        for key in ('rays_o', 'rays_d', 'bg_color', 'poses', 'eye'):
+            results[key] = None if frames[0][key] is None else torch.cat([frame[key] for frame in frames], dim=0)
+        if 'auds' in frames[0]:
+            results['auds'] = torch.stack([frame['auds'] for frame in frames], dim=0) # [B, ...]
+
+        return results
+
+    def pose_data(self, index, poses):
+        # rays_d, composited bg and eye area of the (mirrored) pose index
+        B = len(index)
+
+        rays = get_rays(poses, self.intrinsics, self.H, self.W, self.num_rays, self.opt.patch_size)
 
         if self.opt.exp_eye:
-            results['eye'] = self.eye_area[index].to(self.device) # [1]
+            eye = self.eye_area[index].to(self.device) # [1]
         else:
-            results['eye'] = None
+            eye = None
         
         # load bg
         if self.opt.torso_imgs!='':
@@ -329,16 +422,7 @@ class NeRFDataset_Test:
         else:
             bg_img = self.bg_img.view(1, -1, 3).repeat(B, 1, 1).to(self.device)
 
-        results['bg_color'] = bg_img
-
-        bg_coords = self.bg_coords # [1, N, 2]
-        results['bg_coords'] = bg_coords
-
-        # results['poses'] = convert_poses(poses) # [B, 6]
-        # results['poses_matrix'] = poses # [B, 4, 4]
-        results['poses'] = poses # [B, 4, 4]
-
-        return results
+        return rays['rays_d'], bg_img, eye
 
     def dataloader(self):
 
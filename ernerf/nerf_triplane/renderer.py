@@ -2,6 +2,7 @@ import math
 import trimesh
 import numpy as np
 import random
+from collections import OrderedDict
 
 import torch
 import torch.nn as nn
@@ -59,6 +60,64 @@ def plot_pointcloud(pc, color=None):
     trimesh.Scene([pc, axes, sphere]).show()
 
 
+class RenderCache:
+    """
+    LRU cache of rendered frames for live inference.
+
+    With a fixed test pose sequence, a frame is fully determined by the (mirrored) pose index,
+    the smoothed audio feature enc_a and the eye area. During silence / idle the audio window is
+    all zeros, so enc_a (after smooth_lips decay) converges to a constant and the same frames
+    are rendered again every pose cycle. The key quantizes enc_a (step `aud_step`) and the eye
+    area (step `eye_step`) so these frames are looked up instead of ray marched.
+
+    Entries (image + depth) are stored as float16 on the render device, the budget is in bytes.
+    """
+    def __init__(self, budget, aud_step=1e-2, eye_step=1e-2):
+        self.budget = budget
+        self.aud_step = aud_step
+        self.eye_step = eye_step
+        self.used = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, index, enc_a, eye=None):
+        aud = torch.round(enc_a.detach().float() / self.aud_step).to(torch.int32).cpu().numpy()
+        eye_bucket = None if eye is None else tuple(torch.round(eye.detach().float() / self.eye_step).to(torch.int32).view(-1).tolist())
+        return (int(index[0]) if isinstance(index, (list, tuple)) else int(index), aud.tobytes(), eye_bucket)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        image, depth = entry
+        return image.float(), depth.float()
+
+    def put(self, key, image, depth):
+        entry = (image.detach().half(), depth.detach().half())
+        size = sum(t.numel() * t.element_size() for t in entry)
+        if size > self.budget:
+            return False
+        if key in self.entries:
+            self.used -= sum(t.numel() * t.element_size() for t in self.entries.pop(key))
+        while self.used + size > self.budget:
+            _, old = self.entries.popitem(last=False)
+            self.used -= sum(t.numel() * t.element_size() for t in old)
+            self.evictions += 1
+        self.entries[key] = entry
+        self.used += size
+        return True
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'mb': self.used / 2**20, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hits / total if total > 0 else 0}
+
+
 class NeRFRenderer(nn.Module):
     def __init__(self, opt):
 
@@ -131,6 +190,13 @@ class NeRFRenderer(nn.Module):
         # decay for enc_a
         if self.smooth_lips:
             self.enc_a = None
+
+        # rendered frames of repeated (pose, audio, eye) at inference
+        render_cache_mb = getattr(opt, 'render_cache_mb', 0)
+        if render_cache_mb > 0:
+            self.render_cache = RenderCache(render_cache_mb * 2**20, getattr(opt, 'render_cache_aud_step', 1e-2), getattr(opt, 'render_cache_eye_step', 1e-2))
+        else:
+            self.render_cache = None
     
     def forward(self, x, d):
         raise NotImplementedError()
@@ -161,6 +227,10 @@ class NeRFRenderer(nn.Module):
         # index: [B]
         # return: image: [B, N, 3], depth: [B, N]
 
+        # several consecutive frames at inference (NeRFDataset_Test.collate_frames)
+        if rays_o.shape[0] > 1 and not self.training:
+            return self.run_cuda_frames(rays_o, rays_d, auds, bg_coords, poses, eye=eye, index=index, dt_gamma=dt_gamma, bg_color=bg_color, perturb=perturb, max_steps=max_steps, T_thresh=T_thresh)
+
         prefix = rays_o.shape[:-1]
         rays_o = rays_o.contiguous().view(-1, 3)
         rays_d = rays_d.contiguous().view(-1, 3)
@@ -193,6 +263,17 @@ class NeRFRenderer(nn.Module):
                 enc_a = _lambda * self.enc_a + (1 - _lambda) * enc_a
             self.enc_a = enc_a
 
+        # a full frame with the same pose, audio and eye was rendered before
+        cache_key = None
+        if self.render_cache is not None and not self.training and not perturb and enc_a is not None and rays_o.shape[0] == bg_coords.shape[0]:
+            cache_key = self.render_cache.key(index, enc_a, eye)
+            cached = self.render_cache.get(cache_key)
+            if cached is not None:
+                image, depth = cached
+                results['image'] = image.view(*prefix, 3)
+                results['depth'] = depth.view(*prefix)
+                return results
+
         
         if self.individual_dim > 0:
             if self.training:
@@ -288,9 +369,118 @@ class NeRFRenderer(nn.Module):
         results['ambient_eye'] = amb_eye_sum
         results['uncertainty'] = uncertainty_sum
 
+        if cache_key is not None:
+            self.render_cache.put(cache_key, image, depth)
+
         return results
     
 
+    def run_cuda_frames(self, rays_o, rays_d, auds, bg_coords, poses, eye=None, index=0, dt_gamma=0, bg_color=None, perturb=False, max_steps=1024, T_thresh=1e-4, **kwargs):
+        # inference only: the rays of B frames are marched as one ray set, each sample looks up its frame's audio / eye.
+        # rays_o, rays_d: [B, N, 3]
+        # auds: [B, 1/8, 29, 16], per frame audio features
+        # bg_coords: [1, N, 2], shared by all frames
+        # poses: [B, 4, 4]
+        # eye: [B, 1]
+        # index: list of B (mirrored) pose indices
+        # bg_color: [B, N, 3]
+        # return: image: [B, N, 3], depth: [B, N]
+
+        B, N = rays_o.shape[:2]
+        bg_coords = bg_coords.contiguous().view(-1, 2)
+        device = rays_o.device
+
+        # encode audio frame by frame, lips are smoothed in the same order as rendering the frames one by one
+        enc_a = []
+        for b in range(B):
+            enc = self.encode_audio(None if auds is None else auds[b]) # [1, 64]
+            if enc is not None and self.smooth_lips:
+                if self.enc_a is not None:
+                    _lambda = 0.35
+                    enc = _lambda * self.enc_a + (1 - _lambda) * enc
+                self.enc_a = enc
+            enc_a.append(enc)
+        enc_a = None if enc_a[0] is None else torch.cat(enc_a, dim=0) # [B, 64]
+
+        images = [None] * B
+        depths = [None] * B
+        cache_keys = [None] * B
+        if self.render_cache is not None and not perturb and enc_a is not None:
+            for b in range(B):
+                cache_keys[b] = self.render_cache.key(index[b], enc_a[b:b+1], None if eye is None else eye[b:b+1])
+                cached = self.render_cache.get(cache_keys[b])
+                if cached is not None:
+                    images[b], depths[b] = cached
+
+        # only march the frames missing from the cache
+        frames = [b for b in range(B) if images[b] is None]
+
+        if len(frames) > 0:
+            rays_o_f = rays_o[frames].contiguous().view(-1, 3)
+            rays_d_f = rays_d[frames].contiguous().view(-1, 3)
+            enc_a_f = None if enc_a is None else enc_a[frames]
+            eye_f = None if eye is None else eye[frames]
+            ind_code = self.individual_codes[0] if self.individual_dim > 0 else None
+
+            M = rays_o_f.shape[0] # len(frames) * N
+
+            nears, fars = raymarching.near_far_from_aabb(rays_o_f, rays_d_f, self.aabb_infer, self.min_near)
+
+            dtype = torch.float32
+
+            weights_sum = torch.zeros(M, dtype=dtype, device=device)
+            depth = torch.zeros(M, dtype=dtype, device=device)
+            image = torch.zeros(M, 3, dtype=dtype, device=device)
+            amb_aud_sum = torch.zeros(M, dtype=dtype, device=device)
+            amb_eye_sum = torch.zeros(M, dtype=dtype, device=device)
+            uncertainty_sum = torch.zeros(M, dtype=dtype, device=device)
+
+            rays_alive = torch.arange(M, dtype=torch.int32, device=device) # [M]
+            rays_t = nears.clone() # [M]
+
+            step = 0
+
+            while step < max_steps:
+
+                n_alive = rays_alive.shape[0]
+
+                if n_alive <= 0:
+                    break
+
+                n_step = max(min(M // n_alive, 8), 1)
+
+                xyzs, dirs, deltas = raymarching.march_rays(n_alive, n_step, rays_alive, rays_t, rays_o_f, rays_d_f, self.bound, self.density_bitfield, self.cascade, self.grid_size, nears, fars, 128, perturb if step == 0 else False, dt_gamma, max_steps)
+
+                # samples are laid out [n_alive, n_step], the frame of a ray is its index // N
+                frame_ids = (rays_alive.long() // N).repeat_interleave(n_step)
+
+                sigmas, rgbs, ambients_aud, ambients_eye, uncertainties = self(xyzs, dirs, None if enc_a_f is None else enc_a_f[frame_ids], ind_code, None if eye_f is None else eye_f[frame_ids])
+                sigmas = self.density_scale * sigmas
+
+                raymarching.composite_rays_triplane(n_alive, n_step, rays_alive, rays_t, sigmas, rgbs, deltas, ambients_aud, ambients_eye, uncertainties, weights_sum, depth, image, amb_aud_sum, amb_eye_sum, uncertainty_sum, T_thresh)
+
+                rays_alive = rays_alive[rays_alive >= 0]
+
+                step += n_step
+
+            # torso and background depend on the pose, composite frame by frame
+            for i, b in enumerate(frames):
+                rays = slice(i * N, (i + 1) * N)
+                torso_results = self.run_torso(rays_o_f[rays], bg_coords, poses[b:b+1], index[b], None if bg_color is None else bg_color[b])
+                frame_image = image[rays] + (1 - weights_sum[rays]).unsqueeze(-1) * torso_results['bg_color']
+                images[b] = frame_image.view(N, 3).clamp(0, 1)
+                depths[b] = torch.clamp(depth[rays] - nears[rays], min=0) / (fars[rays] - nears[rays])
+
+                if cache_keys[b] is not None:
+                    self.render_cache.put(cache_keys[b], images[b], depths[b])
+
+        results = {}
+        results['image'] = torch.stack([image.view(N, 3) for image in images], dim=0)
+        results['depth'] = torch.stack([depth.view(N) for depth in depths], dim=0)
+
+        return results
+
+
     def run_torso(self, rays_o, bg_coords, poses, index=0, bg_color=None, **kwargs):
         # rays_o, rays_d: [B, N, 3], assumes B == 1
         # auds: [B, 16]
@@ -919,7 +919,7 @@ class Trainer(object):
 
         # allow using a fixed eye area (avoid eye blink) at test
         if self.opt.exp_eye and self.opt.fix_eye >= 0:
-            eye = torch.FloatTensor([self.opt.fix_eye]).view(1, 1).to(self.device)
+            eye = torch.FloatTensor([self.opt.fix_eye]).view(1, 1).expand(rays_o.shape[0], 1).to(self.device)
         else:
             eye = data['eye'] # [B, 1]
 
@@ -1170,6 +1170,32 @@ class Trainer(object):
 
     # [GUI] test with provided data
     def test_gui_with_data(self, data, W, H):
+
+        preds, preds_depth = self.test_gui_preds(data, W, H)
+
+        pred = preds[0].detach().cpu().numpy()
+        pred_depth = preds_depth[0].detach().cpu().numpy()
+
+        outputs = {
+            'image': pred,
+            'depth': pred_depth,
+        }
+
+        return outputs
+
+    # several consecutive frames collated together (NeRFDataset_Test.collate_frames), rendered in one ray march
+    def test_gui_with_batch(self, data, W, H):
+
+        preds, preds_depth = self.test_gui_preds(data, W, H)
+
+        outputs = {
+            'image': preds.detach().cpu().numpy(), # [B, H, W, 3]
+            'depth': preds_depth.detach().cpu().numpy(), # [B, H, W]
+        }
+
+        return outputs
+
+    def test_gui_preds(self, data, W, H):
         
         self.model.eval()
 
@@ -1193,15 +1219,7 @@ class Trainer(object):
         preds = F.interpolate(preds.permute(0, 3, 1, 2), size=(H, W), mode='bilinear').permute(0, 2, 3, 1).contiguous()
         preds_depth = F.interpolate(preds_depth.unsqueeze(1), size=(H, W), mode='nearest').squeeze(1)
 
-        pred = preds[0].detach().cpu().numpy()
-        pred_depth = preds_depth[0].detach().cpu().numpy()
-
-        outputs = {
-            'image': pred,
-            'depth': pred_depth,
-        }
-
-        return outputs
+        return preds, preds_depth
 
     def train_one_epoch(self, loader):
         self.log(f"==> Start Training Epoch {self.epoch}, lr={self.optimizer.param_groups[0]['lr']:.6f} ...")
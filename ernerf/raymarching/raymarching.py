@@ -6,10 +6,9 @@ import torch.nn as nn
 from torch.autograd import Function
 from torch.cuda.amp import custom_bwd, custom_fwd
 
-try:
-    import _raymarching_face as _backend
-except ImportError:
-    from .backend import _backend
+from ..backends import load_backend
+
+_backend, _use_cuda = load_backend(__package__, '_raymarching_face')
 
 # ----------------------------------------
 # utils
@@ -30,8 +29,8 @@ class _near_far_from_aabb(Function):
             nears: float, [N]
             fars: float, [N]
         '''
-        if not rays_o.is_cuda: rays_o = rays_o.cuda()
-        if not rays_d.is_cuda: rays_d = rays_d.cuda()
+        if _use_cuda and not rays_o.is_cuda: rays_o = rays_o.cuda()
+        if _use_cuda and not rays_d.is_cuda: rays_d = rays_d.cuda()
 
         rays_o = rays_o.contiguous().view(-1, 3)
         rays_d = rays_d.contiguous().view(-1, 3)
@@ -62,8 +61,8 @@ class _sph_from_ray(Function):
         Return:
             coords: [N, 2], in [-1, 1], theta and phi on a sphere. (further-surface)
         '''
-        if not rays_o.is_cuda: rays_o = rays_o.cuda()
-        if not rays_d.is_cuda: rays_d = rays_d.cuda()
+        if _use_cuda and not rays_o.is_cuda: rays_o = rays_o.cuda()
+        if _use_cuda and not rays_d.is_cuda: rays_d = rays_d.cuda()
 
         rays_o = rays_o.contiguous().view(-1, 3)
         rays_d = rays_d.contiguous().view(-1, 3)
@@ -90,7 +89,7 @@ class _morton3D(Function):
             indices: [N], int32, in [0, 128^3)
             
         '''
-        if not coords.is_cuda: coords = coords.cuda()
+        if _use_cuda and not coords.is_cuda: coords = coords.cuda()
         
         N = coords.shape[0]
 
@@ -112,7 +111,7 @@ class _morton3D_invert(Function):
             coords: [N, 3], int32, in [0, 128)
             
         '''
-        if not indices.is_cuda: indices = indices.cuda()
+        if _use_cuda and not indices.is_cuda: indices = indices.cuda()
         
         N = indices.shape[0]
 
@@ -137,7 +136,7 @@ class _packbits(Function):
         Returns:
             bitfield: uint8, [C, H * H * H / 8]
         '''
-        if not grid.is_cuda: grid = grid.cuda()
+        if _use_cuda and not grid.is_cuda: grid = grid.cuda()
         grid = grid.contiguous()
 
         C = grid.shape[0]
@@ -165,7 +164,7 @@ class _morton3D_dilation(Function):
         Returns:
             grid_dilate: float, [C, H * H * H], assume H % 2 == 0bitfield: uint8, [C, H * H * H / 8]
         '''
-        if not grid.is_cuda: grid = grid.cuda()
+        if _use_cuda and not grid.is_cuda: grid = grid.cuda()
         grid = grid.contiguous()
 
         C = grid.shape[0]
@@ -209,9 +208,9 @@ class _march_rays_train(Function):
             rays: int32, [N, 3], all rays' (index, point_offset, point_count), e.g., xyzs[rays[i, 1]:rays[i, 1] + rays[i, 2]] --> points belonging to rays[i, 0]
         '''
 
-        if not rays_o.is_cuda: rays_o = rays_o.cuda()
-        if not rays_d.is_cuda: rays_d = rays_d.cuda()
-        if not density_bitfield.is_cuda: density_bitfield = density_bitfield.cuda()
+        if _use_cuda and not rays_o.is_cuda: rays_o = rays_o.cuda()
+        if _use_cuda and not rays_d.is_cuda: rays_d = rays_d.cuda()
+        if _use_cuda and not density_bitfield.is_cuda: density_bitfield = density_bitfield.cuda()
         
         rays_o = rays_o.contiguous().view(-1, 3)
         rays_d = rays_d.contiguous().view(-1, 3)
@@ -370,8 +369,8 @@ class _march_rays(Function):
             deltas: float, [n_alive * n_step, 2], all generated points' deltas (here we record two deltas, the first is for RGB, the second for depth).
         '''
         
-        if not rays_o.is_cuda: rays_o = rays_o.cuda()
-        if not rays_d.is_cuda: rays_d = rays_d.cuda()
+        if _use_cuda and not rays_o.is_cuda: rays_o = rays_o.cuda()
+        if _use_cuda and not rays_d.is_cuda: rays_d = rays_d.cuda()
         
         rays_o = rays_o.contiguous().view(-1, 3)
         rays_d = rays_d.contiguous().view(-1, 3)
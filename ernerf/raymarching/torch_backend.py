@@ -0,0 +1,458 @@
+''' Pure PyTorch implementation of the _raymarching_face bindings (src/raymarching.cu).
+
+Same function names and arguments as the CUDA extension, outputs are written in-place into the
+tensors passed by raymarching.py. Per-ray loops of the kernels become batched tensor ops over all
+rays that are still marching; the composite backward passes recompute the forward with autograd
+(the CUDA backward kernels compute the exact gradient of the same forward).
+
+Differences to the CUDA version:
+    - march_rays_train assigns rays' point offsets in ray order instead of atomicAdd order
+      (the layout is still described by `rays`, consumers do not depend on the order).
+    - composite_rays_train_* accumulate transmittance as exp(-cumsum(sigma * delta)) in float64
+      instead of a running float32 product, so results match up to float rounding.
+'''
+import numpy as np
+
+import torch
+
+SQRT3 = 1.7320508075688772
+RPI = 0.3183098861837907
+
+
+# ----------------------------------------
+# morton code
+# ----------------------------------------
+
+def _expand_bits(v):
+    v = (v * 0x00010001) & 0xFF0000FF
+    v = (v * 0x00000101) & 0x0F00F00F
+    v = (v * 0x00000011) & 0xC30C30C3
+    v = (v * 0x00000005) & 0x49249249
+    return v
+
+
+def _morton3D(x, y, z):
+    # x, y, z: int64 tensors in [0, 1024)
+    return _expand_bits(x) | (_expand_bits(y) << 1) | (_expand_bits(z) << 2)
+
+
+def _morton3D_invert(x):
+    x = x & 0x49249249
+    x = (x | (x >> 2)) & 0xc30c30c3
+    x = (x | (x >> 4)) & 0x0f00f00f
+    x = (x | (x >> 8)) & 0xff0000ff
+    x = (x | (x >> 16)) & 0x0000ffff
+    return x
+
+
+# ----------------------------------------
+# utils
+# ----------------------------------------
+
+def near_far_from_aabb(rays_o, rays_d, aabb, N, min_near, nears, fars):
+    o = rays_o.view(-1, 3).float()
+    rd = 1 / rays_d.view(-1, 3).float()
+    aabb = aabb.to(o)
+
+    t0 = (aabb[:3] - o) * rd
+    t1 = (aabb[3:] - o) * rd
+    # same comparisons as the kernel (keeps its behaviour for nan / inf components)
+    tmin = torch.where(t0 > t1, t1, t0)
+    tmax = torch.where(t0 > t1, t0, t1)
+
+    near, far = tmin[:, 0], tmax[:, 0]
+    miss = torch.zeros_like(near, dtype=torch.bool)
+    for d in (1, 2):
+        miss = miss | (near > tmax[:, d]) | (tmin[:, d] > far)
+        near = torch.where(tmin[:, d] > near, tmin[:, d], near)
+        far = torch.where(tmax[:, d] < far, tmax[:, d], far)
+
+    near = torch.where(near < min_near, torch.full_like(near, min_near), near)
+    big = torch.finfo(nears.dtype).max
+    nears.copy_(torch.where(miss, torch.full_like(near, big), near))
+    fars.copy_(torch.where(miss, torch.full_like(far, big), far))
+
+
+def sph_from_ray(rays_o, rays_d, radius, N, coords):
+    o = rays_o.view(-1, 3).float()
+    d = rays_d.view(-1, 3).float()
+
+    A = (d * d).sum(-1)
+    B = (o * d).sum(-1)
+    C = (o * o).sum(-1) - radius * radius
+    t = (- B + torch.sqrt(B * B - A * C)) / A
+
+    p = o + t[:, None] * d
+    x, y, z = p.unbind(-1)
+    theta = torch.atan2(torch.sqrt(x * x + z * z), y)
+    phi = torch.atan2(z, x)
+
+    coords[:, 0] = 2 * theta * RPI - 1
+    coords[:, 1] = phi * RPI
+
+
+def morton3D(coords, N, indices):
+    c = coords.long()
+    indices.copy_(_morton3D(c[:, 0], c[:, 1], c[:, 2]))
+
+
+def morton3D_invert(indices, N, coords):
+    ind = indices.long()
+    coords.copy_(torch.stack([_morton3D_invert(ind >> 0), _morton3D_invert(ind >> 1), _morton3D_invert(ind >> 2)], dim=-1))
+
+
+def packbits(grid, N, density_thresh, bitfield):
+    bits = (grid.reshape(-1, 8)[:N] > density_thresh).to(torch.uint8)
+    weights = (1 << torch.arange(8, device=grid.device)).to(torch.uint8)
+    bitfield[:N] = (bits * weights).sum(-1).to(torch.uint8)
+
+
+def morton3D_dilation(grid, C, H, grid_dilation):
+    # morton order --> dense [C, H, H, H], 6-neighbour max pool, --> morton order
+    device = grid.device
+    r = torch.arange(H, device=device)
+    x, y, z = torch.meshgrid(r, r, r, indexing='ij')
+    order = _morton3D(x.reshape(-1), y.reshape(-1), z.reshape(-1)) # dense (x, y, z) --> morton index
+
+    dense = grid.view(C, -1)[:, order].view(C, H, H, H)
+    padded = torch.nn.functional.pad(dense, (1, 1, 1, 1, 1, 1), value=float('-inf'))
+    res = dense.clone()
+    for dim in (1, 2, 3):
+        res = torch.maximum(res, padded.narrow(dim, 0, H).narrow(dim % 3 + 1, 1, H).narrow((dim + 1) % 3 + 1, 1, H))
+        res = torch.maximum(res, padded.narrow(dim, 2, H).narrow(dim % 3 + 1, 1, H).narrow((dim + 1) % 3 + 1, 1, H))
+
+    out = grid_dilation.view(C, -1)
+    out[:, order] = res.reshape(C, -1)
+
+
+# ----------------------------------------
+# ray marching (shared by train / infer)
+# ----------------------------------------
+
+def _f32(x):
+    return float(np.float32(x))
+
+
+def _step_sizes(C, H, max_steps):
+    dt_max = _f32(2 * SQRT3 * (1 << (C - 1)) / H)
+    dt_min = min(dt_max, _f32(2 * SQRT3 / max_steps))
+    return dt_min, dt_max
+
+
+def _mip_level(v, C):
+    # frexp exponent: [0, 0.5) --> <= -1, [0.5, 1) --> 0, [1, 2) --> 1, ...
+    _, exponent = torch.frexp(v)
+    return exponent.clamp(0, C - 1)
+
+
+def _march(o, d, t, far, limit, bound, dt_gamma, dt_min, dt_max, C, H, grid):
+    ''' march all rays at once until t >= far or `limit` occupied points were taken
+    Args:
+        o, d: float, [R, 3]; t, far: float, [R]; limit: int, [R]
+    Returns:
+        ray ids [P], step ids [P], xyzs [P, 3], dirs [P, 3], deltas [P, 2], in marching order
+    '''
+    R = o.shape[0]
+    device = o.device
+    H3 = H * H * H
+    rH = _f32(1 / H)
+
+    t = t.clone()
+    steps = torch.zeros(R, dtype=torch.long, device=device)
+    sign = torch.copysign(torch.ones_like(d), d)
+    rd = 1 / d
+
+    out_ids, out_steps, out_xyzs, out_dt, out_t = [], [], [], [], []
+
+    alive = torch.nonzero((t < far) & (steps < limit)).squeeze(-1)
+    while alive.numel() > 0:
+        ta = t[alive]
+        xyz = torch.clamp(o[alive] + ta[:, None] * d[alive], -bound, bound)
+        dt = torch.clamp(ta * dt_gamma, dt_min, dt_max)
+
+        # mip level, by position and by step size
+        level = torch.maximum(_mip_level(xyz.abs().amax(-1), C), _mip_level(dt * H * 0.5, C))
+        mip_bound = torch.clamp(torch.exp2(level.float()), max=bound)
+
+        # nearest grid cell (x * mip_rbound + 1 in float, the rest in double as in the kernel)
+        n = (0.5 * (xyz * (1 / mip_bound)[:, None] + 1).double() * H).clamp(0, H - 1).long()
+        index = level.long() * H3 + _morton3D(n[:, 0], n[:, 1], n[:, 2])
+        occ = ((grid[index // 8].long() >> (index % 8)) & 1).bool()
+
+        # occupied: take a small step and record the point
+        if occ.any():
+            ids = alive[occ]
+            t_new = ta[occ] + dt[occ]
+            out_ids.append(ids)
+            out_steps.append(steps[ids])
+            out_xyzs.append(xyz[occ])
+            out_dt.append(dt[occ])
+            out_t.append(t_new)
+            t[ids] = t_new
+            steps[ids] += 1
+
+        # empty: skip to the next voxel
+        empty = ~occ
+        if empty.any():
+            ids = alive[empty]
+            mb = mip_bound[empty][:, None]
+            tn = (((n[empty].float() + 0.5 + 0.5 * sign[ids]) * rH * 2 - 1) * mb - xyz[empty]) * rd[ids]
+            # fminf / fmaxf ignore nan (0 * inf for axis aligned rays)
+            tn = torch.where(torch.isnan(tn), torch.full_like(tn, float('inf')), tn).amin(-1)
+            tn = torch.where(torch.isinf(tn), torch.zeros_like(tn), tn)
+            tt = ta[empty] + torch.clamp(tn, min=0)
+            te = ta[empty]
+            moving = torch.ones_like(te, dtype=torch.bool)
+            while moving.any(): # do { t += dt } while (t < tt)
+                te = torch.where(moving, te + torch.clamp(te * dt_gamma, dt_min, dt_max), te)
+                moving = te < tt
+            t[ids] = te
+
+        alive = alive[(t[alive] < far[alive]) & (steps[alive] < limit[alive])]
+
+    if not out_ids:
+        empty_f = torch.zeros(0, dtype=o.dtype, device=device)
+        empty_l = torch.zeros(0, dtype=torch.long, device=device)
+        return empty_l, empty_l, empty_f.view(0, 3), empty_f.view(0, 3), empty_f.view(0, 2)
+
+    ids = torch.cat(out_ids)
+    step_ids = torch.cat(out_steps)
+    xyzs = torch.cat(out_xyzs)
+    deltas = torch.stack([torch.cat(out_dt), torch.cat(out_t)], dim=-1)
+    return ids, step_ids, xyzs, d[ids], deltas
+
+
+# ----------------------------------------
+# train functions
+# ----------------------------------------
+
+def march_rays_train(rays_o, rays_d, grid, bound, dt_gamma, max_steps, N, C, H, M, nears, fars, xyzs, dirs, deltas, rays, counter, noises):
+    o = rays_o.view(-1, 3).float()
+    d = rays_d.view(-1, 3).float()
+    dt_min, dt_max = _step_sizes(C, H, max_steps)
+
+    t0 = nears.float() + torch.clamp(nears.float() * dt_gamma, dt_min, dt_max) * noises.float()
+    limit = torch.full((N,), max_steps, dtype=torch.long, device=o.device)
+    ids, step_ids, p_xyzs, p_dirs, p_deltas = _march(o, d, t0, fars.float(), limit, bound, dt_gamma, dt_min, dt_max, C, H, grid)
+
+    # per ray point count and offset (ray order)
+    num_steps = torch.bincount(ids, minlength=N)
+    point_base = int(counter[0].item())
+    ray_base = int(counter[1].item())
+    offsets = point_base + torch.cumsum(num_steps, 0) - num_steps
+
+    ray_ids = torch.arange(N, device=o.device)
+    rays[ray_base:ray_base + N] = torch.stack([ray_ids, offsets, num_steps], dim=-1).to(rays.dtype)
+    counter[0] += int(num_steps.sum().item())
+    counter[1] += N
+
+    # rays whose points exceed M are not written (same as the kernel)
+    fits = (offsets[ids] + num_steps[ids]) <= M
+    pos = (offsets[ids] + step_ids)[fits]
+    xyzs[pos] = p_xyzs[fits].to(xyzs.dtype)
+    dirs[pos] = p_dirs[fits].to(dirs.dtype)
+    deltas[pos] = p_deltas[fits].to(deltas.dtype)
+
+
+def march_rays_train_backward(grad_xyzs, grad_dirs, rays, deltas, N, M, grad_rays_o, grad_rays_d):
+    index, offset, num_steps = rays.long().unbind(-1)
+    valid = (num_steps > 0) & (offset + num_steps <= M)
+    counts = num_steps[valid]
+    if counts.numel() == 0:
+        return
+    seg = torch.repeat_interleave(torch.arange(N, device=rays.device)[valid], counts)
+    start = torch.repeat_interleave(offset[valid], counts)
+    local = torch.arange(seg.numel(), device=rays.device) - torch.repeat_interleave(torch.cumsum(counts, 0) - counts, counts)
+    p = start + local
+
+    # the kernel writes the grads of rays[n] into grad_rays_*[n]
+    grad_rays_o.index_add_(0, seg, grad_xyzs[p].to(grad_rays_o.dtype))
+    grad_rays_d.index_add_(0, seg, (grad_xyzs[p] * deltas[p, 1:2] + grad_dirs[p]).to(grad_rays_d.dtype))
+
+
+def _composite_train(sigmas, rgbs, deltas, rays, M, T_thresh, plain=(), weighted=()):
+    ''' differentiable forward of composite_rays_train_*
+    Args:
+        plain: [M] values summed over the kept points, weighted: [M] values summed with the point weights
+    Returns:
+        weights_sum [N], depth [N], image [N, 3], [plain sums], [weighted sums]
+    '''
+    N = rays.shape[0]
+    device = sigmas.device
+    index, offset, num_steps = rays.long().unbind(-1)
+
+    valid = (num_steps > 0) & (offset + num_steps <= M)
+    counts = num_steps[valid]
+    seg = torch.repeat_interleave(index[valid], counts) # output slot of each point
+    first = torch.cumsum(counts, 0) - counts
+    local = torch.arange(seg.numel(), device=device) - torch.repeat_interleave(first, counts)
+    p = torch.repeat_interleave(offset[valid], counts) + local
+
+    sd = sigmas[p].double() * deltas[p, 0].double()
+    csum = torch.cumsum(sd, 0)
+    excl = csum - sd
+    excl = excl - torch.repeat_interleave(excl[first], counts) if counts.numel() > 0 else excl
+    T = torch.exp(-excl) # transmittance before each point
+    alpha = 1 - torch.exp(-sd)
+    keep = (T >= T_thresh).double() # the kernel stops after the point where T drops below T_thresh
+    w = alpha * T * keep
+
+    def seg_sum(v):
+        out = torch.zeros((N,) + v.shape[1:], dtype=torch.float64, device=device)
+        return out.index_add(0, seg, v)
+
+    dtype = sigmas.dtype
+    weights_sum = seg_sum(w).to(dtype)
+    depth = seg_sum(w * deltas[p, 1].double()).to(dtype)
+    image = seg_sum(w[:, None] * rgbs[p].double()).to(dtype)
+    plain_sums = [seg_sum(v[p].double() * keep).to(dtype) for v in plain]
+    weighted_sums = [seg_sum(v[p].double() * w).to(dtype) for v in weighted]
+    return weights_sum, depth, image, plain_sums, weighted_sums
+
+
+def _composite_train_backward(inputs, n_plain, n_weighted, deltas, rays, M, T_thresh, grad_outputs, grad_inputs):
+    ''' inputs: [sigmas, rgbs, *plain, *weighted]; grad_outputs: [weights_sum, image, *plain, *weighted] '''
+    with torch.enable_grad():
+        leaves = [x.detach().requires_grad_() for x in inputs]
+        ws, _, image, plain_sums, weighted_sums = _composite_train(
+            leaves[0], leaves[1], deltas, rays, M, T_thresh, leaves[2:2 + n_plain], leaves[2 + n_plain:2 + n_plain + n_weighted])
+        outputs = [ws, image] + plain_sums + weighted_sums
+        grads = torch.autograd.grad(outputs, leaves, grad_outputs, allow_unused=True)
+    for g, out in zip(grads, grad_inputs):
+        if g is None:
+            out.zero_()
+        else:
+            out.copy_(g)
+
+
+def composite_rays_train_forward(sigmas, rgbs, ambient, deltas, rays, M, N, T_thresh, weights_sum, ambient_sum, depth, image):
+    ws, d, img, (amb,), _ = _composite_train(sigmas, rgbs, deltas, rays, M, T_thresh, plain=(ambient,))
+    weights_sum.copy_(ws); ambient_sum.copy_(amb); depth.copy_(d); image.copy_(img)
+
+
+def composite_rays_train_backward(grad_weights_sum, grad_ambient_sum, grad_image, sigmas, rgbs, ambient, deltas, rays, weights_sum, ambient_sum, image, M, N, T_thresh, grad_sigmas, grad_rgbs, grad_ambient):
+    _composite_train_backward([sigmas, rgbs, ambient], 1, 0, deltas, rays, M, T_thresh,
+                              [grad_weights_sum, grad_image, grad_ambient_sum], [grad_sigmas, grad_rgbs, grad_ambient])
+
+
+def composite_rays_train_sigma_forward(sigmas, rgbs, ambient, deltas, rays, M, N, T_thresh, weights_sum, ambient_sum, depth, image):
+    ws, d, img, _, (amb,) = _composite_train(sigmas, rgbs, deltas, rays, M, T_thresh, weighted=(ambient,))
+    weights_sum.copy_(ws); ambient_sum.copy_(amb); depth.copy_(d); image.copy_(img)
+
+
+def composite_rays_train_sigma_backward(grad_weights_sum, grad_ambient_sum, grad_image, sigmas, rgbs, ambient, deltas, rays, weights_sum, ambient_sum, image, M, N, T_thresh, grad_sigmas, grad_rgbs, grad_ambient):
+    _composite_train_backward([sigmas, rgbs, ambient], 0, 1, deltas, rays, M, T_thresh,
+                              [grad_weights_sum, grad_image, grad_ambient_sum], [grad_sigmas, grad_rgbs, grad_ambient])
+
+
+def composite_rays_train_uncertainty_forward(sigmas, rgbs, ambient, uncertainty, deltas, rays, M, N, T_thresh, weights_sum, ambient_sum, uncertainty_sum, depth, image):
+    ws, d, img, (amb,), (unc,) = _composite_train(sigmas, rgbs, deltas, rays, M, T_thresh, plain=(ambient,), weighted=(uncertainty,))
+    weights_sum.copy_(ws); ambient_sum.copy_(amb); uncertainty_sum.copy_(unc); depth.copy_(d); image.copy_(img)
+
+
+def composite_rays_train_uncertainty_backward(grad_weights_sum, grad_ambient_sum, grad_uncertainty_sum, grad_image, sigmas, rgbs, ambient, uncertainty, deltas, rays, weights_sum, ambient_sum, uncertainty_sum, image, M, N, T_thresh, grad_sigmas, grad_rgbs, grad_ambient, grad_uncertainty):
+    _composite_train_backward([sigmas, rgbs, ambient, uncertainty], 1, 1, deltas, rays, M, T_thresh,
+                              [grad_weights_sum, grad_image, grad_ambient_sum, grad_uncertainty_sum],
+                              [grad_sigmas, grad_rgbs, grad_ambient, grad_uncertainty])
+
+
+def composite_rays_train_triplane_forward(sigmas, rgbs, amb_aud, amb_eye, uncertainty, deltas, rays, M, N, T_thresh, weights_sum, amb_aud_sum, amb_eye_sum, uncertainty_sum, depth, image):
+    ws, d, img, (aud, eye), (unc,) = _composite_train(sigmas, rgbs, deltas, rays, M, T_thresh, plain=(amb_aud, amb_eye), weighted=(uncertainty,))
+    weights_sum.copy_(ws); amb_aud_sum.copy_(aud); amb_eye_sum.copy_(eye); uncertainty_sum.copy_(unc); depth.copy_(d); image.copy_(img)
+
+
+def composite_rays_train_triplane_backward(grad_weights_sum, grad_amb_aud_sum, grad_amb_eye_sum, grad_uncertainty_sum, grad_image, sigmas, rgbs, amb_aud, amb_eye, uncertainty, deltas, rays, weights_sum, amb_aud_sum, amb_eye_sum, uncertainty_sum, image, M, N, T_thresh, grad_sigmas, grad_rgbs, grad_amb_aud, grad_amb_eye, grad_uncertainty):
+    _composite_train_backward([sigmas, rgbs, amb_aud, amb_eye, uncertainty], 2, 1, deltas, rays, M, T_thresh,
+                              [grad_weights_sum, grad_image, grad_amb_aud_sum, grad_amb_eye_sum, grad_uncertainty_sum],
+                              [grad_sigmas, grad_rgbs, grad_amb_aud, grad_amb_eye, grad_uncertainty])
+
+
+# ----------------------------------------
+# infer functions
+# ----------------------------------------
+
+def march_rays(n_alive, n_step, rays_alive, rays_t, rays_o, rays_d, bound, dt_gamma, max_steps, C, H, grid, near, far, xyzs, dirs, deltas, noises):
+    index = rays_alive[:n_alive].long()
+    o = rays_o.view(-1, 3)[index].float()
+    d = rays_d.view(-1, 3)[index].float()
+    dt_min, dt_max = _step_sizes(C, H, max_steps)
+
+    t = rays_t[index].float()
+    t = t + torch.clamp(t * dt_gamma, dt_min, dt_max) * noises[:n_alive].float()
+    limit = torch.full((n_alive,), n_step, dtype=torch.long, device=o.device)
+    ids, step_ids, p_xyzs, p_dirs, p_deltas = _march(o, d, t, far[index].float(), limit, bound, dt_gamma, dt_min, dt_max, C, H, grid)
+
+    # fixed layout: ray n owns points [n * n_step, (n + 1) * n_step), unused slots stay zero
+    pos = ids * n_step + step_ids
+    xyzs[pos] = p_xyzs.to(xyzs.dtype)
+    dirs[pos] = p_dirs.to(dirs.dtype)
+    deltas[pos] = p_deltas.to(deltas.dtype)
+
+
+def _composite_infer(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, weights_sum, depth, image, plain=(), weighted=()):
+    ''' composite_rays_*: plain / weighted are (values [n_alive * n_step], sums [N]) pairs updated in-place '''
+    index = rays_alive[:n_alive].long()
+    K = n_alive * n_step
+    sig = sigmas[:K].float().view(n_alive, n_step)
+    col = rgbs[:K].float().view(n_alive, n_step, 3)
+    dl = deltas[:K].float().view(n_alive, n_step, 2)
+    plain = [(v[:K].float().view(n_alive, n_step), s) for v, s in plain]
+    weighted = [(v[:K].float().view(n_alive, n_step), s) for v, s in weighted]
+
+    t = rays_t[index].float()
+    ws = weights_sum[index].float()
+    dep = depth[index].float()
+    img = image[index].float()
+    p_sums = [s[index].float() for _, s in plain]
+    w_sums = [s[index].float() for _, s in weighted]
+
+    # n_step is small (<= 8): step the kernel's loop for all rays at once
+    running = torch.ones(n_alive, dtype=torch.bool, device=sig.device)
+    for k in range(n_step):
+        take = running & (dl[:, k, 0] != 0) # ray is terminated if delta == 0
+        alpha = 1 - torch.exp(- sig[:, k] * dl[:, k, 0])
+        T = 1 - ws
+        w = torch.where(take, alpha * T, torch.zeros_like(T))
+        ws = ws + w
+        t = torch.where(take, dl[:, k, 1], t)
+        dep = dep + w * dl[:, k, 1]
+        img = img + w[:, None] * col[:, k]
+        p_sums = [s + torch.where(take, v[:, k], torch.zeros_like(s)) for (v, _), s in zip(plain, p_sums)]
+        w_sums = [s + w * v[:, k] for (v, _), s in zip(weighted, w_sums)]
+        running = take & (T >= T_thresh) # ray is terminated if T is too small
+
+    # rays that finished all n_step steps continue from t, others are marked dead
+    rays_t[index[running]] = t[running].to(rays_t.dtype)
+    rays_alive[:n_alive] = torch.where(running, rays_alive[:n_alive], torch.full_like(rays_alive[:n_alive], -1))
+
+    weights_sum[index] = ws.to(weights_sum.dtype)
+    depth[index] = dep.to(depth.dtype)
+    image[index] = img.to(image.dtype)
+    for (_, s), v in zip(plain, p_sums):
+        s[index] = v.to(s.dtype)
+    for (_, s), v in zip(weighted, w_sums):
+        s[index] = v.to(s.dtype)
+
+
+def composite_rays(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, weights, depth, image):
+    _composite_infer(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, weights, depth, image)
+
+
+def composite_rays_ambient(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, ambients, weights, depth, image, ambient_sum):
+    _composite_infer(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, weights, depth, image,
+                     plain=[(ambients, ambient_sum)])
+
+
+def composite_rays_ambient_sigma(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, ambients, weights, depth, image, ambient_sum):
+    _composite_infer(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, weights, depth, image,
+                     weighted=[(ambients, ambient_sum)])
+
+
+def composite_rays_uncertainty(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, ambients, uncertainties, weights, depth, image, ambient_sum, uncertainty_sum):
+    _composite_infer(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, weights, depth, image,
+                     plain=[(ambients, ambient_sum)], weighted=[(uncertainties, uncertainty_sum)])
+
+
+def composite_rays_triplane(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, ambs_aud, ambs_eye, uncertainties, weights, depth, image, amb_aud_sum, amb_eye_sum, uncertainty_sum):
+    _composite_infer(n_alive, n_step, T_thresh, rays_alive, rays_t, sigmas, rgbs, deltas, weights, depth, image,
+                     plain=[(ambs_aud, amb_aud_sum), (ambs_eye, amb_eye_sum)], weighted=[(uncertainties, uncertainty_sum)])
@@ -6,10 +6,9 @@ from torch.autograd import Function
 from torch.autograd.function import once_differentiable
 from torch.cuda.amp import custom_bwd, custom_fwd 
 
-try:
-    import _shencoder as _backend
-except ImportError:
-    from .backend import _backend
+from ..backends import load_backend
+
+_backend, _use_cuda = load_backend(__package__, '_shencoder')
 
 class _sh_encoder(Function):
     @staticmethod
@@ -0,0 +1,107 @@
+''' Pure PyTorch implementation of the _shencoder bindings (src/shencoder.cu).
+
+The polynomials are the ones of the CUDA kernel (real spherical harmonics up to degree 8).
+The backward recomputes them with autograd, so dy_dx is only zeroed by the forward.
+'''
+import torch
+
+
+def _sh(inputs, C):
+    ''' inputs: [B, 3] --> list of C * C tensors [B] '''
+    x, y, z = inputs[:, 0], inputs[:, 1], inputs[:, 2]
+
+    xy, xz, yz, x2, y2, z2, xyz = x * y, x * z, y * z, x * x, y * y, z * z, x * y * z
+    x4, y4, z4 = x2 * x2, y2 * y2, z2 * z2
+    x6, y6, z6 = x4 * x2, y4 * y2, z4 * z2
+
+    out = []
+    out.append(torch.full_like(x, 0.28209479177387814)) # 0
+    if C <= 1: return out
+    out.append(-0.48860251190291987*y) # 1
+    out.append(0.48860251190291987*z) # 2
+    out.append(-0.48860251190291987*x) # 3
+    if C <= 2: return out
+    out.append(1.0925484305920792*xy) # 4
+    out.append(-1.0925484305920792*yz) # 5
+    out.append(0.94617469575755997*z2 - 0.31539156525251999) # 6
+    out.append(-1.0925484305920792*xz) # 7
+    out.append(0.54627421529603959*x2 - 0.54627421529603959*y2) # 8
+    if C <= 3: return out
+    out.append(0.59004358992664352*y*(-3.0*x2 + y2)) # 9
+    out.append(2.8906114426405538*xy*z) # 10
+    out.append(0.45704579946446572*y*(1.0 - 5.0*z2)) # 11
+    out.append(0.3731763325901154*z*(5.0*z2 - 3.0)) # 12
+    out.append(0.45704579946446572*x*(1.0 - 5.0*z2)) # 13
+    out.append(1.4453057213202769*z*(x2 - y2)) # 14
+    out.append(0.59004358992664352*x*(-x2 + 3.0*y2)) # 15
+    if C <= 4: return out
+    out.append(2.5033429417967046*xy*(x2 - y2)) # 16
+    out.append(1.7701307697799304*yz*(-3.0*x2 + y2)) # 17
+    out.append(0.94617469575756008*xy*(7.0*z2 - 1.0)) # 18
+    out.append(0.66904654355728921*yz*(3.0 - 7.0*z2)) # 19
+    out.append(-3.1735664074561294*z2 + 3.7024941420321507*z4 + 0.31735664074561293) # 20
+    out.append(0.66904654355728921*xz*(3.0 - 7.0*z2)) # 21
+    out.append(0.47308734787878004*(x2 - y2)*(7.0*z2 - 1.0)) # 22
+    out.append(1.7701307697799304*xz*(-x2 + 3.0*y2)) # 23
+    out.append(-3.7550144126950569*x2*y2 + 0.62583573544917614*x4 + 0.62583573544917614*y4) # 24
+    if C <= 5: return out
+    out.append(0.65638205684017015*y*(10.0*x2*y2 - 5.0*x4 - y4)) # 25
+    out.append(8.3026492595241645*xy*z*(x2 - y2)) # 26
+    out.append(-0.48923829943525038*y*(3.0*x2 - y2)*(9.0*z2 - 1.0)) # 27
+    out.append(4.7935367849733241*xy*z*(3.0*z2 - 1.0)) # 28
+    out.append(0.45294665119569694*y*(14.0*z2 - 21.0*z4 - 1.0)) # 29
+    out.append(0.1169503224534236*z*(-70.0*z2 + 63.0*z4 + 15.0)) # 30
+    out.append(0.45294665119569694*x*(14.0*z2 - 21.0*z4 - 1.0)) # 31
+    out.append(2.3967683924866621*z*(x2 - y2)*(3.0*z2 - 1.0)) # 32
+    out.append(-0.48923829943525038*x*(x2 - 3.0*y2)*(9.0*z2 - 1.0)) # 33
+    out.append(2.0756623148810411*z*(-6.0*x2*y2 + x4 + y4)) # 34
+    out.append(0.65638205684017015*x*(10.0*x2*y2 - x4 - 5.0*y4)) # 35
+    if C <= 6: return out
+    out.append(1.3663682103838286*xy*(-10.0*x2*y2 + 3.0*x4 + 3.0*y4)) # 36
+    out.append(2.3666191622317521*yz*(10.0*x2*y2 - 5.0*x4 - y4)) # 37
+    out.append(2.0182596029148963*xy*(x2 - y2)*(11.0*z2 - 1.0)) # 38
+    out.append(-0.92120525951492349*yz*(3.0*x2 - y2)*(11.0*z2 - 3.0)) # 39
+    out.append(0.92120525951492349*xy*(-18.0*z2 + 33.0*z4 + 1.0)) # 40
+    out.append(0.58262136251873131*yz*(30.0*z2 - 33.0*z4 - 5.0)) # 41
+    out.append(6.6747662381009842*z2 - 20.024298714302954*z4 + 14.684485723822165*z6 - 0.31784601133814211) # 42
+    out.append(0.58262136251873131*xz*(30.0*z2 - 33.0*z4 - 5.0)) # 43
+    out.append(0.46060262975746175*(x2 - y2)*(11.0*z2*(3.0*z2 - 1.0) - 7.0*z2 + 1.0)) # 44
+    out.append(-0.92120525951492349*xz*(x2 - 3.0*y2)*(11.0*z2 - 3.0)) # 45
+    out.append(0.50456490072872406*(11.0*z2 - 1.0)*(-6.0*x2*y2 + x4 + y4)) # 46
+    out.append(2.3666191622317521*xz*(10.0*x2*y2 - x4 - 5.0*y4)) # 47
+    out.append(10.247761577878714*x2*y4 - 10.247761577878714*x4*y2 + 0.6831841051919143*x6 - 0.6831841051919143*y6) # 48
+    if C <= 7: return out
+    out.append(0.70716273252459627*y*(-21.0*x2*y4 + 35.0*x4*y2 - 7.0*x6 + y6)) # 49
+    out.append(5.2919213236038001*xy*z*(-10.0*x2*y2 + 3.0*x4 + 3.0*y4)) # 50
+    out.append(-0.51891557872026028*y*(13.0*z2 - 1.0)*(-10.0*x2*y2 + 5.0*x4 + y4)) # 51
+    out.append(4.1513246297620823*xy*z*(x2 - y2)*(13.0*z2 - 3.0)) # 52
+    out.append(-0.15645893386229404*y*(3.0*x2 - y2)*(13.0*z2*(11.0*z2 - 3.0) - 27.0*z2 + 3.0)) # 53
+    out.append(0.44253269244498261*xy*z*(-110.0*z2 + 143.0*z4 + 15.0)) # 54
+    out.append(0.090331607582517306*y*(-135.0*z2 + 495.0*z4 - 429.0*z6 + 5.0)) # 55
+    out.append(0.068284276912004949*z*(315.0*z2 - 693.0*z4 + 429.0*z6 - 35.0)) # 56
+    out.append(0.090331607582517306*x*(-135.0*z2 + 495.0*z4 - 429.0*z6 + 5.0)) # 57
+    out.append(0.07375544874083044*z*(x2 - y2)*(143.0*z2*(3.0*z2 - 1.0) - 187.0*z2 + 45.0)) # 58
+    out.append(-0.15645893386229404*x*(x2 - 3.0*y2)*(13.0*z2*(11.0*z2 - 3.0) - 27.0*z2 + 3.0)) # 59
+    out.append(1.0378311574405206*z*(13.0*z2 - 3.0)*(-6.0*x2*y2 + x4 + y4)) # 60
+    out.append(-0.51891557872026028*x*(13.0*z2 - 1.0)*(-10.0*x2*y2 + x4 + 5.0*y4)) # 61
+    out.append(2.6459606618019*z*(15.0*x2*y4 - 15.0*x4*y2 + x6 - y6)) # 62
+    out.append(0.70716273252459627*x*(-35.0*x2*y4 + 21.0*x4*y2 - x6 + 7.0*y6)) # 63
+    return out
+
+
+def sh_encode_forward(inputs, outputs, B, D, C, dy_dx):
+    outputs.copy_(torch.stack(_sh(inputs, C), dim=-1))
+    if dy_dx is not None:
+        dy_dx.zero_()
+
+
+def sh_encode_backward(grad, inputs, B, D, C, dy_dx, grad_inputs):
+    with torch.enable_grad():
+        x = inputs.detach().requires_grad_()
+        outputs = torch.stack(_sh(x, C), dim=-1)
+        # degree 1 is a constant: nothing depends on the inputs
+        g = torch.autograd.grad(outputs, x, grad, allow_unused=True)[0] if outputs.requires_grad else None
+    if g is None:
+        grad_inputs.zero_()
+    else:
+        grad_inputs.copy_(g)
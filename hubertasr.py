@@ -12,6 +12,8 @@ class HubertASR(BaseASR):
         #self.stride_left_size = 32
         #self.stride_right_size = 32
         self.audio_feat_length = audio_feat_length
+        # reuses the conv features of the audio shared with the previous window
+        self.hubert_stream = audio_processor.stream()
 
 
     def run_step(self):
@@ -27,7 +29,9 @@ class HubertASR(BaseASR):
         
         inputs = np.concatenate(self.frames)  # [N * chunk]
 
-        mel = self.audio_processor.get_hubert_from_16k_speech(inputs)
+        # the audio frames of this step are new, the rest of the window is the end of the previous one
+        new = sum(len(frame) for frame in self.frames[-self.batch_size * 2:])
+        mel = self.hubert_stream.get_hubert(inputs, new)
         mel_chunks=self.audio_processor.feature2chunks(feature_array=mel,fps=self.fps/2,batch_size=self.batch_size,audio_feat_length = self.audio_feat_length, start=self.stride_left_size/2)
 
         self.feat_queue.put(mel_chunks)
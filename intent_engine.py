@@ -0,0 +1,187 @@
+# intent_engine.py
+"""
+本地意图识别引擎 (LEARNING_REPORT / QUIZ / NORMAL_CHAT)
+
+两级判断, 都在进程内完成:
+1. KeywordAutomaton: 启动时把 INTENT_KB 的关键词编译成一个正则自动机, 一次扫描即可命中
+2. EmbeddingIntentClassifier: 复用 RAG 的 bge-m3 向量, 与各意图的示例句原型做余弦相似度
+
+只有两级都拿不准 (低置信度) 时才需要调用 LLM 兜底。
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+INTENT_LABELS = ("LEARNING_REPORT", "QUIZ", "NORMAL_CHAT")
+
+# 各意图的示例句, 用于生成 embedding 原型 (均值向量)
+INTENT_EXAMPLES = {
+    "LEARNING_REPORT": [
+        "show me my learning report",
+        "generate my study summary for this course",
+        "how am I doing in this course overall",
+        "what are my weak points so far",
+        "give me a review of my learning progress",
+        "analyze my mistakes and tell me what to improve",
+    ],
+    "QUIZ": [
+        "I want to take a quiz",
+        "give me some exercises",
+        "let me practice some questions",
+        "test me on what I have learned",
+        "can I do some practice problems",
+        "start a test for me",
+    ],
+    "NORMAL_CHAT": [
+        "what is a pointer in C++",
+        "explain the difference between a for loop and a while loop",
+        "how do I declare an array",
+        "why does my code not compile",
+        "what does the keyword const mean",
+        "hello, who are you",
+        "can you explain recursion with an example",
+        "what is a class and an object",
+    ],
+}
+
+KEYWORD_SCORE = 90          # 命中关键词的基础分
+VERB_BONUS = 6              # 同时出现动词时的加分 (最多 3 次)
+EMBED_MIN_SIMILARITY = 0.55  # 最相近原型的最低相似度
+EMBED_MIN_MARGIN = 0.04      # 第一名与第二名的最小差距
+INTENT_DEBUG = os.getenv("INTENT_DEBUG", "0") == "1"  # 逐条打印判断路径 (耗时已由 RequestTrace 统计)
+
+
+def _phrase_pattern(phrase: str) -> str:
+    """关键词 -> 正则: 容忍多空格 / 连字符, 末词允许复数与常见词形变化"""
+    words = [re.escape(w) for w in phrase.lower().split()]
+    if not words:
+        return ""
+    last = words[-1]
+    if last.endswith("e"):
+        last = last[:-1] + r"(?:e|es|ed|ing)"
+    else:
+        last = last + r"(?:s|es|zes|ing)?"
+    words[-1] = last
+    return r"\b" + r"[\s\-_]+".join(words) + r"\b"
+
+
+class KeywordAutomaton:
+    """把 INTENT_KB 编译为单个正则 (每个意图一个命名分组), 每条消息只扫描一遍"""
+
+    def __init__(self, intent_kb: Dict[str, Dict[str, List[str]]]):
+        groups = []
+        self._verbs = {}
+        for label, kb in intent_kb.items():
+            phrases = sorted(kb.get("must_any", []), key=len, reverse=True)
+            alts = "|".join(p for p in (_phrase_pattern(x) for x in phrases) if p)
+            if alts:
+                groups.append(f"(?P<{label}>{alts})")
+            verbs = kb.get("verbs", [])
+            self._verbs[label] = (
+                re.compile(r"\b(?:" + "|".join(re.escape(v) for v in verbs) + r")\b")
+                if verbs else None
+            )
+        self._pattern = re.compile("|".join(groups)) if groups else None
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """返回命中的意图及分数 (0-100), 未命中的意图不出现在结果里"""
+        if not self._pattern:
+            return {}
+        s = text.strip().lower()
+        hits = {}
+        for m in self._pattern.finditer(s):
+            hits[m.lastgroup] = KEYWORD_SCORE
+        for label in hits:
+            verbs = self._verbs.get(label)
+            if verbs is not None:
+                hits[label] = min(100, hits[label] + VERB_BONUS * min(3, len(verbs.findall(s))))
+        return hits
+
+
+class EmbeddingIntentClassifier:
+    """用示例句的 bge-m3 向量均值作为原型, 查询向量与原型做点积 (向量已归一化)"""
+
+    def __init__(self, embeddings, examples: Dict[str, List[str]] = None):
+        self.embeddings = embeddings
+        examples = examples or INTENT_EXAMPLES
+        self.labels = list(examples.keys())
+        protos = []
+        for label in self.labels:
+            vecs = np.asarray(embeddings.embed_documents(examples[label]), dtype=np.float32)
+            centroid = vecs.mean(axis=0)
+            protos.append(centroid / (np.linalg.norm(centroid) + 1e-8))
+        self._prototypes = np.stack(protos)
+
+    def embed(self, text: str) -> np.ndarray:
+        return np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+
+    def classify(self, query_vector) -> Tuple[str, float, float]:
+        """返回 (label, 相似度, 与第二名的差距)"""
+        v = np.asarray(query_vector, dtype=np.float32)
+        v = v / (np.linalg.norm(v) + 1e-8)
+        sims = self._prototypes @ v
+        order = np.argsort(-sims)
+        best = int(order[0])
+        margin = float(sims[best] - sims[order[1]]) if len(order) > 1 else float(sims[best])
+        return self.labels[best], float(sims[best]), margin
+
+
+class IntentEngine:
+    """
+    classify(text, query_vector=None) -> (label, confident)
+
+    - 关键词命中: 直接返回, 置信
+    - 有 embedding 模型: 用 (调用方传入的或现算的) 查询向量做原型分类
+    - 都不确定: 返回 ("NORMAL_CHAT", False), 由调用方决定是否走 LLM 兜底
+    """
+
+    def __init__(self, intent_kb, embeddings=None, keyword_thresh=75):
+        self.automaton = KeywordAutomaton(intent_kb)
+        self.keyword_thresh = keyword_thresh
+        self.classifier = EmbeddingIntentClassifier(embeddings) if embeddings is not None else None
+
+    def classify(self, text: str, query_vector=None) -> Tuple[str, bool]:
+        t0 = time.perf_counter()
+        scores = self.automaton.scores(text)
+        if scores:
+            label = max(scores, key=scores.get)
+            if scores[label] >= self.keyword_thresh:
+                self._log("keyword", label, t0)
+                return label, True
+
+        if self.classifier is not None:
+            if query_vector is None:
+                query_vector = self.classifier.embed(text)
+            label, sim, margin = self.classifier.classify(query_vector)
+            confident = sim >= EMBED_MIN_SIMILARITY and margin >= EMBED_MIN_MARGIN
+            self._log(f"embedding sim={sim:.3f} margin={margin:.3f}", label, t0)
+            return label, confident
+
+        self._log("none", "NORMAL_CHAT", t0)
+        return "NORMAL_CHAT", False
+
+    def _log(self, how, label, t0):
+        if not INTENT_DEBUG:
+            return
+        print(f"[intent] {label} via {how} in {(time.perf_counter() - t0) * 1000:.3f} ms")
+
+
+_shared_engines = {}
+_shared_engines_lock = threading.Lock()
+
+
+def get_intent_engine(intent_kb, embeddings=None) -> IntentEngine:
+    """进程内共享引擎: 自动机和原型向量只在第一次使用时构建"""
+    key = id(embeddings)
+    engine = _shared_engines.get(key)
+    if engine is None:
+        with _shared_engines_lock:
+            engine = _shared_engines.get(key)
+            if engine is None:
+                engine = IntentEngine(intent_kb, embeddings)
+                _shared_engines[key] = engine
+    return engine
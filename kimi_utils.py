@@ -1,6 +1,7 @@
 # kimi_utils.py
 import os
 import re
+import threading
 import openai
 import json
 
@@ -9,11 +10,28 @@ KIMI_API_KEY = os.getenv("KIMI_API_KEY", "sk-7REwDBd0NekJccYmaDIJQ6xa7zgd3ftB1FZ
 KIMI_API_BASE = os.getenv("KIMI_API_BASE", "https://api.moonshot.cn/v1")
 KIMI_MODEL = os.getenv("KIMI_MODEL", "moonshot-v1-8k")  # 可改 "moonshot-v1-32k" / "moonshot-v1-128k"
 
+# 进程内共享的 Kimi 客户端 (各调用共用一份连接池, 不再每次调用新建)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+def kimi_client():
+    return _shared_client("openai", lambda: openai.OpenAI(api_key=KIMI_API_KEY, base_url=KIMI_API_BASE))
+
 
 def kimi_chat(prompt: str) -> str:
     try:
-        client = openai.OpenAI(api_key=KIMI_API_KEY, base_url=KIMI_API_BASE)
-        resp = client.chat.completions.create(
+        resp = kimi_client().chat.completions.create(
             model=KIMI_MODEL,
             messages=[
                 {"role": "system", "content": "You are an experienced instructor."},
@@ -158,12 +176,7 @@ def parse_kps_from_ai(ai_text: str):
 
 
 def kimi_personal_analysis(prompt: str) -> str:
-
-    client = openai.OpenAI(
-        api_key=KIMI_API_KEY,
-        base_url=KIMI_API_BASE
-    )
-    response = client.chat.completions.create(
+    response = kimi_client().chat.completions.create(
         model="kimi-k2-0711-preview",
         messages=[
             {"role": "system", "content": "You are a personalized learning coach."},
@@ -174,169 +187,339 @@ def kimi_personal_analysis(prompt: str) -> str:
 
 
 
+# ---------- 题目解析 (入库时解析一次, 模板直接渲染结构化字段) ----------
+#
+# 结构化题目格式:
+#     {
+#         "question": "题干\nOptions:\nA. ...\nB. ...",   # 原始组合文本 (答题记录 / 错题本沿用)
+#         "stem": "题干 (已按句断行)",
+#         "options": [{"label": "A", "text": "..."}, ...],  # 非选择题为 []
+#         "answer": "B", "answer_letter": "B",               # answer_letter 仅在答案对应某个选项时非空
+#         "explanation": "...",
+#     }
+
+_RE_COMPACT_LINE = re.compile(r"^\d+\)\s*(.+?)\s*Answer:\s*(\S.*)$", re.IGNORECASE)
+_RE_INLINE_EXPLANATION = re.compile(r"\s*Explanation:\s*", re.IGNORECASE)
+# 只认大写的 A / (A) / A. / A) / A: 形式 (后面只能是空白或结尾), "a value of x" 之类的文字答案不会被当成选项
+_RE_ANSWER_LETTER = re.compile(r"^\(?([A-D])(?:[.:)]|\)[.:]|$)(?=\s|$)")
+_RE_OPTION_PREFIX = re.compile(r"^\(?([A-Da-d])[.)]\s*(.*)$", re.DOTALL)
+_RE_OPTIONS_SPLIT = re.compile(r"Options?\s*:\s*", re.IGNORECASE)
+_RE_OPTION_TOKEN = re.compile(r"(?:(?<=^)|(?<=\s))([A-D])\.\s*")
+_RE_SENTENCE_BREAK = re.compile(r"(?<=[.?!])\s+")
+
+
+def format_stem(stem: str) -> str:
+    """题干按句断行 (原 mcq_html 过滤器每次渲染都做的处理)"""
+    stem = _RE_SENTENCE_BREAK.sub("\n", (stem or "").strip()).replace("\\n", "\n")
+    return "\n".join(ln.strip() for ln in stem.splitlines() if ln.strip())
+
+
+def split_question_text(text: str):
+    """把 "题干 Options: A. .. B. .." 组合文本拆成 (题干, [(label, text), ...])"""
+    if not text:
+        return "", []
+    parts = _RE_OPTIONS_SPLIT.split(text, maxsplit=1)
+    stem = parts[0].strip()
+    if len(parts) != 2:
+        return stem, []
+    tokens = _RE_OPTION_TOKEN.split(parts[1].strip())
+    options = []
+    for i in range(1, len(tokens), 2):
+        content = (tokens[i + 1] or "").strip()
+        if content:
+            options.append((tokens[i].upper(), content))
+    return stem, options
+
+
+def build_question(stem: str, options, answer: str, explanation: str = ""):
+    """校验并组装结构化题目: 去掉重复 / 空选项, 解析答案字母"""
+    opts = []
+    labels = set()
+    for label, content in options:
+        label = label.upper()
+        if label in labels or not content:
+            continue
+        labels.add(label)
+        opts.append({"label": label, "text": content.strip()})
+    stem = stem.strip()
+    question = stem
+    if opts:
+        question += "\nOptions:\n" + "\n".join(f"{o['label']}. {o['text']}" for o in opts)
+    answer = (answer or "").strip()
+    m = _RE_ANSWER_LETTER.match(answer)
+    letter = m.group(1).upper() if m and m.group(1).upper() in labels else None
+    return {
+        "question": question,
+        "stem": format_stem(stem),
+        "options": opts,
+        "answer": answer,
+        "answer_letter": letter,
+        "explanation": (explanation or "").strip(),
+    }
+
+
+def normalize_options(options):
+    """已有的选项列表 ("A. 4" 字符串 / {"label", "text"} / 无标号文本) 转成 [(label, text), ...]"""
+    out = []
+    for i, o in enumerate(options):
+        default = chr(ord("A") + i)
+        if isinstance(o, dict):
+            out.append(((o.get("label") or default).strip(), str(o.get("text") or "").strip()))
+            continue
+        o = str(o or "").strip()
+        m = _RE_OPTION_PREFIX.match(o)
+        out.append((m.group(1), m.group(2).strip()) if m else (default, o))
+    return out
+
+
+def structure_question(q: dict) -> dict:
+    """已有题目 (手工录入 / 旧数据) 补齐结构化字段; 已经结构化的原样返回"""
+    if "stem" in q and "options" in q:
+        return q
+    stem, options = split_question_text(q.get("question") or "")
+    if q.get("options"):
+        # 已经带选项 (没有题干) 的题目: 沿用原有选项, 不从文本重新解析
+        options = normalize_options(q["options"])
+    data = dict(q)
+    data.update(build_question(stem, options, q.get("answer") or "", q.get("explanation") or ""))
+    # 保留原始题目文本, 题目 id (题干哈希) 与答题记录才能对得上
+    data["question"] = q.get("question") or data["question"]
+    return data
+
+
+class QuestionSetParser:
+    """
+    单遍状态机: 逐行识别 Knowledge Point 标题 / Question / A-D 选项 / Answer / Explanation / 紧凑行
+    (`1) <question> Answer: X [Explanation: ...]`), 每行只做一次分类。
+    feed_line 返回已经完整的题目, finish 返回剩余的题目。
+    """
+
+    def __init__(self):
+        self.knowledge_point = None
+        self._q = None
+        self._q_kp = None
+        self._options = []
+        self._ans = None
+        self._expl = None
+        self._compact = None      # 紧凑行题目, 等待下一行可能出现的 Explanation
+        self._held = []           # 选择题未结束时出现的紧凑行题目, 排在该选择题之后输出 (保持原文顺序)
+
+    def feed_line(self, raw: str):
+        ln = raw.strip()
+        if not ln:
+            return []
+        done = []
+        if self._compact is not None:
+            if ln[:12].lower() == "explanation:":
+                self._compact[3] = ln[12:].strip()
+                self._emit_compact(done)
+                return done
+            self._emit_compact(done)
+
+        head = ln[0]
+        if head == "K" and ln.startswith("Knowledge Point:") or head == "[" and ln.startswith("[KP]"):
+            name = ln.split(":", 1)[1].strip() if head == "K" else ln[4:].strip()
+            if name:
+                self._emit_mcq(done)
+                self.knowledge_point = name
+        elif head == "Q" and ln.startswith("Question:"):
+            self._emit_mcq(done)
+            self._q = ln[9:].strip()
+            self._q_kp = self.knowledge_point
+        elif head in "ABCD" and ln[1:2] == "." and ln[2:3].isspace():
+            if self._q is not None:
+                self._options.append((head, ln[3:].strip()))
+        elif head == "A" and ln.startswith("Answer:"):
+            self._ans = ln[7:].strip()
+        elif head == "E" and ln.startswith("Explanation:"):
+            self._expl = ln[12:].strip()
+        elif head.isdigit():
+            m = _RE_COMPACT_LINE.match(ln)
+            if m:
+                parts = _RE_INLINE_EXPLANATION.split(m.group(2), maxsplit=1)
+                self._compact = [m.group(1), parts[0], self.knowledge_point, parts[1] if len(parts) > 1 else ""]
+        return done
+
+    def finish(self):
+        done = []
+        if self._compact is not None:
+            self._emit_compact(done)
+        self._emit_mcq(done)
+        return done
+
+    def _emit_mcq(self, done):
+        if self._q and self._ans:
+            item = build_question(self._q, self._options, self._ans, self._expl)
+            item["knowledge_point"] = self._q_kp or ""
+            done.append(item)
+        done.extend(self._held)
+        self._held = []
+        self._q, self._q_kp, self._options, self._ans, self._expl = None, None, [], None, None
+
+    def _emit_compact(self, done):
+        stem, answer, kp, expl = self._compact
+        self._compact = None
+        item = build_question(stem, (), answer, expl)
+        item["knowledge_point"] = kp or ""
+        (self._held if self._q is not None else done).append(item)
+
+
+def parse_question_set(ai_text: str):
+    """
+    解析一整批 AI 生成的题目 (单遍)。
+    出现过 Knowledge Point 标题时只保留归属于某个知识点的题目, 否则全部题目 knowledge_point 为 ""。
+    """
+    if not ai_text:
+        return []
+    parser = QuestionSetParser()
+    items = []
+    for ln in ai_text.splitlines():
+        items.extend(parser.feed_line(ln))
+    items.extend(parser.finish())
+    keyed = [it for it in items if it["knowledge_point"]]
+    return keyed or items
+
+
 def extract_questions_from_ai(ai_text: str):
     """
     Parse the AI-generated text into a list of questions.
-    Each question includes:
-      - Question (with options)
-      - Answer
-      - Explanation
+    Only complete multiple-choice items (question, options, answer and explanation) are kept.
     """
-    result = []
-    lines = ai_text.splitlines()
+    return [q for q in parse_question_set(ai_text) if q["options"] and q["explanation"]]
 
-    question = None
-    options = []
-    answer = None
-    explanation = None
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith("Question:"):
-            if question and options and answer and explanation:
-                # Combine question and options
-                question_with_options = f"{question}\nOptions:\n" + "\n".join(options)
-                result.append({
-                    "question": question_with_options,
-                    "answer": answer,
-                    "explanation": explanation
-                })
-
-            question = line.replace("Question:", "").strip()
-            options = []
-            answer = None
-            explanation = None
-
-        elif line.startswith(("A.", "B.", "C.", "D.")):
-            options.append(line.strip())
-
-        elif line.startswith("Answer:"):
-            answer = line.replace("Answer:", "").strip()
-
-        elif line.startswith("Explanation:"):
-            explanation = line.replace("Explanation:", "").strip()
-
-    # Append the last question
-    if question and options and answer and explanation:
-        question_with_options = f"{question}\nOptions:\n" + "\n".join(options)
-        result.append({
-            "question": question_with_options,
-            "answer": answer,
-            "explanation": explanation
-        })
-
-    return result
-
-import re
 
 def extract_questions_from_ai_robust(ai_text: str):
+    """兼容旧接口: 同 parse_question_set"""
+    return parse_question_set(ai_text)
 
-    if not ai_text:
-        return []
 
-    lines = [ln.rstrip() for ln in ai_text.splitlines()]
-    # 分块：按知识点切
-    blocks = []
-    current_kp = None
-    buf = []
-
-    def flush():
-        if current_kp and buf:
-            blocks.append((current_kp, "\n".join(buf)))
-
-    for ln in lines:
-        kp_match = None
-        if ln.strip().startswith("Knowledge Point:"):
-            kp_match = ln.split("Knowledge Point:", 1)[1].strip()
-        elif ln.strip().startswith("[KP]"):
-            kp_match = ln.split("]", 1)[1].strip()
-        if kp_match:
-            flush()
-            current_kp = kp_match
-            buf = []
-        else:
-            buf.append(ln)
-    flush()
-
-    results = []
-
-    # 两种解析器：标准MCQ块 + 紧凑行
-    def parse_block_mcq(text):
-        out = []
-        q = None; options = []; ans = None; expl = None
-        for raw in text.splitlines():
-            ln = raw.strip()
-            if ln.startswith("Question:"):
-                # 结束上一题
-                if q and ans:
-                    q_with_opt = q
-                    if options:
-                        q_with_opt += "\nOptions:\n" + "\n".join(options)
-                    out.append({"question": q_with_opt, "answer": ans, "explanation": expl or ""})
-                # 开启新题
-                q = ln.replace("Question:", "", 1).strip()
-                options = []; ans = None; expl = None
-            elif re.match(r"^[ABCD]\.\s", ln):
-                options.append(ln)
-            elif ln.startswith("Answer:"):
-                ans = ln.replace("Answer:", "", 1).strip()
-            elif ln.startswith("Explanation:"):
-                expl = ln.replace("Explanation:", "", 1).strip()
-        # 收尾
-        if q and ans:
-            q_with_opt = q
-            if options:
-                q_with_opt += "\nOptions:\n" + "\n".join(options)
-            out.append({"question": q_with_opt, "answer": ans, "explanation": expl or ""})
-        return out
-
-    def parse_block_compact(text):
-        """
-        匹配 `1) <question> Answer: X` 以及可选的 `Explanation: ...`（同行或下一行）
-        """
-        out = []
-        # 先合并多余空行，便于相邻行 Explanation 归属
-        merged = []
-        for ln in text.splitlines():
-            if ln.strip() != "":
-                merged.append(ln.strip())
-        i = 0
-        while i < len(merged):
-            ln = merged[i]
-            m = re.match(r"^\d+\)\s*(.+?)\s*Answer:\s*([ABCD]|[^\s].*)$", ln, flags=re.IGNORECASE)
-            if m:
-                qtext = m.group(1).strip()
-                ans = m.group(2).strip()
-                expl = ""
-                # 同行 Explanation
-                m_inline = re.search(r"Explanation:\s*(.+)$", ln, flags=re.IGNORECASE)
-                if m_inline:
-                    expl = m_inline.group(1).strip()
-                else:
-                    # 下一行如果是 Explanation:
-                    if i + 1 < len(merged) and merged[i+1].lower().startswith("explanation:"):
-                        expl = merged[i+1].split(":", 1)[1].strip()
-                        i += 1
-                out.append({"question": qtext, "answer": ans, "explanation": expl})
-            i += 1
-        return out
-
-    # 对每个块套两种解析器，合并去重
-    for kp_name, block_txt in blocks:
-        items = []
-        items.extend(parse_block_mcq(block_txt))
-        items.extend(parse_block_compact(block_txt))
-        for it in items:
-            it["knowledge_point"] = kp_name
-            results.append(it)
-
-    # 若压根没有识别到 Knowledge Point 块，尝试整体作为一个匿名块解析
-    if not results:
-        anon_items = []
-        anon_items.extend(parse_block_mcq(ai_text))
-        anon_items.extend(parse_block_compact(ai_text))
-        for it in anon_items:
-            it["knowledge_point"] = ""  # 没识别出
-            results.append(it)
-
-    return results
+class KimiLLM:
+    """
+    批量生成流水线使用的 Kimi 客户端: 与 kimi_chat 相同的模型与提示,
+    但出错时抛异常 (由调用方重试), 并支持流式输出
+    """
+
+    def __init__(self, model: str = KIMI_MODEL, system: str = "You are an experienced instructor."):
+        self.client = kimi_client()
+        self.model = model
+        self.system = system
+
+    def _messages(self, prompt: str):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": prompt}
+        ]
+
+    def chat(self, prompt: str) -> str:
+        resp = self.client.chat.completions.create(
+            model=self.model, messages=self._messages(prompt), temperature=0.2,
+        )
+        return resp.choices[0].message.content or ""
+
+    def stream(self, prompt: str):
+        """逐块产出文本增量"""
+        resp = self.client.chat.completions.create(
+            model=self.model, messages=self._messages(prompt), temperature=0.2, stream=True,
+        )
+        for chunk in resp:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubLLM:
+    """
+    本地假模型 (测试 / 离线演示用), 接口与 KimiLLM 相同, 输出格式与真实提示要求一致:
+      - build_kp_prompt        -> "Name: description" 每行一个知识点
+      - build_question_prompt  -> Question / A-D / Answer / Explanation 块 (最后一题故意重复, 用于验证去重)
+    fail_rate 用于模拟接口错误, latency 为每个流式块的延迟 (秒)
+    """
+
+    def __init__(self, questions_per_kp: int = 4, latency: float = 0.0, fail_rate: float = 0.0, seed: int = 0):
+        import random
+        self.questions_per_kp = questions_per_kp
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def chat(self, prompt: str) -> str:
+        return "".join(self.stream(prompt))
+
+    def stream(self, prompt: str):
+        import time
+        self.calls += 1
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            raise RuntimeError("stub LLM: simulated API error")
+        text = self._respond(prompt)
+        for i in range(0, len(text), 40):
+            if self.latency:
+                time.sleep(self.latency)
+            yield text[i:i + 40]
+
+    def _respond(self, prompt: str) -> str:
+        if prompt.startswith("Extract knowledge points"):
+            excerpt = prompt.rsplit("(truncate if too long):", 1)[-1].strip()
+            words = [w for w in re.findall(r"[A-Za-z][A-Za-z+#]{3,}", excerpt)][:4] or ["Topic"]
+            return "\n".join(f"{w.title()} Basics: Core ideas of {w.lower()} in C++." for w in dict.fromkeys(words))
+
+        m = re.search(r"^Knowledge Point: (.+)$", prompt, re.MULTILINE)
+        kp = m.group(1).strip() if m else "the topic"
+        stems = [
+            "Which statement about {kp} is true?",
+            "What is the main purpose of {kp} in a C++ program?",
+            "Which code snippet uses {kp} correctly?",
+            "What usually goes wrong when {kp} is misused?",
+            "When should you prefer {kp} over the alternatives?",
+            "How does the compiler treat {kp}?",
+        ]
+        blocks = []
+        for i in range(self.questions_per_kp):
+            stem = stems[i % len(stems)].format(kp=kp)
+            if i >= len(stems):
+                stem = f"{stem} (variant {i // len(stems) + 1}: {self._rng.randrange(10 ** 6)})"
+            blocks.append(
+                f"Question: {stem}\n"
+                f"A. Option {i}A\nB. Option {i}B\nC. Option {i}C\nD. Option {i}D\n"
+                f"Answer: A\nExplanation: Option {i}A describes {kp} correctly.\n"
+            )
+        # 近似重复的一题 (只有标点 / 大小写不同)
+        blocks.append(
+            f"Question: {stems[0].format(kp=kp).upper().rstrip('?')}\n"
+            "A. Option 0A\nB. Option 0B\nC. Option 0C\nD. Option 0D\n"
+            "Answer: A\nExplanation: Duplicate of the first question.\n"
+        )
+        return "\n".join(blocks)
+
+
+class StreamingQuestionParser:
+    """
+    流式解析: 按行把模型输出喂给 QuestionSetParser,
+    feed(chunk) 返回已经完整的题目 (看到下一题的 "Question:" 时上一题即完整), finish() 返回最后一题。
+    输出为结构化题目 (见 build_question), 不含 knowledge_point。
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._parser = QuestionSetParser()
+
+    def feed(self, chunk: str):
+        self._buf += chunk
+        if "\n" not in self._buf:
+            return []
+        *lines, self._buf = self._buf.split("\n")
+        done = []
+        for line in lines:
+            done.extend(self._parser.feed_line(line))
+        return self._strip(done)
+
+    def finish(self):
+        done = self._parser.feed_line(self._buf) if self._buf.strip() else []
+        self._buf = ""
+        done.extend(self._parser.finish())
+        return self._strip(done)
+
+    @staticmethod
+    def _strip(items):
+        for item in items:
+            item.pop("knowledge_point", None)
+        return items
@@ -0,0 +1,193 @@
+# kp_cache.py
+"""
+进程级知识点缓存 (read-through)
+
+- 摘要索引: 所有知识点的 (list_id, name, description, question_count), dashboard 直接从内存读
+- 题目内容: 按知识点 / 按页懒加载, LRU 淘汰
+- 失效: TTL 兜底 + Firestore on_snapshot 变更推送; 监听不可用时 (如本地模拟器) 退化为
+  定时轮询文档 update_time。管理员修改后数秒内即可在页面上看到。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+SUMMARY_TTL = float(os.getenv("KP_CACHE_SUMMARY_TTL", "60"))
+QUESTIONS_TTL = float(os.getenv("KP_CACHE_QUESTIONS_TTL", "300"))
+QUESTIONS_MAX_ENTRIES = int(os.getenv("KP_CACHE_MAX_KPS", "256"))
+POLL_INTERVAL = float(os.getenv("KP_CACHE_POLL_INTERVAL", "5"))
+
+
+class KnowledgePointCache:
+    def __init__(self, db, watch=True):
+        self.db = db
+        self._lock = threading.RLock()
+        self._summary = None           # list[KnowledgePoint] (不含题目)
+        self._summary_loaded_at = 0.0
+        self._kps = OrderedDict()      # (list_id, name) -> (KnowledgePoint, loaded_at); (list_id, name, start, count) -> (题目页, loaded_at)
+        self._update_times = {}        # (list_id, name) -> update_time, 轮询模式使用
+        # 失效代数: 读库前记下, 读完后代数变了 (期间发生过失效) 就不写入缓存, 避免缓存旧数据
+        self._summary_generation = 0   # 每次失效 +1 (摘要总是一起失效)
+        self._generation = 0           # 全部失效时 +1
+        self._kp_generations = {}      # (list_id, name) -> 该知识点失效次数
+        self._watch = None
+        self.hits = 0
+        self.misses = 0
+        if watch:
+            self._start_watch()
+
+    # ---------- 读取 ----------
+    def summary(self, list_id=None):
+        from quiz_app import KnowledgePoint
+        with self._lock:
+            fresh = self._summary is not None and time.time() - self._summary_loaded_at < SUMMARY_TTL
+            if fresh:
+                self.hits += 1
+                kps = self._summary
+            else:
+                kps = None
+                generation = self._summary_generation
+        if kps is None:
+            self.misses += 1
+            kps = KnowledgePoint.get_all_summary(self.db)
+            with self._lock:
+                if generation == self._summary_generation:
+                    self._summary = kps
+                    self._summary_loaded_at = time.time()
+        if list_id:
+            return [kp for kp in kps if kp.list_id == list_id]
+        return list(kps)
+
+    def get(self, list_id, kp_name, include_questions=True):
+        from quiz_app import KnowledgePoint
+        if not include_questions:
+            for kp in self.summary(list_id):
+                if kp.name == kp_name:
+                    return kp
+            return None
+
+        key = (list_id, kp_name)
+        with self._lock:
+            entry = self._kps.get(key)
+            if entry and time.time() - entry[1] < QUESTIONS_TTL:
+                self._kps.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            generation = self._generation_of(key)
+        self.misses += 1
+        kp = KnowledgePoint.get_by_name(self.db, list_id, kp_name, include_questions=True)
+        if kp is not None:
+            self._insert(key, kp, generation)
+        return kp
+
+    def page(self, kp, start, count):
+        """一页题目: 整个知识点已缓存时直接切片, 否则按页缓存 (key 带上 start / count)"""
+        key = (kp.list_id, kp.name, start, count)
+        with self._lock:
+            full = self._kps.get((kp.list_id, kp.name))
+            if full and time.time() - full[1] < QUESTIONS_TTL:
+                self.hits += 1
+                return full[0].get_questions()[start:start + count]
+            entry = self._kps.get(key)
+            if entry and time.time() - entry[1] < QUESTIONS_TTL:
+                self._kps.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            generation = self._generation_of(key)
+        self.misses += 1
+        questions = kp.get_questions_page(start, count)
+        self._insert(key, questions, generation)
+        return questions
+
+    def _generation_of(self, key):
+        return self._generation, self._kp_generations.get(key[:2], 0)
+
+    def _insert(self, key, value, generation):
+        """读库期间该知识点被失效过则放弃写入, 下次读取重新加载"""
+        with self._lock:
+            if generation != self._generation_of(key):
+                return
+            self._kps[key] = (value, time.time())
+            self._kps.move_to_end(key)
+            while len(self._kps) > QUESTIONS_MAX_ENTRIES:
+                self._kps.popitem(last=False)
+
+    # ---------- 失效 ----------
+    def invalidate(self, list_id=None, kp_name=None):
+        """指定知识点失效; 不传参数则全部失效。摘要索引总是一起失效"""
+        with self._lock:
+            self._summary = None
+            self._summary_generation += 1
+            if list_id is None and kp_name is None:
+                self._generation += 1
+                self._kps.clear()
+            else:
+                kp_key = (list_id, kp_name)
+                self._kp_generations[kp_key] = self._kp_generations.get(kp_key, 0) + 1
+                # 同时清掉该知识点的整体缓存和所有分页缓存
+                for key in [k for k in self._kps if k[0] == list_id and k[1] == kp_name]:
+                    self._kps.pop(key, None)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            doc = change.document
+            data = doc.to_dict() or {}
+            list_id = data.get('list') or doc.reference.parent.parent.id
+            self.invalidate(list_id, data.get('name') or doc.id)
+
+    def _start_watch(self):
+        if not getattr(self.db, 'supports_snapshots', True):
+            self._start_polling("backend has no change feed")
+            return
+        try:
+            self._watch = self.db.collection_group('items').on_snapshot(self._on_snapshot)
+            print("✓ Knowledge point cache: listening for Firestore changes")
+        except Exception as e:
+            # 例如本地模拟器不支持监听
+            self._start_polling(f"on_snapshot unavailable ({e})")
+
+    def _start_polling(self, reason):
+        print(f"Knowledge point cache: {reason}, polling every {POLL_INTERVAL}s")
+        threading.Thread(target=self._poll_worker, daemon=True, name="KPCachePoll").start()
+
+    def _poll_worker(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            try:
+                seen = {}
+                # 只取一个小字段, 主要关心文档的 update_time
+                for doc in self.db.collection_group('items').select(['question_count']).stream():
+                    key = (doc.reference.parent.parent.id, doc.id)
+                    seen[key] = doc.update_time
+                    if key in self._update_times and self._update_times[key] != doc.update_time:
+                        self.invalidate(*key)
+                if self._update_times and set(seen) != set(self._update_times):
+                    self.invalidate()
+                self._update_times = seen
+            except Exception as e:
+                print(f"Knowledge point cache poll failed: {e}")
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+
+_kp_cache = None
+_kp_cache_lock = threading.Lock()
+
+
+def get_kp_cache(db):
+    """进程内共享的知识点缓存 (第一次使用时创建并开始监听)"""
+    global _kp_cache
+    if _kp_cache is None:
+        with _kp_cache_lock:
+            if _kp_cache is None:
+                _kp_cache = KnowledgePointCache(db)
+    return _kp_cache
+
+
+def invalidate_kp(list_id=None, kp_name=None):
+    """本进程内的写入 (如管理员保存知识点) 直接失效, 不必等待变更推送"""
+    if _kp_cache is not None:
+        _kp_cache.invalidate(list_id, kp_name)
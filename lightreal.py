@@ -36,7 +36,7 @@ import torch.multiprocessing as mp
 from hubertasr import HubertASR
 import asyncio
 from av import AudioFrame, VideoFrame
-from basereal import BaseReal
+from basereal import BaseReal,FrameBatch
 
 #from imgcache import ImgCache
 
@@ -147,7 +147,7 @@ def __mirror_index(size, index):
         return size - res - 1 
 
 
-def inference(quit_event, batch_size, face_list_cycle, audio_feat_queue, audio_out_queue, res_frame_queue, model):
+def inference(quit_event, batch_size, face_list_cycle, audio_feat_queue, audio_out_queue, res_frame_queue, frame_batch, model):
     length = len(face_list_cycle)
     index = 0
     count = 0
@@ -160,16 +160,11 @@ def inference(quit_event, batch_size, face_list_cycle, audio_feat_queue, audio_o
             mel_batch = audio_feat_queue.get(block=True, timeout=1)
         except queue.Empty:
             continue
-        is_all_silence=True
-        audio_frames = []
-        for _ in range(batch_size*2):
-            frame,type_ = audio_out_queue.get()
-            audio_frames.append((frame,type_))
-            if type_==0:
-                is_all_silence=False
+        audio_frames = [audio_out_queue.get() for _ in range(batch_size*2)]
+        is_all_silence = frame_batch.put_audio(audio_frames) #音频整批转成 int16
         if is_all_silence:
             for i in range(batch_size):
-                res_frame_queue.put((None,__mirror_index(length,index),audio_frames[i*2:i*2+2]))
+                res_frame_queue.put(frame_batch.record(i,__mirror_index(length,index),face=False))
                 index = index + 1
         else:
             t = time.perf_counter()
@@ -201,7 +196,7 @@ def inference(quit_event, batch_size, face_list_cycle, audio_feat_queue, audio_o
 
             with torch.no_grad():
                 pred = model(img_batch.cuda(),mel_batch.cuda())
-            pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
+            frame_batch.put_faces(pred.cpu().numpy().transpose(0, 2, 3, 1), 255.) #整批转成 uint8
 
             counttime += (time.perf_counter() - t)
             count += batch_size
@@ -209,9 +204,9 @@ def inference(quit_event, batch_size, face_list_cycle, audio_feat_queue, audio_o
                 print(f"------actual avg infer fps:{count / counttime:.4f}")
                 count = 0
                 counttime = 0
-            for i,res_frame in enumerate(pred):
+            for i in range(batch_size):
                 #self.__pushmedia(res_frame,loop,audio_track,video_track)
-                res_frame_queue.put((res_frame,__mirror_index(length,index),audio_frames[i*2:i*2+2]))
+                res_frame_queue.put(frame_batch.record(i,__mirror_index(length,index)))
                 index = index + 1
 
 #            for i, pred_frame in enumerate(pred):
@@ -237,6 +232,7 @@ class LightReal(BaseReal):
         self.batch_size = opt.batch_size
         self.idx = 0
         self.res_frame_queue = Queue(self.batch_size*2)  #mp.Queue
+        self.frame_batch = FrameBatch(self.batch_size,self.chunk)
         #self.__loadavatar()
         audio_processor = model
         self.model,self.frame_list_cycle,self.face_list_cycle,self.coord_list_cycle = avatar
@@ -255,12 +251,13 @@ class LightReal(BaseReal):
         
         while not quit_event.is_set():
             try:
-                res_frame,idx,audio_frames = self.res_frame_queue.get(block=True, timeout=1)
+                record = self.res_frame_queue.get(block=True, timeout=1)
             except queue.Empty:
                 continue
-            if audio_frames[0][1]!=0 and audio_frames[1][1]!=0: #全为静音数据，只需要取fullimg
+            res_frame,idx = record.face,record.idx
+            if record.is_silent(): #全为静音数据，只需要取fullimg
                 self.speaking = False
-                audiotype = audio_frames[0][1]
+                audiotype = int(record.types[0])
                 if self.custom_index.get(audiotype) is not None: #有自定义视频
                     mirindex = self.mirror_index(len(self.custom_img_cycle[audiotype]),self.custom_index[audiotype])
                     combine_frame = self.custom_img_cycle[audiotype][mirindex]
@@ -280,7 +277,7 @@ class LightReal(BaseReal):
                 crop_img_ori = crop_img.copy()
                 #res_frame = np.array(res_frame, dtype=np.uint8)
                 try:
-                    crop_img_ori[4:164, 4:164] = res_frame.astype(np.uint8)
+                    crop_img_ori[4:164, 4:164] = res_frame
                     crop_img_ori = cv2.resize(crop_img_ori, (x2-x1,y2-y1))
                 except:
                     continue
@@ -291,11 +288,8 @@ class LightReal(BaseReal):
             asyncio.run_coroutine_threadsafe(video_track._queue.put(new_frame), loop)
             self.record_video_data(combine_frame)
 
-            for audio_frame in audio_frames:
-                frame,type_ = audio_frame
-                frame = (frame * 32767).astype(np.int16)
-                new_frame = AudioFrame(format='s16', layout='mono', samples=frame.shape[0])
-                new_frame.planes[0].update(frame.tobytes())
+            for frame in record.pcm: #int16
+                new_frame = AudioFrame.from_ndarray(frame[None], format='s16', layout='mono')
                 new_frame.sample_rate=16000
                 # if audio_track._queue.qsize()>10:
                 #     time.sleep(0.1)
@@ -311,7 +305,7 @@ class LightReal(BaseReal):
         self.init_customindex()
         process_thread = Thread(target=self.process_frames, args=(quit_event,loop,audio_track,video_track))
         process_thread.start()
-        Thread(target=inference, args=(quit_event,self.batch_size,self.face_list_cycle,self.asr.feat_queue,self.asr.output_queue,self.res_frame_queue,
+        Thread(target=inference, args=(quit_event,self.batch_size,self.face_list_cycle,self.asr.feat_queue,self.asr.output_queue,self.res_frame_queue,self.frame_batch,
                                            self.model,)).start()  #mp.Process
         
 
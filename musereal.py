@@ -43,7 +43,7 @@ from musetalk.whisper.audio2feature import Audio2Feature
 from museasr import MuseASR
 import asyncio
 from av import AudioFrame, VideoFrame
-from basereal import BaseReal
+from basereal import BaseReal,FrameBatch
 
 from tqdm import tqdm
 
@@ -126,7 +126,7 @@ def __mirror_index(size, index):
         return size - res - 1 
 
 @torch.no_grad()
-def inference(render_event,batch_size,input_latent_list_cycle,audio_feat_queue,audio_out_queue,res_frame_queue,
+def inference(render_event,batch_size,input_latent_list_cycle,audio_feat_queue,audio_out_queue,res_frame_queue,frame_batch,
               vae, unet, pe,timesteps): #vae, unet, pe,timesteps
     
     # vae, unet, pe = load_diffusion_model()
@@ -147,16 +147,11 @@ def inference(render_event,batch_size,input_latent_list_cycle,audio_feat_queue,a
             whisper_chunks = audio_feat_queue.get(block=True, timeout=1)
         except queue.Empty:
             continue
-        is_all_silence=True
-        audio_frames = []
-        for _ in range(batch_size*2):
-            frame,type = audio_out_queue.get()
-            audio_frames.append((frame,type))
-            if type==0:
-                is_all_silence=False
+        audio_frames = [audio_out_queue.get() for _ in range(batch_size*2)]
+        is_all_silence = frame_batch.put_audio(audio_frames) #音频整批转成 int16
         if is_all_silence:
             for i in range(batch_size):
-                res_frame_queue.put((None,__mirror_index(length,index),audio_frames[i*2:i*2+2]))
+                res_frame_queue.put(frame_batch.record(i,__mirror_index(length,index),face=False))
                 index = index + 1
         else:
             # print('infer=======')
@@ -184,6 +179,7 @@ def inference(render_event,batch_size,input_latent_list_cycle,audio_feat_queue,a
             # print('unet time:',time.perf_counter()-t)
             # t=time.perf_counter()
             recon = vae.decode_latents(pred_latents)
+            frame_batch.put_faces(recon) #已是 uint8
             # infer_inqueue.put((whisper_batch,latent_batch,sessionid))
             # recon,outsessionid = infer_outqueue.get()
             # if outsessionid != sessionid:
@@ -198,9 +194,9 @@ def inference(render_event,batch_size,input_latent_list_cycle,audio_feat_queue,a
                 print(f"------actual avg infer fps:{count/counttime:.4f}")
                 count=0
                 counttime=0
-            for i,res_frame in enumerate(recon):
+            for i in range(len(recon)):
                 #self.__pushmedia(res_frame,loop,audio_track,video_track)
-                res_frame_queue.put((res_frame,__mirror_index(length,index),audio_frames[i*2:i*2+2]))
+                res_frame_queue.put(frame_batch.record(i,__mirror_index(length,index)))
                 index = index + 1
             #print('total batch time:',time.perf_counter()-starttime)            
     print('musereal inference processor stop')
@@ -218,6 +214,7 @@ class MuseReal(BaseReal):
         self.batch_size = opt.batch_size
         self.idx = 0
         self.res_frame_queue = mp.Queue(self.batch_size*2)
+        self.frame_batch = FrameBatch(self.batch_size,self.chunk)
 
         self.vae, self.unet, self.pe, self.timesteps, self.audio_processor = model
         self.frame_list_cycle,self.mask_list_cycle,self.coord_list_cycle,self.mask_coords_list_cycle, self.input_latent_list_cycle = avatar
@@ -269,12 +266,13 @@ class MuseReal(BaseReal):
         
         while not quit_event.is_set():
             try:
-                res_frame,idx,audio_frames = self.res_frame_queue.get(block=True, timeout=1)
+                record = self.res_frame_queue.get(block=True, timeout=1)
             except queue.Empty:
                 continue
-            if audio_frames[0][1]!=0 and audio_frames[1][1]!=0: #全为静音数据，只需要取fullimg
+            res_frame,idx = record.face,record.idx
+            if record.is_silent(): #全为静音数据，只需要取fullimg
                 self.speaking = False
-                audiotype = audio_frames[0][1]
+                audiotype = int(record.types[0])
                 if self.custom_index.get(audiotype) is not None: #有自定义视频
                     mirindex = self.mirror_index(len(self.custom_img_cycle[audiotype]),self.custom_index[audiotype])
                     combine_frame = self.custom_img_cycle[audiotype][mirindex]
@@ -289,7 +287,7 @@ class MuseReal(BaseReal):
                 ori_frame = copy.deepcopy(self.frame_list_cycle[idx])
                 x1, y1, x2, y2 = bbox
                 try:
-                    res_frame = cv2.resize(res_frame.astype(np.uint8),(x2-x1,y2-y1))
+                    res_frame = cv2.resize(res_frame,(x2-x1,y2-y1))
                 except:
                     continue
                 mask = self.mask_list_cycle[idx]
@@ -305,11 +303,8 @@ class MuseReal(BaseReal):
             self.record_video_data(image)
             #self.recordq_video.put(new_frame)  
 
-            for audio_frame in audio_frames:
-                frame,type = audio_frame
-                frame = (frame * 32767).astype(np.int16)
-                new_frame = AudioFrame(format='s16', layout='mono', samples=frame.shape[0])
-                new_frame.planes[0].update(frame.tobytes())
+            for frame in record.pcm: #int16
+                new_frame = AudioFrame.from_ndarray(frame[None], format='s16', layout='mono')
                 new_frame.sample_rate=16000
                 # if audio_track._queue.qsize()>10:
                 #     time.sleep(0.1)
@@ -329,7 +324,7 @@ class MuseReal(BaseReal):
 
         self.render_event.set() #start infer process render
         Thread(target=inference, args=(self.render_event,self.batch_size,self.input_latent_list_cycle,
-                                           self.asr.feat_queue,self.asr.output_queue,self.res_frame_queue,
+                                           self.asr.feat_queue,self.asr.output_queue,self.res_frame_queue,self.frame_batch,
                                            self.vae, self.unet, self.pe,self.timesteps)).start() #mp.Process
         count=0
         totaltime=0
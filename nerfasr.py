@@ -26,6 +26,20 @@ from queue import Queue
 
 from baseasr import BaseASR
 
+class ASRFeatureModel(torch.nn.Module):
+    # tensor in / tensor out wrapper of the wav2vec / hubert model.
+    # NerfASR always calls it with the same [1, (l + m + r) * chunk] input, so it can be traced (torch.jit.trace) or exported to onnx.
+    def __init__(self, model, hubert):
+        super().__init__()
+        self.model = model
+        self.hubert = hubert
+
+    def forward(self, input_values):
+        result = self.model(input_values)
+        if self.hubert:
+            return result.last_hidden_state # [B=1, T=pts//320, hid=1024]
+        return result.logits # [1, N - 1, 32]
+
 class NerfASR(BaseASR):
     def __init__(self, opt, parent, audio_processor,audio_model):
         super().__init__(opt,parent)
@@ -46,10 +60,6 @@ class NerfASR(BaseASR):
         self.stride_left_size = opt.l
         self.stride_right_size = opt.r
 
-        # pad left frames
-        if self.stride_left_size > 0:
-            self.frames.extend([np.zeros(self.chunk, dtype=np.float32)] * self.stride_left_size)
-
         # create wav2vec model
         # print(f'[INFO] loading ASR model {self.opt.asr_model}...')
         # if 'hubert' in self.opt.asr_model:
@@ -60,18 +70,37 @@ class NerfASR(BaseASR):
         #     self.model = AutoModelForCTC.from_pretrained(opt.asr_model).to(self.device)
         self.processor = audio_processor
         self.model = audio_model
+        self.asr_model = ASRFeatureModel(audio_model, 'hubert' in self.opt.asr_model)
+
+        # streaming input: the (stride_left + ctx + stride_right) audio frames fed to the model are written in place
+        # into a fixed buffer (pinned, so the copy to the device is async) and normalized in place on the device,
+        # instead of concatenating frames and running the processor every step.
+        self.input_size = self.stride_left_size + self.context_size + self.stride_right_size
+        self.input_frames = torch.zeros(self.input_size, self.chunk, dtype=torch.float32, pin_memory=torch.cuda.is_available())
+        self.input_frames_np = self.input_frames.numpy() # same memory
+        self.input_idx = self.stride_left_size # pad left frames (zeros)
+        self.input_values = torch.zeros(1, self.input_size * self.chunk, dtype=torch.float32, device=self.device)
+        self.input_copied = torch.cuda.Event() if torch.cuda.is_available() else None
+        feature_extractor = getattr(self.processor, 'feature_extractor', self.processor)
+        self.do_normalize = getattr(feature_extractor, 'do_normalize', True)
 
         # the extracted features 
         # use a loop queue to efficiently record endless features: [f--t---][-------][-------]
+        # the queue is stored twice ([queue][mirror]), so a 16 feature window is a view even across the wrap
         self.feat_buffer_size = 4
         self.feat_buffer_idx = 0
-        self.feat_queue = torch.zeros(self.feat_buffer_size * self.context_size, self.audio_dim, dtype=torch.float32, device=self.device)
+        self.feat_queue_size = self.feat_buffer_size * self.context_size
+        self.feat_queue = torch.zeros(2 * self.feat_queue_size, self.audio_dim, dtype=torch.float32, device=self.device)
 
         # TODO: hard coded 16 and 8 window size...
-        self.front = self.feat_buffer_size * self.context_size - 8 # fake padding
-        self.tail = 8
-        # attention window...
-        self.att_feats = [torch.zeros(self.audio_dim, 16, dtype=torch.float32, device=self.device)] * 4 # 4 zero padding...
+        self.front = self.feat_queue_size - 8 # fake padding, the window is [front, front + 16)
+        # attention window: circular buffer of the last 8 windows, mirrored too, att_ring[att_start:att_start + 8] is the window in order
+        self.att_ring = torch.zeros(16, self.audio_dim, 16, dtype=torch.float32, device=self.device)
+        self.att_start = 0
+        self.att_len = 4 # 4 zero padding...
+        # windows handed out by get_next_feat, one slot per frame of a render batch
+        self.att_out = torch.zeros(max(1, getattr(opt, 'render_batch', 1)), 8 if self.opt.att > 0 else 1, self.audio_dim, 16, dtype=torch.float32, device=self.device)
+        self.att_out_idx = 0
 
         # warm up steps needed: mid + right + window_size + attention_size
         self.warm_up_steps = self.context_size + self.stride_left_size + self.stride_right_size #+ self.stride_left_size   #+ 8 + 2 * 3
@@ -93,68 +122,62 @@ class NerfASR(BaseASR):
 
     def get_next_feat(self): #get audio embedding to nerf
         # return a [1/8, 16] window, for the next input to nerf side.
-        if self.opt.att>0:
-            while len(self.att_feats) < 8:
-                # [------f+++t-----]
-                if self.front < self.tail:
-                    feat = self.feat_queue[self.front:self.tail]
-                # [++t-----------f+]
-                else:
-                    feat = torch.cat([self.feat_queue[self.front:], self.feat_queue[:self.tail]], dim=0)
-
-                self.front = (self.front + 2) % self.feat_queue.shape[0]
-                self.tail = (self.tail + 2) % self.feat_queue.shape[0]
+        # the returned tensor is a preallocated slot, valid until render_batch more calls.
+        att_feat = self.att_out[self.att_out_idx]
+        self.att_out_idx = (self.att_out_idx + 1) % self.att_out.shape[0]
 
-                # print(self.front, self.tail, feat.shape)
+        if self.opt.att>0:
+            while self.att_len < 8:
+                slot = (self.att_start + self.att_len) % 8
+                self.att_ring[slot].copy_(self.next_window())
+                self.att_ring[slot + 8].copy_(self.att_ring[slot])
+                self.att_len += 1
 
-                self.att_feats.append(feat.permute(1, 0))
-            
-            att_feat = torch.stack(self.att_feats, dim=0) # [8, 44, 16]
+            att_feat.copy_(self.att_ring[self.att_start:self.att_start + 8]) # [8, 44, 16]
 
             # discard old
-            self.att_feats = self.att_feats[1:]
+            self.att_start = (self.att_start + 1) % 8
+            self.att_len -= 1
         else:
-            # [------f+++t-----]
-            if self.front < self.tail:
-                feat = self.feat_queue[self.front:self.tail]
-            # [++t-----------f+]
-            else:
-                feat = torch.cat([self.feat_queue[self.front:], self.feat_queue[:self.tail]], dim=0)
-
-            self.front = (self.front + 2) % self.feat_queue.shape[0]
-            self.tail = (self.tail + 2) % self.feat_queue.shape[0]
-
-            att_feat = feat.permute(1, 0).unsqueeze(0)
-
+            att_feat[0].copy_(self.next_window())
 
         return att_feat
 
+    def next_window(self):
+        # [audio_dim, 16] view of the features in [front, front + 16), then move forward by 2 (one video frame)
+        feat = self.feat_queue[self.front:self.front + 16]
+        self.front = (self.front + 2) % self.feat_queue_size
+        return feat.permute(1, 0)
+
     def run_step(self):
 
         # get a frame of audio
         frame,type = self.get_audio_frame()
-        self.frames.append(frame)
+        self.input_frames_np[self.input_idx] = frame
+        self.input_idx += 1
         # put to output
         self.output_queue.put((frame,type))
         # context not enough, do not run network.
-        if len(self.frames) < self.stride_left_size + self.context_size + self.stride_right_size:
+        if self.input_idx < self.input_size:
             return
-        
-        inputs = np.concatenate(self.frames) # [N * chunk]
-
-        # discard the old part to save memory
-        self.frames = self.frames[-(self.stride_left_size + self.stride_right_size):]
 
         #print(f'[INFO] frame_to_text... ')
         #t = time.time()
-        logits, labels, text = self.__frame_to_text(inputs)
+        feats = self.__frame_to_text() # better lips-sync than labels
         #print(f'-------wav2vec time:{time.time()-t:.4f}s')
-        feats = logits # better lips-sync than labels
+
+        # keep the strides as the left context of the next window, once the async copy to the device finished
+        if self.input_copied is not None:
+            self.input_copied.synchronize()
+        for i in range(self.stride_left_size + self.stride_right_size):
+            self.input_frames_np[i] = self.input_frames_np[self.context_size + i]
+        self.input_idx = self.stride_left_size + self.stride_right_size
 
         # record the feats efficiently.. (no concat, constant memory)
         start = self.feat_buffer_idx * self.context_size
         end = start + feats.shape[0]
         self.feat_queue[start:end] = feats
+        self.feat_queue[start + self.feat_queue_size:end + self.feat_queue_size] = feats
         self.feat_buffer_idx = (self.feat_buffer_idx + 1) % self.feat_buffer_size
 
         # very naive, just concat the text output.
@@ -186,17 +209,20 @@ class NerfASR(BaseASR):
     
 
         
-    def __frame_to_text(self, frame):
-        # frame: [N * 320], N = (context_size + 2 * stride_size)
-        
-        inputs = self.processor(frame, sampling_rate=self.sample_rate, return_tensors="pt", padding=True)
-        
+    def __frame_to_text(self):
+        # input: the [stride_left + ctx + stride_right, chunk] frames buffer, always the same shape
+        input_values = self.input_values
+        input_values.copy_(self.input_frames.view(1, -1), non_blocking=True)
+        if self.input_copied is not None:
+            self.input_copied.record()
+
+        if self.do_normalize:
+            # zero mean unit variance, same as the processor, in place
+            var, mean = torch.var_mean(input_values, unbiased=False)
+            input_values.sub_(mean).div_(torch.sqrt(var + 1e-7))
+
         with torch.no_grad():
-            result = self.model(inputs.input_values.to(self.device))
-            if 'hubert' in self.opt.asr_model:
-                logits = result.last_hidden_state # [B=1, T=pts//320, hid=1024]
-            else:
-                logits = result.logits # [1, N - 1, 32]
+            logits = self.asr_model(input_values)
         #print('logits.shape:',logits.shape)
         
         # cut off stride
@@ -223,7 +249,7 @@ class NerfASR(BaseASR):
         # print(predicted_ids[0])
         # print(transcription)
 
-        return logits[0], None,None #predicted_ids[0], transcription # [N,]
+        return logits[0] #predicted_ids[0], transcription # [N,]
     
 
     def warm_up(self):       
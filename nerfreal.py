@@ -105,7 +105,68 @@ def load_avatar(opt):
         #print('input_img_list:',input_img_list)
         fullbody_list_cycle = read_imgs(input_img_list) #[:frame_total_num]
         #self.imagecache = ImgCache(frame_total_num,self.opt.fullbody_img,1000)
-    return fullbody_list_cycle
+    idle_cycle = load_idle_cycle(opt.idle_cycle) if opt.idle_cycle!='' and not opt.bake_idle else None
+    return fullbody_list_cycle,idle_cycle
+
+def load_idle_cycle(path):
+    '''静音帧文件 (bake_idle_cycle 生成), 以 mmap 方式打开, 所有会话共享, 不占用进程内存'''
+    if not os.path.exists(path):
+        print(f'[WARN] idle cycle {path} not found, silent frames will be rendered')
+        return None
+    idle_cycle = np.load(path, mmap_mode='r')
+    print(f'[INFO] loaded idle cycle {path}: {idle_cycle.shape}')
+    return idle_cycle
+
+def compose_frame(opt, image, fullbody_list_cycle, pose_index):
+    '''头部渲染结果 (RGB) -> 推流帧 (RGB); fullbody 时贴回全身图'''
+    if not opt.fullbody:
+        return image
+    image_fullbody = fullbody_list_cycle[pose_index]
+    image_fullbody = cv2.cvtColor(image_fullbody, cv2.COLOR_BGR2RGB)
+    start_x = opt.fullbody_offset_x  # 合并后小图片的起始x坐标
+    start_y = opt.fullbody_offset_y  # 合并后小图片的起始y坐标
+    image_fullbody[start_y:start_y+image.shape[0], start_x:start_x+image.shape[1]] = image
+    return image_fullbody
+
+def bake_idle_cycle(opt, model, avatar, path, warm_frames=16):
+    '''
+    把静音状态下的完整姿态循环渲染一次, 打包成一个帧文件 (np.save, uint8 [P, H, W, 3], RGB)
+    P 为姿态数; 运行时按 mirror_index 取帧, 与渲染循环 (--> <-- --> <--) 的姿态顺序一致。
+    静音特征来自 NerfASR 对全零音频的输出, 与运行时静音时得到的特征相同;
+    先渲染 warm_frames 帧让 smooth_lips 的 enc_a 收敛到静音状态。
+    '''
+    trainer, data_loader, audio_processor, audio_model = model
+    fullbody_list_cycle, _ = avatar
+    dataset = data_loader._data
+
+    asr = NerfASR(opt, None, audio_processor, audio_model)
+    asr.warm_up()
+    # 按运行时的节奏 (每帧 2 步 ASR) 推进, 直到特征环形缓冲和注意力窗口里都是静音特征
+    for _ in range(asr.feat_buffer_size * asr.context_size // 2 + 8):
+        for _ in range(2):
+            asr.run_step()
+            asr.get_audio_out()
+        auds = asr.get_next_feat()
+
+    def render(pose_index):
+        data = dataset.collate([pose_index])
+        data['auds'] = auds
+        outputs = trainer.test_gui_with_data(data, opt.W, opt.H)
+        image = (outputs['image'] * 255).astype(np.uint8)
+        return compose_frame(opt, image, fullbody_list_cycle, pose_index)
+
+    for _ in range(warm_frames):
+        render(0)
+
+    num_poses = dataset.poses.shape[0]
+    first = render(0)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    frames = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(num_poses,) + first.shape)
+    frames[0] = first
+    for i in tqdm(range(1, num_poses), desc='baking idle cycle'):
+        frames[i] = render(i)
+    frames.flush()
+    print(f'[INFO] idle cycle saved to {path}: {frames.shape}')
 
 class NeRFReal(BaseReal):
     def __init__(self, opt, model,avatar, debug=True):
@@ -135,9 +196,14 @@ class NeRFReal(BaseReal):
         #self.eye_area = None if not self.opt.exp_eye else data_loader._data.eye_area.mean().item()
 
         # playing seq from dataloader, or pause.
-        self.loader = iter(self.data_loader)
+        self.dataset = self.data_loader._data
+        self.frame_index = 0 # 位置同 data_loader 的下标, 静音帧不经过 collate
         frame_total_num = self.data_loader._data.end_index
-        self.fullbody_list_cycle = avatar
+        self.fullbody_list_cycle,self.idle_cycle = avatar
+        self.render_batch = max(1, opt.render_batch) # 每次一起渲染的连续帧数
+        if self.idle_cycle is not None and self.idle_cycle.shape[0] != self.dataset.poses.shape[0]:
+            print(f'[WARN] idle cycle has {self.idle_cycle.shape[0]} frames but there are {self.dataset.poses.shape[0]} poses, re-bake it with --bake_idle')
+            self.idle_cycle = None
         
 
         #self.render_buffer = np.zeros((self.W, self.H, 3), dtype=np.float32)
@@ -221,96 +287,65 @@ class NeRFReal(BaseReal):
         #starter, ender = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
         #starter.record()
 
-        try:
-            data = next(self.loader)
-        except StopIteration:
-            self.loader = iter(self.data_loader)
-            data = next(self.loader)
-        
-        if self.opt.asr:
-            # use the live audio stream
-            data['auds'] = self.asr.get_next_feat()
-
-        audiotype1 = 0
-        audiotype2 = 0
-        #send audio
-        for i in range(2):
-            frame,type = self.asr.get_audio_out()
-            if i==0:
-                audiotype1 = type
-            else:
-                audiotype2 = type
-            #print(f'[INFO] get_audio_out shape ',frame.shape)
-            if self.opt.transport=='rtmp':                
-                self.streamer.stream_frame_audio(frame)
-            else: #webrtc
-                frame = (frame * 32767).astype(np.int16)
-                new_frame = AudioFrame(format='s16', layout='mono', samples=frame.shape[0])
-                new_frame.planes[0].update(frame.tobytes())
-                new_frame.sample_rate=16000
-                asyncio.run_coroutine_threadsafe(audio_track._queue.put(new_frame), loop)
-
-        # if self.opt.transport=='rtmp':
-        #     for _ in range(2):
-        #         frame,type = self.asr.get_audio_out()
-        #         audiotype += type
-        #         #print(f'[INFO] get_audio_out shape ',frame.shape)                
-        #         self.streamer.stream_frame_audio(frame)
-        # else: #webrtc
-        #     for _ in range(2):
-        #         frame,type = self.asr.get_audio_out()
-        #         audiotype += type
-        #         frame = (frame * 32767).astype(np.int16)
-        #         new_frame = AudioFrame(format='s16', layout='mono', samples=frame.shape[0])
-        #         new_frame.planes[0].update(frame.tobytes())
-        #         new_frame.sample_rate=16000
-        #         # if audio_track._queue.qsize()>10:
-        #         #     time.sleep(0.1)
-        #         asyncio.run_coroutine_threadsafe(audio_track._queue.put(new_frame), loop)  
-        #t = time.time()
-        if audiotype1!=0 and audiotype2!=0: #全为静音数据
-            self.speaking = False
-        else:
-            self.speaking = True
-            
-        if audiotype1!=0 and audiotype2!=0 and self.custom_index.get(audiotype1) is not None: #不为推理视频并且有自定义视频
-            mirindex = self.mirror_index(len(self.custom_img_cycle[audiotype1]),self.custom_index[audiotype1])
-            #imgindex  = self.mirror_index(self.customimg_index)
-            #print('custom img index:',imgindex)
-            #image = cv2.imread(os.path.join(self.opt.customvideo_img, str(int(imgindex))+'.png'))
-            image = self.custom_img_cycle[audiotype1][mirindex]
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            self.custom_index[audiotype1] += 1
+        # 一次处理 render_batch 帧: 先取出每帧的音频特征和音频输出, 需要推理的帧一起渲染(一次光线步进), 再按顺序推送音视频
+        frames = []
+        for _ in range(self.render_batch):
+            index = self.frame_index
+            self.frame_index = (self.frame_index + 1) % len(self.data_loader)
+            auds = self.asr.get_next_feat() if self.opt.asr else None # use the live audio stream
+            audio_frames = [self.asr.get_audio_out() for _ in range(2)]
+            silent = audio_frames[0][1]!=0 and audio_frames[1][1]!=0 #全为静音数据
+            custom = silent and self.custom_index.get(audio_frames[0][1]) is not None #不为推理视频并且有自定义视频
+            render = not custom and not (silent and self.idle_cycle is not None) #静音帧有预渲染的帧时不推理
+            frames.append((index,auds,audio_frames,silent,custom,render))
+
+        #推理视频
+        images = {}
+        render_frames = [i for i,frame in enumerate(frames) if frame[5]]
+        if render_frames:
+            data = self.dataset.collate([frames[i][0] for i in render_frames])
+            if self.opt.asr:
+                auds = [frames[i][1] for i in render_frames]
+                data['auds'] = auds[0] if len(auds)==1 else torch.stack(auds, dim=0)
+            outputs = self.trainer.test_gui_with_batch(data, self.W, self.H)
+            #print('-------ernerf time: ',time.time()-t)
+            #print(f'[INFO] outputs shape ',outputs['image'].shape)
+            for i,image in zip(render_frames,outputs['image']):
+                images[i] = (image * 255).astype(np.uint8)
+
+        for i,(index,auds,audio_frames,silent,custom,render) in enumerate(frames):
+            #send audio
+            for frame,type in audio_frames:
+                #print(f'[INFO] get_audio_out shape ',frame.shape)
+                if self.opt.transport=='rtmp':                
+                    self.streamer.stream_frame_audio(frame)
+                else: #webrtc
+                    frame = (frame * 32767).astype(np.int16)
+                    new_frame = AudioFrame(format='s16', layout='mono', samples=frame.shape[0])
+                    new_frame.planes[0].update(frame.tobytes())
+                    new_frame.sample_rate=16000
+                    asyncio.run_coroutine_threadsafe(audio_track._queue.put(new_frame), loop)
+
+            self.speaking = not silent
+            pose_index = self.dataset.mirror_index(index)
+            if render: #推理视频+贴回
+                image = compose_frame(self.opt, images[i], self.fullbody_list_cycle, pose_index)
+            elif not custom: #静音帧, 直接取预渲染的帧 (已贴回全身图)
+                image = np.asarray(self.idle_cycle[pose_index])
+            else: #自定义视频
+                audiotype = audio_frames[0][1]
+                mirindex = self.mirror_index(len(self.custom_img_cycle[audiotype]),self.custom_index[audiotype])
+                #imgindex  = self.mirror_index(self.customimg_index)
+                #print('custom img index:',imgindex)
+                #image = cv2.imread(os.path.join(self.opt.customvideo_img, str(int(imgindex))+'.png'))
+                image = self.custom_img_cycle[audiotype][mirindex]
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                self.custom_index[audiotype] += 1
             if self.opt.transport=='rtmp':
                 self.streamer.stream_frame(image)
             else:
                 new_frame = VideoFrame.from_ndarray(image, format="rgb24")
                 asyncio.run_coroutine_threadsafe(video_track._queue.put(new_frame), loop)
-        else: #推理视频+贴回
-            outputs = self.trainer.test_gui_with_data(data, self.W, self.H)
-            #print('-------ernerf time: ',time.time()-t)
-            #print(f'[INFO] outputs shape ',outputs['image'].shape)
-            image = (outputs['image'] * 255).astype(np.uint8)
-            if not self.opt.fullbody:
-                if self.opt.transport=='rtmp':
-                    self.streamer.stream_frame(image)
-                else:
-                    new_frame = VideoFrame.from_ndarray(image, format="rgb24")
-                    asyncio.run_coroutine_threadsafe(video_track._queue.put(new_frame), loop)
-            else: #fullbody human
-                #print("frame index:",data['index'])
-                #image_fullbody = cv2.imread(os.path.join(self.opt.fullbody_img, str(data['index'][0])+'.jpg'))
-                image_fullbody = self.fullbody_list_cycle[data['index'][0]]
-                #image_fullbody = self.imagecache.get_img(data['index'][0])
-                image_fullbody = cv2.cvtColor(image_fullbody, cv2.COLOR_BGR2RGB)                
-                start_x = self.opt.fullbody_offset_x  # 合并后小图片的起始x坐标
-                start_y = self.opt.fullbody_offset_y  # 合并后小图片的起始y坐标
-                image_fullbody[start_y:start_y+image.shape[0], start_x:start_x+image.shape[1]] = image
-                if self.opt.transport=='rtmp':
-                    self.streamer.stream_frame(image_fullbody)
-                else:
-                    new_frame = VideoFrame.from_ndarray(image_fullbody, format="rgb24")
-                    asyncio.run_coroutine_threadsafe(video_track._queue.put(new_frame), loop)
             #self.pipe.stdin.write(image.tostring())        
        
         #ender.record()
@@ -357,15 +392,19 @@ class NeRFReal(BaseReal):
             # update texture every frame
             # audio stream thread...
             t = time.perf_counter()
-            # run 2 ASR steps (audio is at 50FPS, video is at 25FPS)
-            for _ in range(2):
+            # run 2 ASR steps per frame (audio is at 50FPS, video is at 25FPS)
+            for _ in range(2*self.render_batch):
                 self.asr.run_step()
             self.test_step(loop,audio_track,video_track)
             totaltime += (time.perf_counter() - t)
-            count += 1
-            _totalframe += 1
-            if count==100:
+            count += self.render_batch
+            _totalframe += self.render_batch
+            if count>=100:
                 print(f"------actual avg infer fps:{count/totaltime:.4f}")
+                render_cache = self.trainer.model.render_cache
+                if render_cache is not None:
+                    stats = render_cache.stats()
+                    print(f"------render cache: hit rate {stats['hit_rate']:.2%}, {stats['entries']} frames, {stats['mb']:.0f}MB, {stats['evictions']} evicted")
                 count=0
                 totaltime=0
             if self.opt.transport=='rtmp':
@@ -0,0 +1,373 @@
+# question_pipeline.py
+"""
+批量题目生成流水线 (管理员导入课程 / 为知识点批量出题)
+
+    job = start_job(db, list_id, kps=[{"name", "description"}, ...])      # 只出题
+    job = start_job(db, list_id, course_texts=["...", "..."])              # 先抽取知识点再出题
+    get_job_snapshot(db, job.id)                                           # 进度 (管理员页面轮询)
+
+- 并发: 每个知识点 / 每段课程文本一个任务, 最多 GEN_CONCURRENCY 个同时调用模型
+- 重试: 调用失败时指数退避 + 抖动, 最多 GEN_MAX_ATTEMPTS 次
+- 流式解析: 模型输出边到边解析 (kimi_utils.StreamingQuestionParser), 题目一完整就进入去重 / 提交
+- 去重: 题干规整后精确比对 + rapidfuzz 相似度 (GEN_DUP_SIMILARITY), 同时与知识点已有题目比较
+- 批量提交: 每 GEN_COMMIT_BATCH 道题一个 WriteBatch, 写入 questions 子集合并累加 question_count
+- 进度: 快照写入 generation_jobs/{job_id} (最多每 GEN_PROGRESS_INTERVAL 秒一次, 状态变化时立即写),
+  命令行 (scripts/generate_questions.py) 启动的任务在 Web 进程的管理员页面也能看到
+
+测试时传入 llm=kimi_utils.StubLLM() 即可完全离线运行。
+"""
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from rapidfuzz import fuzz
+
+from db import Increment
+from kimi_utils import (KimiLLM, StreamingQuestionParser, build_kp_prompt,
+                        build_question_prompt, parse_kps_from_ai)
+
+GEN_CONCURRENCY = int(os.getenv("GEN_CONCURRENCY", "4"))
+GEN_MAX_ATTEMPTS = int(os.getenv("GEN_MAX_ATTEMPTS", "4"))
+GEN_BACKOFF_BASE = float(os.getenv("GEN_BACKOFF_BASE", "1.0"))
+GEN_COMMIT_BATCH = int(os.getenv("GEN_COMMIT_BATCH", "20"))
+GEN_DUP_SIMILARITY = float(os.getenv("GEN_DUP_SIMILARITY", "92"))
+GEN_PROGRESS_INTERVAL = float(os.getenv("GEN_PROGRESS_INTERVAL", "1.0"))
+JOBS_COLLECTION = 'generation_jobs'
+
+_RE_NON_WORD = re.compile(r"[^\w\s]")
+_RE_SPACES = re.compile(r"\s+")
+
+
+def parse_kp_spec(item):
+    """"Name: description" -> {"name", "description"}"""
+    name, _, description = item.partition(":")
+    return {"name": name.strip(), "description": description.strip()}
+
+
+def normalize_question(text):
+    """去重用的题干: 去掉选项, 小写, 去标点, 合并空白"""
+    stem = (text or "").split("\nOptions:", 1)[0]
+    stem = _RE_NON_WORD.sub(" ", stem.lower())
+    return _RE_SPACES.sub(" ", stem).strip()
+
+
+class QuestionDeduper:
+    """同一知识点内的近似重复判断 (线程安全)"""
+
+    def __init__(self, existing=(), threshold=GEN_DUP_SIMILARITY):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._stems = []
+        for q in existing:
+            self._remember(normalize_question(q.get('question')))
+
+    def _remember(self, stem):
+        self._keys.add(stem)
+        self._stems.append(stem)
+
+    def add(self, question):
+        """新题返回 True 并记录; 重复返回 False"""
+        stem = normalize_question(question.get('question'))
+        if not stem:
+            return False
+        with self._lock:
+            if stem in self._keys:
+                return False
+            for seen in self._stems:
+                if fuzz.token_sort_ratio(stem, seen) >= self.threshold:
+                    return False
+            self._remember(stem)
+            return True
+
+
+def job_ref(db, job_id):
+    return db.collection(JOBS_COLLECTION).document(job_id)
+
+
+class GenerationJob:
+    def __init__(self, list_id, created_by=None, store=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.list_id = list_id
+        self.created_by = created_by
+        self.status = "queued"        # queued / running / done / failed
+        self.stage = ""               # extract_kps / questions
+        self.kps_total = 0
+        self.kps_done = 0
+        self.texts_total = 0
+        self.texts_done = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.committed = 0
+        self.retries = 0
+        self.errors = []
+        self.per_kp = {}              # kp_name -> {"generated", "committed", "status"}
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.store = store            # 快照写入的数据库 (None 时只在内存里)
+        self._persisted_at = 0.0
+        self._lock = threading.Lock()
+
+    def bump(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+        self.persist()
+
+    def kp_update(self, kp_name, **fields):
+        with self._lock:
+            entry = self.per_kp.setdefault(kp_name, {"generated": 0, "committed": 0, "status": "queued"})
+            for k, v in fields.items():
+                entry[k] = entry[k] + v if isinstance(v, int) and k != "status" else v
+        self.persist()
+
+    def fail(self, message):
+        with self._lock:
+            self.errors.append(message)
+        print(f"[gen {self.id}] {message}")
+        self.persist()
+
+    def set_status(self, status):
+        self.status = status
+        self.persist(force=True)
+
+    def persist(self, force=False):
+        """把快照写入 generation_jobs/{id}; 非 force 时限流, 避免每道题都写一次"""
+        if self.store is None:
+            return
+        now = time.time()
+        with self._lock:
+            if not force and now - self._persisted_at < GEN_PROGRESS_INTERVAL:
+                return
+            self._persisted_at = now
+        try:
+            job_ref(self.store, self.id).set(self.snapshot())
+        except Exception as e:
+            print(f"[gen {self.id}] progress not saved: {e}")
+
+    def snapshot(self):
+        """管理员页面轮询用的进度快照 (可直接 jsonify)"""
+        with self._lock:
+            return {
+                "id": self.id,
+                "list_id": self.list_id,
+                "created_by": self.created_by,
+                "status": self.status,
+                "stage": self.stage,
+                "kps_total": self.kps_total,
+                "kps_done": self.kps_done,
+                "texts_total": self.texts_total,
+                "texts_done": self.texts_done,
+                "generated": self.generated,
+                "duplicates": self.duplicates,
+                "committed": self.committed,
+                "retries": self.retries,
+                "errors": list(self.errors[-20:]),
+                "per_kp": {k: dict(v) for k, v in self.per_kp.items()},
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+
+
+class BulkQuestionGenerator:
+    def __init__(self, db, llm=None, concurrency=GEN_CONCURRENCY, max_attempts=GEN_MAX_ATTEMPTS,
+                 backoff_base=GEN_BACKOFF_BASE, commit_batch=GEN_COMMIT_BATCH):
+        self.db = db
+        self.llm = llm or KimiLLM()
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.commit_batch = commit_batch
+
+    # ---------- 模型调用 (重试 + 退避) ----------
+    def _with_retry(self, job, label, fn):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                job.bump(retries=1)
+                delay = self.backoff_base * (2 ** (attempt - 1)) * (0.5 + random.random())
+                print(f"[gen {job.id}] {label}: attempt {attempt} failed ({e}), retry in {delay:.1f}s")
+                time.sleep(delay)
+
+    # ---------- 阶段 1: 课程文本 -> 知识点 ----------
+    def _extract_kps(self, job, text):
+        try:
+            raw = self._with_retry(job, "extract_kps", lambda: self.llm.chat(build_kp_prompt(text)))
+            return parse_kps_from_ai(raw)
+        except Exception as e:
+            job.fail(f"knowledge point extraction failed: {e}")
+            return []
+        finally:
+            job.bump(texts_done=1)
+
+    # ---------- 阶段 2: 知识点 -> 题目 ----------
+    def _load_kp(self, list_id, name, description):
+        from quiz_app import KnowledgePoint
+        kp = KnowledgePoint.get_by_name(self.db, list_id, name, include_questions=True)
+        if kp is None:
+            kp = KnowledgePoint(self.db, list_id, name, description)
+            kp.save()
+        elif kp.layout_version < KnowledgePoint.LAYOUT_VERSION:
+            # 旧布局先转成题目子集合, 之后才能按批追加
+            kp.save()
+        return kp
+
+    def _generate_for_kp(self, job, kp_info):
+        name = (kp_info.get("name") or "").strip()
+        description = kp_info.get("description") or ""
+        if not name:
+            job.bump(kps_done=1)
+            return
+        job.kp_update(name, status="running")
+        try:
+            kp = self._load_kp(job.list_id, name, description)
+            deduper = QuestionDeduper(kp.get_questions())
+            state = {
+                "next_order": len(kp.questions),
+                "pending": [],
+                "used_ids": {q.get('id') for q in kp.questions if q.get('id')},
+            }
+
+            def attempt():
+                # 每次重试重新解析; 已接收的题目由去重器挡住, 不会重复写入
+                parser = StreamingQuestionParser()
+                for chunk in self.llm.stream(build_question_prompt(name, description)):
+                    self._accept(job, kp, parser.feed(chunk), deduper, state)
+                self._accept(job, kp, parser.finish(), deduper, state)
+
+            self._with_retry(job, name, attempt)
+            self._flush(job, kp, state)
+            job.kp_update(name, status="done")
+        except Exception as e:
+            job.kp_update(name, status="failed")
+            job.fail(f"{name}: {e}")
+        finally:
+            job.bump(kps_done=1)
+
+    def _accept(self, job, kp, questions, deduper, state):
+        for q in questions:
+            if not deduper.add(q):
+                job.bump(duplicates=1)
+                continue
+            q["source"] = "ai"
+            state["pending"].append(q)
+            job.bump(generated=1)
+            job.kp_update(kp.name, generated=1)
+            if len(state["pending"]) >= self.commit_batch:
+                self._flush(job, kp, state)
+
+    def _flush(self, job, kp, state):
+        """把缓冲的题目追加到 questions 子集合, 同一个 WriteBatch 里累加 question_count"""
+        from quiz_app import KnowledgePoint
+        from kp_cache import invalidate_kp
+        pending, state["pending"] = state["pending"], []
+        if not pending:
+            return
+        doc_ref = KnowledgePoint._doc_ref(self.db, kp.list_id, kp.name)
+        batch = self.db.batch()
+        for q in pending:
+            qid = KnowledgePoint.question_id(q, state["used_ids"])
+            data = dict(q, id=qid, order=state["next_order"])
+            state["next_order"] += 1
+            batch.set(doc_ref.collection('questions').document(qid), data)
+        batch.set(doc_ref, {
+            'question_count': Increment(len(pending)),
+            'layout_version': KnowledgePoint.LAYOUT_VERSION,
+        }, merge=True)
+        batch.commit()
+        invalidate_kp(kp.list_id, kp.name)
+        job.bump(committed=len(pending))
+        job.kp_update(kp.name, committed=len(pending))
+
+    # ---------- 入口 ----------
+    def run(self, job, kps=None, course_texts=None):
+        job.set_status("running")
+        status = "failed"
+        t0 = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"gen-{job.id}") as pool:
+                kps = list(kps or [])
+                if course_texts:
+                    job.stage = "extract_kps"
+                    job.texts_total = len(course_texts)
+                    for found in pool.map(lambda t: self._extract_kps(job, t), course_texts):
+                        kps.extend(found)
+                # 同名知识点只生成一次
+                kps = list({(k.get("name") or "").strip(): k for k in kps}.values())
+
+                job.stage = "questions"
+                job.kps_total = len(kps)
+                for kp_info in kps:
+                    job.kp_update((kp_info.get("name") or "").strip(), status="queued")
+                list(pool.map(lambda k: self._generate_for_kp(job, k), kps))
+            status = "failed" if job.errors and not job.committed else "done"
+        except Exception as e:
+            job.fail(f"job aborted: {e}")
+            status = "failed"
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            job.set_status(status)
+            print(f"[gen {job.id}] {job.status}: {job.committed} questions committed, "
+                  f"{job.duplicates} duplicates skipped, {job.retries} retries "
+                  f"in {time.perf_counter() - t0:.1f}s")
+        return job
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_job(db, list_id, kps=None, course_texts=None, llm=None, created_by=None, background=True):
+    """创建并启动一个批量生成任务; background=False 时在当前线程跑完再返回"""
+    job = GenerationJob(list_id, created_by=created_by, store=db)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.persist(force=True)
+    generator = BulkQuestionGenerator(db, llm=llm)
+    if background:
+        threading.Thread(target=generator.run, args=(job, kps, course_texts),
+                         daemon=True, name=f"QuestionJob-{job.id}").start()
+    else:
+        generator.run(job, kps, course_texts)
+    return job
+
+
+def get_job(job_id):
+    """本进程启动的任务"""
+    return _jobs.get(job_id)
+
+
+def get_job_snapshot(db, job_id):
+    """任务进度: 本进程的任务直接取内存快照, 其他进程 (如命令行) 启动的从 generation_jobs 读取"""
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job.snapshot()
+    if db is None:
+        return None
+    snap = job_ref(db, job_id).get()
+    return snap.to_dict() if snap.exists else None
+
+
+def list_jobs(limit=20, db=None):
+    """最近的任务 (新的在前); 传入 db 时包括其他进程启动的任务"""
+    with _jobs_lock:
+        jobs = {j.id: j.snapshot() for j in _jobs.values()}
+    if db is not None:
+        try:
+            query = (db.collection(JOBS_COLLECTION)
+                       .order_by('created_at', direction='DESCENDING').limit(limit))
+            for doc in query.stream():
+                jobs.setdefault(doc.id, doc.to_dict() or {})
+        except Exception as e:
+            print(f"Could not list stored generation jobs: {e}")
+    ordered = sorted(jobs.values(), key=lambda p: p.get("created_at") or "", reverse=True)
+    return ordered[:limit]
@@ -3,6 +3,7 @@ import threading
 from flask.views import MethodView
 from datetime import datetime, timezone
 import math
+import hashlib
 import time
 import re
 from flask import (
@@ -12,6 +13,12 @@ from flask import (
 from markupsafe import Markup, escape
 from db import fire_db
 from user import User
+import wrong_stats
+from write_behind import commit_batch
+from kp_cache import get_kp_cache, invalidate_kp
+from report_service import get_report_service
+import question_pipeline
+from kimi_utils import format_stem, split_question_text, structure_question
 import socket
 import netifaces
 import os
@@ -457,6 +464,15 @@ class QuizApp:
             self.app.add_url_rule('/delete_account', 'quiz_delete_account', 
                                   self._wrap_route_handler(self.delete_account), 
                                   methods=['GET', 'POST'])
+            self.app.add_url_rule('/admin/generation', 'quiz_generation_jobs',
+                                  self._wrap_route_handler(self.generation_jobs),
+                                  methods=['GET'])
+            self.app.add_url_rule('/admin/generation', 'quiz_start_generation',
+                                  self._wrap_route_handler(self.start_generation),
+                                  methods=['POST'])
+            self.app.add_url_rule('/admin/generation/<string:job_id>', 'quiz_generation_progress',
+                                  self._wrap_route_handler(self.generation_progress),
+                                  methods=['GET'])
             # 不注册 /logout 和 /，避免与主应用冲突
         else:
             # 独立模式，正常注册所有路由
@@ -469,6 +485,9 @@ class QuizApp:
             self.app.route('/analysis')(self.analysis)
             self.app.route('/wrongbook')(self.wrongbook)
             self.app.route('/delete_account', methods=['GET', 'POST'])(self.delete_account)
+            self.app.route('/admin/generation')(self.generation_jobs)
+            self.app.route('/admin/generation', methods=['POST'])(self.start_generation)
+            self.app.route('/admin/generation/<string:job_id>')(self.generation_progress)
             self.app.route('/logout')(self.logout)
             self.app.route('/')(self.index)
             self.app.route('/server_error')(self.server_error)
@@ -479,8 +498,12 @@ class QuizApp:
             print("QuizApp routes registered successfully")
     
     def get_cached_knowledge_point(self, list_id, kp_name, include_questions=True):
-        """Load knowledge point directly (no long-lived cache to minimize memory)."""
-        return KnowledgePoint.get_by_name(self.db, list_id, kp_name, include_questions=include_questions)
+        """Load knowledge point through the process-wide read-through cache (see kp_cache.py)."""
+        return get_kp_cache(self.db).get(list_id, kp_name, include_questions=include_questions)
+
+    def get_question_page(self, kp, start, count):
+        """Load one page of questions through the knowledge point cache."""
+        return get_kp_cache(self.db).page(kp, start, count)
     
     def _wrap_route_handler(self, handler):
         """包装路由处理函数，从请求上下文获取正确的 quiz_app 实例"""
@@ -497,6 +520,56 @@ class QuizApp:
         wrapped_handler.__name__ = handler.__name__
         return wrapped_handler
 
+    def generation_jobs(self):
+        """批量出题任务列表 (JSON, 仅管理员)"""
+        if not session.get('is_admin'):
+            return jsonify({"error": "admin only"}), 403
+        return jsonify({"jobs": question_pipeline.list_jobs(db=self.db)})
+
+    def start_generation(self):
+        """
+        启动批量出题任务 (仅管理员)。表单 / JSON 字段:
+            list_id, kp_name (可选, 只为该知识点出题), kps ("Name: description" 每行一个), course_text
+        JSON 请求返回 202 + 任务快照; 表单请求渲染出题页面, 带 job_id 轮询进度
+        """
+        if not session.get('is_admin'):
+            return jsonify({"error": "admin only"}), 403
+        data = request.get_json(silent=True) if request.is_json else request.form
+        data = data or {}
+        list_id = (data.get('list_id') or '').strip()
+        kp_name = (data.get('kp_name') or '').strip()
+        if not list_id:
+            return jsonify({"error": "list_id is required"}), 400
+
+        kps = data.get('kps') or []
+        if isinstance(kps, str):
+            kps = kps.splitlines()
+        kps = [kp if isinstance(kp, dict) else question_pipeline.parse_kp_spec(kp) for kp in kps if kp]
+        kps = [kp for kp in kps if kp.get('name')]
+        kp = self.get_cached_knowledge_point(list_id, kp_name) if kp_name else None
+        if kp_name and not kps:
+            kps = [{"name": kp_name, "description": kp.description if kp else ""}]
+        course_text = (data.get('course_text') or '').strip()
+        if not kps and not course_text:
+            return jsonify({"error": "give kps, kp_name or course_text"}), 400
+
+        job = question_pipeline.start_job(self.db, list_id, kps=kps,
+                                          course_texts=[course_text] if course_text else None,
+                                          created_by=session.get('user_id'))
+        if request.is_json:
+            return jsonify(job.snapshot()), 202
+        return render_template('admin_generate_questions.html', job_id=job.id, list_id=list_id,
+                               kp_name=kp_name, questions=kp.get_questions() if kp else [])
+
+    def generation_progress(self, job_id):
+        """单个批量出题任务的进度 (JSON, 仅管理员; 管理员页面轮询); 命令行启动的任务从数据库读取"""
+        if not session.get('is_admin'):
+            return jsonify({"error": "admin only"}), 403
+        snapshot = question_pipeline.get_job_snapshot(self.db, job_id)
+        if snapshot is None:
+            return jsonify({"error": "job not found"}), 404
+        return jsonify(snapshot)
+
     def server_error(self):
         """服务器错误页面"""
         return """
@@ -516,40 +589,20 @@ class QuizApp:
         </html>
         """
 
+    # 题目入库时已解析出 stem / options (kimi_utils.structure_question), 模板直接渲染;
+    # 下面两个过滤器只用于没有结构化字段的文本
     class MCQHtmlFilter:
-        _re_options_split = re.compile(r'Options?\s*:\s*', flags=re.IGNORECASE)
-        _re_sentence_break = re.compile(r'([.?!])\s+')
-
         def __call__(self, text: str):
             if not text:
                 return ""
-            parts = self._re_options_split.split(text, maxsplit=1)
-            stem = (parts[0] if parts else text).strip()
-            stem = self._re_sentence_break.sub(r'\1\n', stem).replace("\\n", "\n")
-            html = "<br>".join(
-                escape(line.strip()) for line in stem.splitlines() if line.strip()
-            )
-            return Markup(html)
+            stem, _ = split_question_text(text)
+            return Markup("<br>".join(escape(line) for line in format_stem(stem or text).splitlines()))
 
     class ExtractMCQOptionsFilter:
-        _re_options_split = re.compile(r'Options?\s*:\s*', flags=re.IGNORECASE)
-        _re_tokenizer = re.compile(r'(?:(?<=^)|(?<=\s))([A-D])\.\s*')
-
         def __call__(self, text: str):
             if not text:
                 return []
-            parts = self._re_options_split.split(text, maxsplit=1)
-            if len(parts) != 2:
-                return []
-            opt_str = parts[1].strip()
-            tokens = self._re_tokenizer.split(opt_str)
-            out = []
-            for i in range(1, len(tokens), 2):
-                label = (tokens[i] or "").upper()
-                content = (tokens[i + 1] or "").strip()
-                if content:
-                    out.append((label, content))
-            return out
+            return [{"label": label, "text": content} for label, content in split_question_text(text)[1]]
 
     def _mcq_html_filter(self):
         return self.MCQHtmlFilter()
@@ -594,7 +647,7 @@ class QuizApp:
             session['user_id'] = "2"
             session['username'] = "2"
 
-        kps = KnowledgePoint.get_all_summary(self.db)
+        kps = get_kp_cache(self.db).summary()
         return render_template('dashboard.html', kps=kps, username=session.get('username'))
 
     def analysis(self):
@@ -602,29 +655,8 @@ class QuizApp:
             return redirect(self.get_url_for('login'))
 
         user_id = session['user_id']
-        wrong_questions_ref = self.db.collection('users').document(user_id).collection('wrong_questions')
-        keypoints = wrong_questions_ref.stream()
-        kp_stats = {}
-        weak_points = []
-
-        for keypoint_doc in keypoints:
-            keypoint_name = keypoint_doc.id
-            questions_ref = keypoint_doc.reference.collection('questions')
-            questions = questions_ref.stream()
-            wrong_count = 0
-
-            for question_doc in questions:
-                question_data = question_doc.to_dict()
-                user_answer = question_data.get('user_answer', '').strip()
-                std_answer = question_data.get('std_answer', '').strip()
-
-                if user_answer != std_answer:
-                    wrong_count += 1
-
-            if wrong_count > 0:
-                kp_stats[keypoint_name] = {'wrong': wrong_count}
-                if wrong_count >= 3:
-                    weak_points.append(keypoint_name)
+        # 读取按用户聚合的错题统计 (单个文档), 不再逐知识点扫描错题子集合
+        kp_stats, weak_points = wrong_stats.summarize(wrong_stats.load_wrong_stats(self.db, user_id))
 
         return render_template('analysis.html', username=session.get('username'),
                                kp_stats=kp_stats, weak_points=weak_points)
@@ -665,6 +697,7 @@ class QuizApp:
         if request.method == 'POST':
             user_id = session['user_id']
             self._delete_user_wrong_kp_index(user_id)
+            wrong_stats.stats_ref(self.db, user_id).delete()
 
             for rec in self.db.collection('answer_records').where('user_id', '==', user_id).stream():
                 self.db.collection('answer_records').document(rec.id).delete()
@@ -703,8 +736,8 @@ class AnswerRecord:
         self.ai_question = ai_question
         self.ai_answer = ai_answer
 
-    def save(self):
-        self.quiz_app.db.collection('answer_records').document().set({
+    def to_dict(self):
+        return {
             'user_id': self.user_id,
             'question_id': self.question_id,
             'user_answer': self.user_answer,
@@ -713,7 +746,15 @@ class AnswerRecord:
             'knowledge_point': self.knowledge_point,
             'ai_question': self.ai_question,
             'ai_answer': self.ai_answer
-        })
+        }
+
+    def save(self, batch=None):
+        """写入 answer_records; 传入 batch 时只加入批量写, 由调用方统一提交"""
+        doc_ref = self.quiz_app.db.collection('answer_records').document()
+        if batch is not None:
+            batch.set(doc_ref, self.to_dict())
+        else:
+            doc_ref.set(self.to_dict())
 
 
 class PracticeView(MethodView):
@@ -761,14 +802,14 @@ class PracticeView(MethodView):
         except (TypeError, ValueError):
             return 1
 
-    def _paginate_questions(self, questions, page):
-        total = len(questions)
+    def _paginate_questions(self, kp, page):
+        """按 question_count 计算分页, 只取当前页的题目"""
+        total = kp.question_count or 0
         page_size = self.PAGE_SIZE
         total_pages = max(1, math.ceil(total / page_size)) if total else 1
         page = max(1, min(page, total_pages))
         start = (page - 1) * page_size
-        end = start + page_size
-        subset = questions[start:end]
+        subset = self._get_quiz_app().get_question_page(kp, start, page_size) if total else []
         return {
             "questions": subset,
             "page": page,
@@ -783,12 +824,11 @@ class PracticeView(MethodView):
         if need:
             return need
 
-        kp, redir = self._get_kp_or_redirect(list_id, kp_name)
+        kp, redir = self._get_kp_or_redirect(list_id, kp_name, include_questions=False)
         if redir:
             return redir
 
-        questions = kp.questions or kp.get_questions()
-        pagination = self._paginate_questions(questions, self._get_page_from_request())
+        pagination = self._paginate_questions(kp, self._get_page_from_request())
         page_questions = pagination["questions"]
         if not page_questions:
             flash("No questions available for this knowledge point.")
@@ -808,7 +848,7 @@ class PracticeView(MethodView):
         if need:
             return need
 
-        kp, redir = self._get_kp_or_redirect(list_id, kp_name)
+        kp, redir = self._get_kp_or_redirect(list_id, kp_name, include_questions=False)
         if redir:
             return redir
 
@@ -819,8 +859,7 @@ class PracticeView(MethodView):
 
         user_id = session['user_id']
 
-        questions = kp.questions or kp.get_questions()
-        pagination = self._paginate_questions(questions, self._get_page_from_request())
+        pagination = self._paginate_questions(kp, self._get_page_from_request())
         page_questions = pagination["questions"]
         start_index = pagination["start_index"]
 
@@ -842,6 +881,12 @@ class PracticeView(MethodView):
         correct = 0
         results_map = {}
 
+        # 本页所有写入收集到一个 WriteBatch 中, 最后一次提交
+        batch = quiz_app.db.batch()
+        kp_ref = (quiz_app.db.collection('users').document(user_id)
+                  .collection('wrong_questions').document(kp_name))
+        kp_index_written = False
+
         for idx, q in enumerate(page_questions):
             q_text = q.get("question") or ""
             if not q_text:
@@ -859,7 +904,7 @@ class PracticeView(MethodView):
                     is_correct = True
                 else:
                     ua = self._pick_mcq(user_ans_raw)
-                    sa = self._pick_mcq(std_ans_raw)
+                    sa = q.get("answer_letter") or self._pick_mcq(std_ans_raw)
                     if ua and sa and ua == sa:
                         is_correct = True
 
@@ -877,7 +922,7 @@ class PracticeView(MethodView):
                     knowledge_point=kp_name,
                     ai_question=q_text,
                     ai_answer=std_ans_raw
-                ).save()
+                ).save(batch=batch)
 
                 # 错题写入错题本
                 if not is_correct:
@@ -888,11 +933,11 @@ class PracticeView(MethodView):
                         "user_answer": user_ans_raw,
                         "timestamp": now_ts,
                     }
-                    wrong_questions_ref = quiz_app.db.collection('users').document(user_id).collection('wrong_questions')
-                    kp_ref = wrong_questions_ref.document(kp_name)
-                    if not kp_ref.get().exists:
-                        kp_ref.set({'id': kp_name, 'list_id': list_id}, merge=True)
-                    kp_ref.collection('questions').add(wrong_answer_data)
+                    # 知识点索引文档每个请求只写一次 (merge 幂等, 无需先读 exists)
+                    if not kp_index_written:
+                        batch.set(kp_ref, {'id': kp_name, 'list_id': list_id}, merge=True)
+                        kp_index_written = True
+                    batch.set(kp_ref.collection('questions').document(), wrong_answer_data)
 
                 if is_correct:
                     correct += 1
@@ -904,6 +949,16 @@ class PracticeView(MethodView):
                 "explanation": explanation
             }
 
+        # 更新聚合错题统计 (Increment 原子累加), 与答题记录同一批提交
+        wrong_stats.record_answers(
+            quiz_app.db, user_id, kp_name, list_id,
+            attempted=answered, wrong=answered - correct, timestamp=now_ts, batch=batch
+        )
+        if answered:
+            commit_batch(batch, label=f"practice {user_id}/{kp_name}")
+            # 新增错题累计超过阈值时后台重新生成学习报告
+            get_report_service(quiz_app.db).note_answers(user_id, answered - correct)
+
         summary = {
             "answered": answered,
             "correct": correct,
@@ -923,12 +978,24 @@ class PracticeView(MethodView):
 
 
 class KnowledgePoint:
-    def __init__(self, db, list_id, name, description="", questions=None, question_count=None):
+    """
+    存储布局 (layout_version 2):
+      knowledge_points/{list_id}/items/{name}                  摘要: list / name / description / question_count
+      knowledge_points/{list_id}/items/{name}/questions/{qid}  题目: question / answer / explanation / order
+    旧布局 (layout_version 1) 把整个 questions 数组放在摘要文档里, 读取时仍然兼容,
+    可用 scripts/migrate_kp_questions.py 迁移。
+    """
+    LAYOUT_VERSION = 2
+    SUMMARY_FIELDS = ['list', 'name', 'description', 'question_count', 'layout_version']
+    BATCH_LIMIT = 500  # Firestore 单个 WriteBatch 的写入上限
+
+    def __init__(self, db, list_id, name, description="", questions=None, question_count=None, layout_version=LAYOUT_VERSION):
         self.db = db
         self.list_id = list_id
         self.name = name
         self.description = description
         self.questions = list(questions) if questions else []
+        self.layout_version = layout_version
         if question_count is not None:
             self.question_count = question_count
         else:
@@ -941,44 +1008,97 @@ class KnowledgePoint:
                   .collection('items')
                   .document(name))
 
+    @staticmethod
+    def question_id(q, used=None):
+        """题目的稳定 id: 优先使用已有 id, 否则取题干哈希; used 用于同一知识点内去重"""
+        qid = str(q.get('id') or '').strip()
+        if not qid:
+            qid = hashlib.sha1((q.get('question') or '').encode('utf-8')).hexdigest()[:20]
+        qid = qid.replace('/', '_')
+        if used is not None:
+            base, n = qid, 1
+            while qid in used:
+                n += 1
+                qid = f"{base}-{n}"
+            used.add(qid)
+        return qid
+
+    def _questions_ref(self):
+        return self._doc_ref(self.db, self.list_id, self.name).collection('questions')
+
     def save(self):
+        """
+        题目写入 / 旧题删除按 BATCH_LIMIT 分批提交 (Firestore 单个 WriteBatch 最多 500 次写入);
+        摘要文档放在最后一批, 读取方不会看到题目还没写完的摘要
+        """
         doc_ref = self._doc_ref(self.db, self.list_id, self.name)
-        doc_ref.set({
+
+        # 题目按 order 连续编号, 分页时按 order 范围查询; 入库前解析一次选项 / 答案字母
+        self.questions = [structure_question(q) for q in self.questions]
+        writes = []
+        used = set()
+        for order, q in enumerate(self.questions):
+            qid = self.question_id(q, used)
+            data = dict(q)
+            data['id'] = qid
+            data['order'] = order
+            writes.append((self._questions_ref().document(qid), data))
+        # 删除已经不存在的旧题目
+        for old in self._questions_ref().select([]).stream():
+            if old.id not in used:
+                writes.append((old.reference, None))
+        writes.append((doc_ref, {
             'list': self.list_id,
             'name': self.name,
             'description': self.description,
-            'questions': self.questions,
             'question_count': len(self.questions),
-        })
+            'layout_version': self.LAYOUT_VERSION,
+        }))
+
+        for start in range(0, len(writes), self.BATCH_LIMIT):
+            batch = self.db.batch()
+            for ref, data in writes[start:start + self.BATCH_LIMIT]:
+                if data is None:
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data)
+            batch.commit()
+        self.layout_version = self.LAYOUT_VERSION
+        invalidate_kp(self.list_id, self.name)
+
+    @staticmethod
+    def _from_snapshot(db, doc, include_questions=False):
+        data = doc.to_dict() or {}
+        layout_version = data.get('layout_version', 1)
+        questions_data = data.get('questions')
+        question_count = data.get('question_count')
+        if question_count is None:
+            question_count = len(questions_data) if questions_data else 0
+        kp = KnowledgePoint(
+            db,
+            data.get('list') or doc.reference.parent.parent.id,
+            data.get('name') or doc.id,
+            data.get('description', ""),
+            [structure_question(q) for q in questions_data] if (include_questions and questions_data) else [],
+            question_count=question_count,
+            layout_version=layout_version,
+        )
+        if include_questions and layout_version >= 2:
+            kp.get_questions()
+        return kp
 
     @staticmethod
     def get_all(db, list_id=None, include_questions=False):
-        kps = []
         if list_id:
-            docs = (db.collection('knowledge_points')
-                      .document(list_id)
-                      .collection('items')
-                      .stream())
+            query = (db.collection('knowledge_points')
+                       .document(list_id)
+                       .collection('items'))
         else:
-            docs = db.collection_group('items').stream()
-
-        for doc in docs:
-            data = doc.to_dict() or {}
-            questions_data = data.get('questions')
-            question_count = data.get('question_count')
-            if question_count is None:
-                question_count = len(questions_data) if questions_data else 0
-            questions = list(questions_data) if (include_questions and questions_data) else []
-            kp = KnowledgePoint(
-                db,
-                data.get('list') or doc.reference.parent.parent.id,
-                data.get('name') or doc.id,
-                data.get('description', ""),
-                questions,
-                question_count=question_count,
-            )
-            kps.append(kp)
-        return kps
+            query = db.collection_group('items')
+        if not include_questions:
+            # 摘要只需要这几个字段, 不下载整个 questions 数组
+            query = query.select(KnowledgePoint.SUMMARY_FIELDS)
+        return [KnowledgePoint._from_snapshot(db, doc, include_questions) for doc in query.stream()]
     
     @staticmethod
     def get_all_summary(db, list_id=None):
@@ -986,27 +1106,13 @@ class KnowledgePoint:
 
     @staticmethod
     def get_by_name(db, list_id, kp_name, include_questions=True):
-        doc_ref = (
-            db.collection('knowledge_points')
-            .document(list_id)
-            .collection('items')
-            .document(kp_name)
-        )
-        snap = doc_ref.get()
+        doc_ref = KnowledgePoint._doc_ref(db, list_id, kp_name)
+        if include_questions:
+            snap = doc_ref.get()
+        else:
+            snap = doc_ref.get(field_paths=KnowledgePoint.SUMMARY_FIELDS)
         if snap.exists:
-            data = snap.to_dict()
-            questions = data.get('questions', []) if include_questions else []
-            question_count = data.get('question_count')
-            if question_count is None:
-                question_count = len(data.get('questions', [])) if include_questions else 0
-            return KnowledgePoint(
-                db,
-                list_id=data['list'],
-                name=data['name'],
-                description=data['description'],
-                questions=questions,
-                question_count=question_count
-            )
+            return KnowledgePoint._from_snapshot(db, snap, include_questions)
         return None
     
     def get_questions(self):
@@ -1014,8 +1120,25 @@ class KnowledgePoint:
             return self.questions
         if not self.db:
             return []
-        doc = self._doc_ref(self.db, self.list_id, self.name).get()
-        data = doc.to_dict() or {}
-        self.questions = data.get('questions', []) or []
+        if self.layout_version >= 2:
+            self.questions = [
+                structure_question(dict(doc.to_dict() or {}, id=doc.id))
+                for doc in self._questions_ref().order_by('order').stream()
+            ]
+        else:
+            doc = self._doc_ref(self.db, self.list_id, self.name).get()
+            data = doc.to_dict() or {}
+            self.questions = [structure_question(q) for q in data.get('questions', []) or []]
         self.question_count = len(self.questions)
         return self.questions
+
+    def get_questions_page(self, start, count):
+        """只读取 [start, start + count) 这一页题目 (新布局下为 O(count) 次文档读取)"""
+        if self.questions or self.layout_version < 2:
+            return self.get_questions()[start:start + count]
+        docs = (self._questions_ref()
+                  .where('order', '>=', start)
+                  .where('order', '<', start + count)
+                  .order_by('order')
+                  .stream())
+        return [structure_question(dict(doc.to_dict() or {}, id=doc.id)) for doc in docs]
@@ -2,6 +2,7 @@ from __future__ import annotations
 import os
 import re
 import glob
+import threading
 import argparse
 from pathlib import Path
 from typing import List, Tuple, Dict
@@ -15,12 +16,29 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_deepseek import ChatDeepSeek
 
+from speech_text import SPEECH_MARKER, SpeechAnswerSplitter
+
 DATA_DIR = Path("Lecture")
 INDEX_DIR = Path("index/faiss")
 EMBED_MODEL = "BAAI/bge-m3"  # 多语种, 中英文都可
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 120
 TOP_K = 5
+
+# 进程内共享的 ChatDeepSeek 客户端, 按 (model, temperature) 区分
+_shared_llms = {}
+_shared_llms_lock = threading.Lock()
+
+
+def _shared_llm(model, temperature):
+    key = (model, temperature)
+    llm = _shared_llms.get(key)
+    if llm is None:
+        with _shared_llms_lock:
+            llm = _shared_llms.get(key)
+            if llm is None:
+                llm = _shared_llms[key] = ChatDeepSeek(model=model, temperature=temperature)
+    return llm
 # 直接在此填写你的 DeepSeek 密钥（不想用环境变量时）
 
 class rag():
@@ -123,7 +141,8 @@ class rag():
         # deepseek-chat 为 V3.1 的非思考模式, 响应更快
         # deepseek-reasoner 为思考模式, 更长上下文与推理能力, 但不支持工具调用
         # 参考官方文档与 LangChain 集成说明
-        return ChatDeepSeek(model=model, temperature=temperature)
+        # 同一 (model, temperature) 在进程内共用一个客户端 (连接池复用, ChatDeepSeek 线程安全)
+        return _shared_llm(model, temperature)
 
     def format_citations(self, docs: List[Document]) -> str:
         seen = set()
@@ -160,18 +179,21 @@ class rag():
             rows.append((src, pg, float(score), snippet))
         return rows
 
-    def rag_answer(self, question: str,
-                model: str = "deepseek-chat",
-                k: int = TOP_K) -> Dict:
+    def embed_query(self, text: str) -> List[float]:
+        """查询向量 (bge-m3, 已归一化); 意图识别与检索共用, 只算一次"""
+        return self.vs.embeddings.embed_query(text)
 
-        score_limit = self.SCORE_LIMIT
-        hits_with_score = self.vs.similarity_search_with_score(question, k=k)
+    def retrieve(self, question: str, k: int = TOP_K, query_vector=None) -> Dict:
+        """只做向量检索与上下文拼装 (不调用 LLM), 可以在意图判断之前提前执行"""
+        if query_vector is not None:
+            hits_with_score = self.vs.similarity_search_with_score_by_vector(
+                [float(x) for x in query_vector], k=k
+            )
+        else:
+            hits_with_score = self.vs.similarity_search_with_score(question, k=k)
         # print("[Debug] top-k scores:", [round(s, 3) for _, s in hits_with_score[:3]])
 
-        docs = [doc for doc, score in hits_with_score if score >= score_limit]
-
-        llm = self.get_llm(model=model)
-
+        docs = [doc for doc, score in hits_with_score if score >= self.SCORE_LIMIT]
 
         if docs:
             context = self.build_context(docs)
@@ -179,9 +201,11 @@ class rag():
             citations = self.format_citations(docs)
         else:
             context = "[None]"
-            citations = ""        
+            citations = ""
 
+        return {"docs": docs, "context": context, "citations": citations}
 
+    def build_prompts(self, question: str, context: str) -> Tuple[str, str]:
         system_prompt = (
             "Any question corresponding to your identity, you should call yourself City University of Hong Kong virtual teaching assistant."
             "You are a teaching assistant from City University of Hong Kong. Use the provided lecture excerpts to answer the user’s question. "
@@ -203,6 +227,19 @@ class rag():
             "\n"
             "For such questions, answer normally without any citations."
         )
+        return system_prompt, user_prompt
+
+    def rag_answer(self, question: str,
+                model: str = "deepseek-chat",
+                k: int = TOP_K,
+                retrieved: Dict = None) -> Dict:
+
+        if retrieved is None:
+            retrieved = self.retrieve(question, k=k)
+
+        llm = self.get_llm(model=model)
+
+        system_prompt, user_prompt = self.build_prompts(question, retrieved["context"])
 
         messages = [("system", system_prompt), ("human", user_prompt)]
         resp = llm.invoke(messages)
@@ -217,3 +254,64 @@ class rag():
 
         return resp.content
 
+    def rag_answer_with_speech(self, question: str,
+                history: List[Dict] = None,
+                model: str = "deepseek-chat",
+                k: int = TOP_K,
+                retrieved: Dict = None,
+                on_delta=None) -> Dict:
+        """
+        一次流式调用同时生成展示答案 (含引用) 和数字人播报文本,
+        替代 "rag_answer -> (结合历史再问一次) -> 口语化改写" 的多次串行调用。
+        on_delta(part, text) 会在流式过程中收到 "answer" / "speech" 增量。
+        """
+        if retrieved is None:
+            retrieved = self.retrieve(question, k=k)
+
+        llm = self.get_llm(model=model)
+
+        splitter = SpeechAnswerSplitter(on_delta)
+        for chunk in llm.stream(self.build_speech_messages(question, retrieved["context"], history)):
+            splitter.feed(chunk.content or "")
+        answer, speech = splitter.finish()
+
+        return {"answer": answer, "speech": speech, "citations": retrieved["citations"]}
+
+    async def arag_answer_with_speech(self, question: str,
+                history: List[Dict] = None,
+                model: str = "deepseek-chat",
+                k: int = TOP_K,
+                retrieved: Dict = None,
+                on_delta=None) -> Dict:
+        """rag_answer_with_speech 的异步版本: LLM 流式输出用 astream, 不占用线程池"""
+        if retrieved is None:
+            from async_runtime import run_blocking
+            retrieved = await run_blocking(self.retrieve, question, k=k)
+
+        llm = self.get_llm(model=model)
+
+        splitter = SpeechAnswerSplitter(on_delta)
+        async for chunk in llm.astream(self.build_speech_messages(question, retrieved["context"], history)):
+            splitter.feed(chunk.content or "")
+        answer, speech = splitter.finish()
+
+        return {"answer": answer, "speech": speech, "citations": retrieved["citations"]}
+
+    def build_speech_messages(self, question: str, context: str, history: List[Dict] = None) -> List[Tuple[str, str]]:
+        """组合生成模式的消息: 展示答案 + SPEECH_MARKER + 播报文本, 附带会话记忆 (摘要 + 最近轮次)"""
+        system_prompt, user_prompt = self.build_prompts(question, context)
+        system_prompt += (
+            "\nOutput format: first write the full answer for display (with citations as instructed). "
+            f"Then output a line containing only {SPEECH_MARKER} and after it a short spoken version of the same answer "
+            "in everyday conversational English for a talking avatar: no citations, no code, no markdown or symbols "
+            "(say 'percent' instead of '%', etc.), and do not change the content."
+        )
+
+        messages = [("system", system_prompt)]
+        # history 由 ConversationMemory 控制在 token 预算内; 只在末尾追加, 前缀在请求之间保持不变
+        roles = {"assistant": "ai", "system": "system"}
+        for turn in history or []:
+            role = roles.get(turn.get("role"), "human")
+            messages.append((role, turn.get("content", "")))
+        messages.append(("human", user_prompt))
+        return messages
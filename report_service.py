@@ -0,0 +1,209 @@
+# report_service.py
+"""
+学习报告预计算 (后台刷新)
+
+聊天里请求学习报告时不再现场扫描 + 调用大模型 (20-60 s), 而是直接返回最近一次生成的报告:
+
+    users/{user_id}/stats/learning_report
+        {
+            "version": 3,
+            "analysis": "...", "questions": [...],
+            "generated_at": <datetime>,
+            "basis": {"wrong": 12, "attempted": 40}   # 生成时的错题聚合
+        }
+
+- 触发: 练习提交后累计新增错题数, 超过 REPORT_REFRESH_THRESHOLD 就排队重新生成;
+  聊天读取报告时若发现聚合已偏离 basis 超过阈值, 也会排队
+- 去重: 每个用户同一时间最多一个生成任务, 期间新的触发只记一个 pending 标记
+- 限流: 同一用户两次生成至少间隔 REPORT_MIN_INTERVAL 秒 (期间的触发延后执行);
+  全局并发由 REPORT_WORKERS 个线程限制
+
+配置 (环境变量): REPORT_REFRESH_THRESHOLD (默认 3), REPORT_MIN_INTERVAL (默认 300), REPORT_WORKERS (默认 2)
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import wrong_stats
+
+REPORT_DOC = 'learning_report'
+REFRESH_THRESHOLD = int(os.getenv("REPORT_REFRESH_THRESHOLD", "3"))
+MIN_INTERVAL = float(os.getenv("REPORT_MIN_INTERVAL", "300"))
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+
+
+def report_ref(db, user_id):
+    return (db.collection('users').document(str(user_id))
+              .collection(wrong_stats.STATS_COLLECTION).document(REPORT_DOC))
+
+
+def has_data(kps):
+    """还没有任何作答 / 错题时不生成报告 (不调用大模型)"""
+    basis = stats_basis(kps or {})
+    return basis['attempted'] > 0 or basis['wrong'] > 0
+
+
+def stats_basis(kps):
+    """报告依据的聚合值: 错题总数 / 作答总数"""
+    return {
+        'wrong': sum(int(e.get('wrong') or 0) for e in kps.values()),
+        'attempted': sum(int(e.get('attempted') or 0) for e in kps.values()),
+    }
+
+
+class LearningReportService:
+    def __init__(self, db, workers=REPORT_WORKERS):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._in_flight = set()      # 正在生成 (或已排队) 的用户
+        self._pending = set()        # 生成期间又被触发, 完成后需要再跑一次
+        self._timers = {}            # user_id -> 限流期间延后执行的 Timer
+        self._last_started = {}      # user_id -> 上次开始生成的时间
+        self._unreported_wrong = {}  # user_id -> 上次生成之后新增的错题数 (进程内累计)
+        self.generated = 0
+
+    # ---------- 触发 ----------
+    def note_answers(self, user_id, wrong):
+        """练习提交后调用: 累计新增错题, 超过阈值时排队刷新"""
+        if wrong <= 0:
+            return
+        user_id = str(user_id)
+        with self._lock:
+            total = self._unreported_wrong.get(user_id, 0) + wrong
+            self._unreported_wrong[user_id] = total
+        if total >= REFRESH_THRESHOLD:
+            self.request_refresh(user_id)
+
+    def request_refresh(self, user_id):
+        """排队重新生成; 返回 True 表示已在生成中或已排队"""
+        user_id = str(user_id)
+        with self._lock:
+            if user_id in self._in_flight:
+                self._pending.add(user_id)
+                return True
+            if user_id in self._timers:
+                return True
+            wait = self._last_started.get(user_id, 0) + MIN_INTERVAL - time.time()
+            if wait > 0:
+                timer = threading.Timer(wait, self._timer_fired, args=(user_id,))
+                timer.daemon = True
+                self._timers[user_id] = timer
+                timer.start()
+                print(f"[report] {user_id}: rate limited, refresh in {wait:.0f}s")
+                return True
+            self._in_flight.add(user_id)
+            self._last_started[user_id] = time.time()
+            self._unreported_wrong[user_id] = 0
+        self._executor.submit(self._generate, user_id)
+        return True
+
+    def _timer_fired(self, user_id):
+        with self._lock:
+            self._timers.pop(user_id, None)
+        self.request_refresh(user_id)
+
+    def is_refreshing(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            return user_id in self._in_flight or user_id in self._timers
+
+    # ---------- 生成 ----------
+    def _generate(self, user_id):
+        from retrival import learning_report
+        from kimi_utils import kimi_personal_analysis
+        t0 = time.perf_counter()
+        try:
+            kps = wrong_stats.load_wrong_stats(self.db, user_id)
+            if not has_data(kps):
+                print(f"[report] {user_id}: no answers yet, skipped")
+                return
+            report = learning_report(self.db)
+            analysis, questions = report.parse_analysis(kimi_personal_analysis(report.build_prompt(user_id, kps)))
+
+            ref = report_ref(self.db, user_id)
+            snap = ref.get(field_paths=['version'])
+            version = int((snap.to_dict() or {}).get('version') or 0) + 1 if snap.exists else 1
+            ref.set({
+                'version': version,
+                'analysis': analysis,
+                'questions': questions,
+                'generated_at': datetime.now(timezone.utc),
+                'basis': stats_basis(kps),
+            })
+            self.generated += 1
+            print(f"[report] {user_id}: v{version} generated in {time.perf_counter() - t0:.1f}s")
+        except Exception as e:
+            print(f"[report] {user_id}: generation failed: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(user_id)
+                again = user_id in self._pending
+                self._pending.discard(user_id)
+            if again:
+                self.request_refresh(user_id)
+
+    # ---------- 读取 ----------
+    def get_report(self, user_id):
+        """
+        返回最近一次的报告 (可能为 None) 以及是否正在刷新:
+            {"analysis", "questions", "version", "generated_at", "refreshing", "no_data"}
+        报告缺失或聚合已明显变化时顺便排队刷新, 不等待结果; 用户还没有作答时 no_data 为 True, 不排队
+        """
+        user_id = str(user_id)
+        snap = report_ref(self.db, user_id).get()
+        data = snap.to_dict() if snap.exists else None
+        kps = wrong_stats.load_wrong_stats(self.db, user_id)
+        return self._resolve(user_id, data, kps)
+
+    async def get_report_async(self, adb, user_id):
+        """get_report 的异步版本 (adb 见 async_db.get_async_db)"""
+        user_id = str(user_id)
+        snap = await report_ref(adb, user_id).get()
+        data = snap.to_dict() if snap.exists else None
+        kps = await wrong_stats.load_wrong_stats_async(adb, user_id, db=self.db)
+        return self._resolve(user_id, data, kps)
+
+    def _resolve(self, user_id, data, kps):
+        if not has_data(kps):
+            return {"analysis": None, "questions": [], "version": 0, "generated_at": None,
+                    "refreshing": False, "no_data": True}
+        if data is None:
+            self.request_refresh(user_id)
+            return {"analysis": None, "questions": [], "version": 0, "generated_at": None,
+                    "refreshing": True, "no_data": False}
+        if self._is_stale(user_id, data, kps):
+            self.request_refresh(user_id)
+        return {
+            "analysis": data.get('analysis'),
+            "questions": data.get('questions') or [],
+            "version": data.get('version', 0),
+            "generated_at": data.get('generated_at'),
+            "refreshing": self.is_refreshing(user_id),
+            "no_data": False,
+        }
+
+    def _is_stale(self, user_id, data, kps):
+        """当前错题聚合与生成时的 basis 相差超过阈值即视为过期"""
+        basis = data.get('basis') or {}
+        current = stats_basis(kps or {})
+        return abs(current['wrong'] - int(basis.get('wrong') or 0)) >= REFRESH_THRESHOLD
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_report_service(db=None):
+    """进程内共享的报告服务 (第一次使用时需要传入 db)"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                if db is None:
+                    from db import fire_db
+                    db = fire_db()
+                _service = LearningReportService(db)
+    return _service
@@ -0,0 +1,41 @@
+# request_trace.py
+"""
+轻量请求耗时追踪: 记录每个阶段的起止时间, 打印各阶段耗时以及
+"串行总和 vs 实际墙钟时间", 用来观察并行 / 推测执行对关键路径的缩短效果。
+"""
+import time
+from contextlib import contextmanager
+
+
+class RequestTrace:
+    def __init__(self, name):
+        self.name = name
+        self.t0 = time.perf_counter()
+        self.spans = []  # (stage, start_ms, end_ms)
+
+    def _now_ms(self):
+        return (time.perf_counter() - self.t0) * 1000
+
+    @contextmanager
+    def span(self, stage):
+        start = self._now_ms()
+        try:
+            yield
+        finally:
+            self.spans.append((stage, start, self._now_ms()))
+
+    async def measure(self, stage, awaitable):
+        """await 一个协程 / 任务并记录耗时, 可以和 asyncio.create_task 组合做并行阶段"""
+        start = self._now_ms()
+        try:
+            return await awaitable
+        finally:
+            self.spans.append((stage, start, self._now_ms()))
+
+    def report(self):
+        wall = self._now_ms()
+        serial = sum(end - start for _, start, end in self.spans)
+        parts = ", ".join(f"{stage}={end - start:.1f}ms@{start:.0f}" for stage, start, end in self.spans)
+        print(f"[trace] {self.name}: wall={wall:.1f}ms serial_sum={serial:.1f}ms "
+              f"saved={max(0.0, serial - wall):.1f}ms | {parts}")
+        return {"wall_ms": wall, "serial_ms": serial, "spans": list(self.spans)}
@@ -2,26 +2,115 @@ import os
 import sys
 import re
 import textwrap
+import threading
 from typing import List
 from dotenv import load_dotenv
 from rapidfuzz import fuzz
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 from db import fire_db
 from user import User
+import wrong_stats
+from async_db import get_async_db
+from async_runtime import run_blocking
 from rag import rag
+from speech_text import speech_for_intent
+from report_service import get_report_service
+from intent_engine import get_intent_engine
 from quiz_app import QuizApp
 
-from kimi_utils import kimi_personal_analysis, kimi_chat, build_kp_prompt, build_question_prompt, extract_questions_from_ai, parse_kps_from_ai
+from kimi_utils import kimi_chat, build_kp_prompt, build_question_prompt, extract_questions_from_ai, parse_kps_from_ai
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, abort
 from langchain_deepseek import ChatDeepSeek
 
 DEEPSEEK_CHAT_MODEL = os.getenv("DEEPSEEK_CHAT_MODEL", "deepseek-chat")
 DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "sk-61cf109d660d4ba6a9d80ebf38737f06")
+# 1: 一次调用同时生成展示答案和播报文本; 0: 沿用 rae + avatar_text 两段式调用
+COMBINED_SPEECH = os.getenv("COMBINED_SPEECH", "1") == "1"
+
+# 进程内共享的模型客户端 (配置完全相同, 各服务共用一份连接池; OpenAI / ChatDeepSeek 客户端线程安全)
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def _shared_client(key, factory):
+    client = _shared_clients.get(key)
+    if client is None:
+        with _shared_clients_lock:
+            client = _shared_clients.get(key)
+            if client is None:
+                client = _shared_clients[key] = factory()
+    return client
+
+
+def deepseek_client():
+    return _shared_client("openai", lambda: OpenAI(api_key=DEEPSEEK_API_KEY or None, base_url=DEEPSEEK_BASE_URL))
+
+
+def deepseek_aclient():
+    """aiohttp handler 使用的异步客户端"""
+    return _shared_client("async_openai", lambda: AsyncOpenAI(api_key=DEEPSEEK_API_KEY or None, base_url=DEEPSEEK_BASE_URL))
+
+
+def deepseek_llm(model: str = "deepseek-chat", temperature: float = 0.2) -> ChatDeepSeek:
+    # 需要 DEEPSEEK_API_KEY
+    # deepseek-chat 为 V3.1 的非思考模式, 响应更快
+    # deepseek-reasoner 为思考模式, 更长上下文与推理能力, 但不支持工具调用
+    # 参考官方文档与 LangChain 集成说明
+    return _shared_client(("chat_deepseek", model, temperature),
+                          lambda: ChatDeepSeek(model=model, temperature=temperature))
+
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a tutoring conversation between a student and a C++ teaching assistant. "
+    "Merge the previous summary with the new turns into one concise summary. Keep the topics discussed, "
+    "the student's questions, misconceptions and progress, and anything the assistant promised to follow up on. "
+    "Write plain English prose, no lists, no greetings."
+)
+
+
+def summarize_conversation(summary, turns, max_tokens=300):
+    """conversation_memory 折叠旧轮次时调用: 旧摘要 + 若干轮 -> 新摘要"""
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    resp = deepseek_client().chat.completions.create(
+        model=DEEPSEEK_CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Previous summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"},
+        ],
+        temperature=0,
+        max_tokens=max_tokens,
+    )
+    return resp.choices[0].message.content
+
+
+class ChatContext:
+    """
+    一次请求的用户上下文, 由调用方传给共享的 re_and_exc / avatar_text:
+    user 与对话历史只属于这一次请求, 服务对象本身不保存任何用户状态
+    """
+    def __init__(self, user, history=None):
+        self.user = user
+        self.username = str(user.username)
+        self.history = list(history or [])
+        # 本次请求读取到的学习报告状态 (version / refreshing 等), 由 generate_learning_report 填入
+        self.report_status = None
+
 
 class re_and_exc():
-    def __init__(self, user : User, shared_rag=None):
+    QUIZ_PROMPT = (
+        "You are a virtual digital human who speaks English. Now, a user wants to take a test, and you need to tell them you are ready and ask them to follow the instructions on the webpage."
+        "This response should be very brief, simply prompting the user to view the webpage content."
+    )
+    UNKNOWN_PROMPT = (
+        "You are a virtual, English-speaking digital human. You don't understand what the user is saying now."
+        "You want the user to say it again."
+        "This answer should be very brief."
+    )
+
+    def __init__(self, shared_rag=None, db=None):
+        """所有用户共享一个实例; 用户与对话历史通过 ChatContext 按请求传入"""
 
         load_dotenv()
         """
@@ -50,25 +139,17 @@ class re_and_exc():
         self.USE_LLM_FALLBACK = True
         self.LLM_FALLBACK_THRESHOLD = 55
 
-        self.client = OpenAI(
-            api_key=DEEPSEEK_API_KEY or None,
-            base_url=DEEPSEEK_BASE_URL
-        )
+        self.client = deepseek_client()
+        self.aclient = deepseek_aclient()
 
         self.SYSTEM_PROMPT = (
             "You are a helpful study assistant.\n"
             "If uncertain, say so and give possible directions."
         )
 
-        self.history = []
-
-        self.fdb = fire_db()
-
-        self.answer = [None, None]
-
-        self.user = user
+        self.fdb = db or fire_db()
 
-        self.analysis = learning_report(user)
+        self.analysis = learning_report(self.fdb)
 
         # 使用共享 RAG 实例（如果提供）或创建新的（向后兼容）
         if shared_rag is not None:
@@ -147,32 +228,33 @@ class re_and_exc():
         return "NORMAL_CHAT"
 
     def build_messages(self, user_input, history):
+        # history 来自 ConversationMemory, 已按 token 预算截断, 这里不再切片 (保持前缀稳定)
         messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
-        for turn in history[-8:]:
+        for turn in history:
             messages.append(turn)
         messages.append({"role": "user", "content": user_input})
         return messages
 
+    def _as_messages(self, system_prompt):
+        # 确保 messages 是列表格式，而不是字符串
+        if isinstance(system_prompt, str):
+            # 如果传入的是字符串，转换为正确的消息格式
+            return [
+                {"role": "system", "content": system_prompt}
+            ]
+        elif isinstance(system_prompt, list):
+            # 如果已经是列表格式，直接使用
+            return system_prompt
+        # 其他情况转换为字符串
+        return [
+            {"role": "system", "content": str(system_prompt)}
+        ]
+
     def chat_with_model(self, system_prompt):
         try:
-            # 确保 messages 是列表格式，而不是字符串
-            if isinstance(system_prompt, str):
-                # 如果传入的是字符串，转换为正确的消息格式
-                messages = [
-                    {"role": "system", "content": system_prompt}
-                ]
-            elif isinstance(system_prompt, list):
-                # 如果已经是列表格式，直接使用
-                messages = system_prompt
-            else:
-                # 其他情况转换为字符串
-                messages = [
-                    {"role": "system", "content": str(system_prompt)}
-                ]
-        
             resp = self.client.chat.completions.create(
                 model=self.model,
-                messages=messages,  # 这里应该是列表，不是字符串
+                messages=self._as_messages(system_prompt),  # 这里应该是列表，不是字符串
                 stream=False,
             )
             return resp.choices[0].message.content
@@ -181,17 +263,43 @@ class re_and_exc():
             print(f"Error in chat_with_model: {e}")
             return f"Sorry, I encountered an error: {str(e)}"
 
-    def generate_learning_report(self, user_input, history):
-        #docs = self.fdb.read_wq(user="1")
-        print("成功进入generate_learning_report！")
-        report, question = self.analysis.ai_analysis()
-        return report
-        #print("report:", report)
-        #print("question:", question)
-        #print(docs)
+    async def achat_with_model(self, system_prompt):
+        """chat_with_model 的异步版本 (AsyncOpenAI)"""
+        try:
+            resp = await self.aclient.chat.completions.create(
+                model=self.model,
+                messages=self._as_messages(system_prompt),
+                stream=False,
+            )
+            return resp.choices[0].message.content
 
+        except Exception as e:
+            print(f"Error in achat_with_model: {e}")
+            return f"Sorry, I encountered an error: {str(e)}"
+
+    def generate_learning_report(self, ctx, user_input):
+        """返回预先生成的学习报告 (见 report_service.py), 不在请求内调用大模型"""
+        print("成功进入generate_learning_report！")
+        ctx.report_status = get_report_service(self.fdb).get_report(ctx.username)
+        return self._format_report(ctx.report_status)
 
-        return "generate learning report"
+    async def generate_learning_report_async(self, ctx, user_input):
+        print("成功进入generate_learning_report！")
+        ctx.report_status = await get_report_service(self.fdb).get_report_async(
+            get_async_db(), ctx.username)
+        return self._format_report(ctx.report_status)
+
+    def _format_report(self, report):
+        if report.get("no_data"):
+            return ("You haven't answered any quiz questions yet, so there is nothing to analyse. "
+                    "Try some practice questions first, then ask me for your learning report.")
+        if not report["analysis"]:
+            return ("Your learning report is being generated from your quiz results. "
+                    "Please ask me again in a minute.")
+        answer = report["analysis"]
+        if report["refreshing"]:
+            answer += "\n\n_(Updating this report with your latest answers...)_"
+        return answer
 
     def list_lesson_points(self, user_input, history):
         #docs = self.fdb.read_wq(user="1")
@@ -199,29 +307,28 @@ class re_and_exc():
         out = self.course_rag.rag_answer(question=user_input)
         return out["answer"]
 
-    def user_answer(self, user_input, intent, conversation_history=None):
+    def user_answer(self, ctx, user_input, intent, retrieved=None):
         """
         处理用户输入并生成回复
         
         Args:
+            ctx: 本次请求的 ChatContext (用户 + 对话历史，格式为 [{"role": "user/assistant", "content": "..."}])
             user_input: 用户输入的文本
             intent: 意图分类结果
-            conversation_history: 对话历史记录列表，格式为 [{"role": "user/assistant", "content": "..."}]
+            retrieved: 预先完成的检索结果 (rag.retrieve 的返回值)，为 None 时现场检索
         """
-        # 如果提供了对话历史，使用它；否则使用实例的历史
-        if conversation_history is not None:
-            self.history = conversation_history
-            print(f"Using provided conversation history: {len(self.history)} messages")
+        history = ctx.history
+        print(f"Using provided conversation history: {len(history)} messages")
         
         print("intent:", intent)
         if intent == "LEARNING_REPORT":
-            answer = self.generate_learning_report(user_input, self.history)
+            answer = self.generate_learning_report(ctx, user_input)
         elif intent == "NORMAL_CHAT":
             # 对于普通对话，结合历史记录和 RAG 结果
-            rag_answer = self.course_rag.rag_answer(question=user_input)
+            rag_answer = self.course_rag.rag_answer(question=user_input, retrieved=retrieved)
             
             # 如果有对话历史，让 LLM 结合历史和 RAG 结果回答
-            if self.history and len(self.history) > 0:
+            if history:
                 context_prompt = f"""You are a helpful C++ course assistant. 
 Based on the course materials and conversation history, answer the user's question.
 
@@ -229,7 +336,7 @@ Course material answer: {rag_answer}
 
 Please provide a contextually appropriate response considering the conversation history."""
                 
-                messages = self.build_messages(user_input, self.history)
+                messages = self.build_messages(user_input, history)
                 # 在系统提示中添加 RAG 内容
                 messages[0]["content"] = context_prompt
                 answer = self.chat_with_model(messages)
@@ -237,69 +344,68 @@ Please provide a contextually appropriate response considering the conversation
                 answer = rag_answer
                 
         elif intent == "QUIZ":
-            system_prompt = (
-                "You are a virtual digital human who speaks English. Now, a user wants to take a test, and you need to tell them you are ready and ask them to follow the instructions on the webpage."
-                "This response should be very brief, simply prompting the user to view the webpage content."
-            )
-            
-            answer = self.chat_with_model(system_prompt)
+            answer = self.chat_with_model(self.QUIZ_PROMPT)
         else:
-            system_prompt = (
-                "You are a virtual, English-speaking digital human. You don't understand what the user is saying now."
-                "You want the user to say it again."
-                "This answer should be very brief."
-            )
             # 构建消息列表
-            messages = [{"role": "system", "content": system_prompt}]
+            messages = [{"role": "system", "content": self.UNKNOWN_PROMPT}]
             answer = self.chat_with_model(messages)
 
         return answer
 
-class learning_report():
-    def __init__(self, user : User):
-        self.fdb = fire_db()
-        self.user = user
-        self.username = str(user.username)
-        print("self.username:", self.username)
-    
-    def ai_analysis(self):
-        print("start analysis")
-        wrong_questions_ref = self.fdb.read_wq('users', self.username, 'wrong_questions')
-        keypoints = list(wrong_questions_ref.stream())
-        print(f"[debug] user={self.username} keypoints_count={len(keypoints)}")
-        kp_stats = {} 
-        weak_points = []  
-
-        for idx, keypoint_doc in enumerate(keypoints):
-            keypoint_name = keypoint_doc.id  
-            print(f"[debug] keypoint[{idx}]={keypoint_name}")
+    def user_answer_with_speech(self, ctx, user_input, intent, on_delta=None, retrieved=None):
+        """
+        组合生成模式: 返回 (展示答案, 播报文本)
 
-            questions_ref = keypoint_doc.reference.collection('questions')
-            questions = list(questions_ref.stream())
-            print(f"[debug]   questions_count={len(questions)}")
+        NORMAL_CHAT 只做一次流式 LLM 调用 (检索 + 历史 + 口语版本一起生成);
+        其他意图沿用 user_answer, 播报文本由本地规整得到, 不再额外调用改写模型。
+        """
+        if intent == "NORMAL_CHAT":
+            print("intent:", intent)
+            out = self.course_rag.rag_answer_with_speech(
+                question=user_input, history=ctx.history, on_delta=on_delta, retrieved=retrieved
+            )
+            return out["answer"], out["speech"]
 
-            wrong_count = 0
+        answer = self.user_answer(ctx, user_input, intent)
+        return answer, speech_for_intent(answer, intent, self._report_ready(ctx, intent), self._report_no_data(ctx, intent))
 
-            for q_idx, question_doc in enumerate(questions):
-                question_data = question_doc.to_dict()
-                print(f"[debug]     question[{q_idx}] data={question_data}")
-                user_answer = question_data.get('user_answer', '').strip()
-                std_answer = question_data.get('std_answer', '').strip()
+    def _report_ready(self, ctx, intent):
+        return intent != "LEARNING_REPORT" or bool(ctx.report_status and ctx.report_status["analysis"])
 
-                if user_answer != std_answer:
-                    wrong_count += 1
+    def _report_no_data(self, ctx, intent):
+        return intent == "LEARNING_REPORT" and bool(ctx.report_status and ctx.report_status.get("no_data"))
 
-            if wrong_count > 0:
-                kp_stats[keypoint_name] = {
-                    'wrong': wrong_count 
-                }
+    async def user_answer_with_speech_async(self, ctx, user_input, intent, on_delta=None, retrieved=None):
+        """
+        user_answer_with_speech 的异步版本, 供 aiohttp handler 直接 await:
+        LLM 调用用 astream / AsyncOpenAI, 数据读取用 async_db, 不占用线程池
+        """
+        print("intent:", intent)
+        if intent == "NORMAL_CHAT":
+            out = await self.course_rag.arag_answer_with_speech(
+                question=user_input, history=ctx.history, on_delta=on_delta, retrieved=retrieved
+            )
+            return out["answer"], out["speech"]
 
+        if intent == "LEARNING_REPORT":
+            answer = await self.generate_learning_report_async(ctx, user_input)
+        elif intent == "QUIZ":
+            answer = await self.achat_with_model(self.QUIZ_PROMPT)
+        else:
+            answer = await self.achat_with_model([{"role": "system", "content": self.UNKNOWN_PROMPT}])
+        return answer, speech_for_intent(answer, intent, self._report_ready(ctx, intent), self._report_no_data(ctx, intent))
 
-                if wrong_count >= 3:  
-                    weak_points.append(keypoint_name)
+class learning_report():
+    """学习报告的提示词构建与解析 (无用户状态, 各用户共用; 用户名按调用传入)"""
+    def __init__(self, db=None):
+        self.fdb = db or fire_db()
+    
+    def build_prompt(self, username, kps):
+        kp_stats, weak_points = wrong_stats.summarize(kps)
+        print(f"[debug] user={username} keypoints_count={len(kp_stats)}")
 
         user_data = {
-            "user_id": self.username,
+            "user_id": str(username),
             "knowledge_points": kp_stats,   
             "weak_points": weak_points
         }
@@ -338,10 +444,9 @@ class learning_report():
             "Student answer data:"
             f"{user_data}"
         )
+        return prompt
 
-
-        analysis_text = kimi_personal_analysis(prompt)
-    
+    def parse_analysis(self, analysis_text):
         questions_ai = extract_questions_from_ai(analysis_text)
 
         analysis_text = re.sub(r'([.!?])', r'\1\n', analysis_text)
@@ -358,7 +463,7 @@ class learning_report():
 
 
 class intent():
-    def __init__(self, user : User):
+    def __init__(self, shared_rag=None):
         self.INTENT_KB = {
             "LEARNING_REPORT": {
                 "must_any": [
@@ -376,89 +481,82 @@ class intent():
         }
         
         self.USE_LLM_FALLBACK = True
-        self.LLM_FALLBACK_THRESHOLD = 55
-    
-    def _score_intent(self, text, intent):
-        """Return similarity score (0–100)."""
-        kb = self.INTENT_KB[intent]
-        base = 0
-        for kw in kb["must_any"]:
-            base = max(base, fuzz.partial_ratio(kw, text))
 
-        verb_bonus = 0
-        for v in kb["verbs"]:
-            if v in text:
-                verb_bonus += 6
-                if verb_bonus >= 18:
-                    break
+        self.client = deepseek_client()
+        self.aclient = deepseek_aclient()
 
-        length_penalty = 0
-        if len(text) < 4 or len(text) > 120:
-            length_penalty = 5
+        # 本地意图引擎: 关键词自动机 + 复用 RAG bge-m3 向量的原型分类器 (进程内共享)
+        embeddings = shared_rag.vs.embeddings if shared_rag is not None else None
+        self.engine = get_intent_engine(self.INTENT_KB, embeddings)
 
-        return max(0, min(100, base + verb_bonus - length_penalty))
+    def _intent_request(self, user_input):
+        prompt = (
+            "You are classifying the user's intent for a C++ course assistant.\n"
+            "You MUST output exactly one label: LEARNING_REPORT, QUIZ, NORMAL_CHAT.\n\n"
+            "- LEARNING_REPORT: ONLY if the user explicitly asks for a study/learning report or overall learning summary "
+            "(e.g., 'show me my learning report', 'generate my study summary for this course').\n"
+            "- QUIZ: if the user clearly wants to practice, take a quiz, do exercises, or test themselves.\n"
+            "- NORMAL_CHAT: for everything else, including asking concepts, explaining code, etc.\n\n"
+            f"User input: {user_input}\n"
+            "Label:"
+        )
+        return dict(
+            model=DEEPSEEK_CHAT_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=5,
+        )
 
-    def _llm_intent_fallback(self, user_input):
-        """classify intent via LLM into LEARNING_REPORT / LESSON_POINTS / NORMAL_CHAT."""
+    def _parse_intent_tag(self, resp, default):
+        tag = (resp.choices[0].message.content or "").strip().upper()
+        if tag in {"LEARNING_REPORT", "QUIZ", "NORMAL_CHAT"}:
+            return tag
+        return default
+
+    def _llm_intent_fallback(self, user_input, default="NORMAL_CHAT"):
+        """classify intent via LLM into LEARNING_REPORT / QUIZ / NORMAL_CHAT."""
         try:
-            prompt = (
-                "You are classifying the user's intent for a C++ course assistant.\n"
-                "You MUST output exactly one label: LEARNING_REPORT, QUIZ, NORMAL_CHAT.\n\n"
-                "- LEARNING_REPORT: ONLY if the user explicitly asks for a study/learning report or overall learning summary "
-                "(e.g., 'show me my learning report', 'generate my study summary for this course').\n"
-                "- QUIZ: if the user clearly wants to practice, take a quiz, do exercises, or test themselves.\n"
-                "- NORMAL_CHAT: for everything else, including asking concepts, explaining code, etc.\n\n"
-                f"User input: {user_input}\n"
-                "Label:"
-            )
-            resp = self.client.chat.completions.create(
-                model=DEEPSEEK_CHAT_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                max_tokens=5,
-            )
-            tag = (resp.choices[0].message.content or "").strip().upper()
-            if tag in {"LEARNING_REPORT", "QUIZ", "NORMAL_CHAT"}:
-                return tag
+            resp = self.client.chat.completions.create(**self._intent_request(user_input))
+            return self._parse_intent_tag(resp, default)
         except Exception:
-            pass
-        return "NORMAL_CHAT"
-
-    def route_intent(self, user_input):
-        """Route intent using fuzzy scores + optional LLM fallback."""
-        s = user_input.strip().lower()
-
-        scores = {
-            "LEARNING_REPORT": self._score_intent(s, "LEARNING_REPORT"),
-            "QUIZ": self._score_intent(s, "QUIZ")
-        }
-        best_intent = max(scores, key=scores.get)
-        best_score = scores[best_intent]
-
-        THRESH = 75
-        if best_score >= THRESH:
-            return best_intent
-
-        if self.USE_LLM_FALLBACK and best_score <= self.LLM_FALLBACK_THRESHOLD:
-            return self._llm_intent_fallback(user_input)
+            return default
 
-        return "NORMAL_CHAT"
+    async def _allm_intent_fallback(self, user_input, default="NORMAL_CHAT"):
+        try:
+            resp = await self.aclient.chat.completions.create(**self._intent_request(user_input))
+            return self._parse_intent_tag(resp, default)
+        except Exception:
+            return default
+
+    def classify_local(self, user_input, query_vector=None):
+        """只用本地引擎判断, 返回 (intent, confident); 不会发起网络请求"""
+        return self.engine.classify(user_input, query_vector)
+
+    def route_intent(self, user_input, query_vector=None):
+        """Route intent using the local engine; LLM fallback only for low-confidence cases."""
+        label, confident = self.classify_local(user_input, query_vector)
+        if confident or not self.USE_LLM_FALLBACK:
+            return label
+        return self._llm_intent_fallback(user_input, default=label)
+
+    async def aroute_intent(self, user_input, query_vector=None):
+        """route_intent 的异步版本: 本地判断 (需要时在线程池里现算向量), LLM 兜底用 AsyncOpenAI"""
+        if query_vector is None and self.engine.classifier is not None:
+            label, confident = await run_blocking(self.classify_local, user_input)
+        else:
+            label, confident = self.classify_local(user_input, query_vector)
+        if confident or not self.USE_LLM_FALLBACK:
+            return label
+        return await self._allm_intent_fallback(user_input, default=label)
 
 class avatar_text():
-    def __init__(self, user : User):
-        self.client = OpenAI(
-            api_key=DEEPSEEK_API_KEY or None,
-            base_url=DEEPSEEK_BASE_URL
-        )
+    def __init__(self):
+        self.client = deepseek_client()
 
         self.llm = self.get_llm(model="deepseek-chat")
 
     def get_llm(self, model: str = "deepseek-chat", temperature: float = 0.2) -> ChatDeepSeek:
-        # 需要 DEEPSEEK_API_KEY
-        # deepseek-chat 为 V3.1 的非思考模式, 响应更快
-        # deepseek-reasoner 为思考模式, 更长上下文与推理能力, 但不支持工具调用
-        # 参考官方文档与 LangChain 集成说明
-        return ChatDeepSeek(model=model, temperature=temperature)
+        return deepseek_llm(model=model, temperature=temperature)
 
 
     def chat_with_model(self, user_input, history):
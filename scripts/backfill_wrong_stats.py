@@ -0,0 +1,35 @@
+# scripts/backfill_wrong_stats.py
+"""
+为已有用户回填聚合错题统计 (users/{u}/stats/wrong_answers)。
+
+用法:
+    python scripts/backfill_wrong_stats.py            # 所有用户
+    python scripts/backfill_wrong_stats.py dya 2      # 指定用户
+"""
+import os
+import sys
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from db import fire_db
+import wrong_stats
+
+
+def backfill(usernames=None):
+    db = fire_db()
+    if not usernames:
+        usernames = [doc.id for doc in db.collection('users').stream()]
+
+    for username in usernames:
+        kps = wrong_stats.rebuild_wrong_stats(db, username)
+        total_wrong = sum(int(v.get('wrong') or 0) for v in kps.values())
+        print(f"{username}: {len(kps)} knowledge points, {total_wrong} wrong answers")
+
+    print(f"Backfilled {len(usernames)} user(s).")
+
+
+if __name__ == "__main__":
+    backfill(sys.argv[1:])
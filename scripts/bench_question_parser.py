@@ -0,0 +1,168 @@
+# scripts/bench_question_parser.py
+"""
+题目解析基准: 旧的多遍正则解析 vs 单遍状态机 (kimi_utils.parse_question_set)
+
+    python scripts/bench_question_parser.py                    # 200 个知识点 x 25 题
+    python scripts/bench_question_parser.py --kps 1000 --per-kp 40 --repeat 5
+
+同时比较练习页渲染: 旧方式每次渲染对每道题跑 mcq_html / extract_mcq_options 两个正则过滤器,
+新方式直接读取入库时解析好的 stem / options。
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from kimi_utils import parse_question_set
+
+
+# ---------- 旧实现 (对照组) ----------
+def legacy_parse(ai_text):
+    lines = [ln.rstrip() for ln in ai_text.splitlines()]
+    blocks, current_kp, buf = [], None, []
+    for ln in lines:
+        kp_match = None
+        if ln.strip().startswith("Knowledge Point:"):
+            kp_match = ln.split("Knowledge Point:", 1)[1].strip()
+        elif ln.strip().startswith("[KP]"):
+            kp_match = ln.split("]", 1)[1].strip()
+        if kp_match:
+            if current_kp and buf:
+                blocks.append((current_kp, "\n".join(buf)))
+            current_kp, buf = kp_match, []
+        else:
+            buf.append(ln)
+    if current_kp and buf:
+        blocks.append((current_kp, "\n".join(buf)))
+
+    def parse_block_mcq(text):
+        out, q, options, ans, expl = [], None, [], None, None
+        for raw in text.splitlines():
+            ln = raw.strip()
+            if ln.startswith("Question:"):
+                if q and ans:
+                    out.append({"question": q + ("\nOptions:\n" + "\n".join(options) if options else ""),
+                                "answer": ans, "explanation": expl or ""})
+                q, options, ans, expl = ln.replace("Question:", "", 1).strip(), [], None, None
+            elif re.match(r"^[ABCD]\.\s", ln):
+                options.append(ln)
+            elif ln.startswith("Answer:"):
+                ans = ln.replace("Answer:", "", 1).strip()
+            elif ln.startswith("Explanation:"):
+                expl = ln.replace("Explanation:", "", 1).strip()
+        if q and ans:
+            out.append({"question": q + ("\nOptions:\n" + "\n".join(options) if options else ""),
+                        "answer": ans, "explanation": expl or ""})
+        return out
+
+    def parse_block_compact(text):
+        out, merged = [], [ln.strip() for ln in text.splitlines() if ln.strip()]
+        i = 0
+        while i < len(merged):
+            m = re.match(r"^\d+\)\s*(.+?)\s*Answer:\s*([ABCD]|[^\s].*)$", merged[i], flags=re.IGNORECASE)
+            if m:
+                expl = ""
+                m_inline = re.search(r"Explanation:\s*(.+)$", merged[i], flags=re.IGNORECASE)
+                if m_inline:
+                    expl = m_inline.group(1).strip()
+                elif i + 1 < len(merged) and merged[i + 1].lower().startswith("explanation:"):
+                    expl = merged[i + 1].split(":", 1)[1].strip()
+                    i += 1
+                out.append({"question": m.group(1).strip(), "answer": m.group(2).strip(), "explanation": expl})
+            i += 1
+        return out
+
+    results = []
+    for kp_name, block_txt in blocks:
+        for it in parse_block_mcq(block_txt) + parse_block_compact(block_txt):
+            it["knowledge_point"] = kp_name
+            results.append(it)
+    return results
+
+
+_re_options_split = re.compile(r'Options?\s*:\s*', flags=re.IGNORECASE)
+_re_sentence_break = re.compile(r'([.?!])\s+')
+_re_tokenizer = re.compile(r'(?:(?<=^)|(?<=\s))([A-D])\.\s*')
+
+
+def legacy_render(q):
+    """旧模板每次渲染时对一道题做的事: mcq_html + extract_mcq_options"""
+    text = q["question"]
+    parts = _re_options_split.split(text, maxsplit=1)
+    stem = _re_sentence_break.sub(r'\1\n', parts[0].strip()).replace("\\n", "\n")
+    html = "<br>".join(line.strip() for line in stem.splitlines() if line.strip())
+    options = []
+    if len(parts) == 2:
+        tokens = _re_tokenizer.split(parts[1].strip())
+        for i in range(1, len(tokens), 2):
+            if (tokens[i + 1] or "").strip():
+                options.append((tokens[i].upper(), tokens[i + 1].strip()))
+    return html, options
+
+
+def stored_render(q):
+    """新模板: 直接使用入库时解析好的字段"""
+    return "<br>".join(q["stem"].split("\n")), [(o["label"], o["text"]) for o in q["options"]]
+
+
+# ---------- 测试数据 ----------
+def make_batch(kps, per_kp, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for k in range(kps):
+        out.append(f"Knowledge Point: Topic {k}")
+        for i in range(per_kp):
+            if rng.random() < 0.8:
+                out.append(f"Question: In topic {k}, which statement about case {i} is correct? Pick one.")
+                for label in "ABCD":
+                    out.append(f"{label}. Option {label.lower()} for case {i} with some extra words")
+                out.append(f"Answer: {rng.choice('ABCD')}")
+                out.append(f"Explanation: Because case {i} behaves this way in topic {k}.")
+            else:
+                out.append(f"{i + 1}) Is statement {i} of topic {k} true? Answer: Yes Explanation: it holds.")
+            out.append("")
+    return "\n".join(out)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return result, statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AI question parsing and rendering")
+    parser.add_argument("--kps", type=int, default=200)
+    parser.add_argument("--per-kp", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--renders", type=int, default=20, help="page renders per question (render benchmark)")
+    args = parser.parse_args()
+
+    text = make_batch(args.kps, args.per_kp)
+    print(f"batch: {args.kps} knowledge points x {args.per_kp} questions, {len(text) / 1e6:.1f} MB")
+
+    old, t_old = timed(lambda: legacy_parse(text), args.repeat)
+    new, t_new = timed(lambda: parse_question_set(text), args.repeat)
+    print(f"parse   legacy: {t_old * 1000:8.1f} ms  ({len(old)} questions)")
+    print(f"parse   single: {t_new * 1000:8.1f} ms  ({len(new)} questions)  x{t_old / t_new:.1f}")
+
+    _, r_old = timed(lambda: [legacy_render(q) for _ in range(args.renders) for q in new], args.repeat)
+    _, r_new = timed(lambda: [stored_render(q) for _ in range(args.renders) for q in new], args.repeat)
+    n = len(new) * args.renders
+    print(f"render  filters: {r_old * 1e6 / n:7.2f} us/question")
+    print(f"render  stored:  {r_new * 1e6 / n:7.2f} us/question  x{r_old / r_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
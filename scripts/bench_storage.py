@@ -0,0 +1,194 @@
+# scripts/bench_storage.py
+"""
+存储后端基准测试: 用 quiz / practice 的典型请求组合比较 Firestore 与 SQLite。
+
+每个后端在独立子进程中运行 (STORAGE_BACKEND 按进程选择), 请求组合:
+    dashboard     30%  知识点摘要 (collection_group + select)
+    practice_get  40%  读知识点摘要 + 一页题目 (order 范围查询)
+    practice_post 20%  一个 WriteBatch: 5 条答题记录 + 错题 + 聚合统计 Increment
+    analysis      10%  读聚合错题统计 + 按 user_id 查答题记录
+
+用法:
+    python scripts/bench_storage.py                          # 两个后端都跑 (Firestore 需要凭据)
+    python scripts/bench_storage.py --backends sqlite -n 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+BENCH_LIST = "__bench__"
+BENCH_USER = "__bench_user__"
+MIX = [("dashboard", 30), ("practice_get", 40), ("practice_post", 20), ("analysis", 10)]
+PAGE_SIZE = 5
+
+
+def seed(db, kp_count, questions_per_kp):
+    from quiz_app import KnowledgePoint
+    names = []
+    for i in range(kp_count):
+        name = f"bench kp {i}"
+        questions = [{
+            "question": f"[{name}] question {j}? A. a B. b C. c D. d",
+            "answer": "A",
+            "explanation": "bench",
+        } for j in range(questions_per_kp)]
+        KnowledgePoint(db, BENCH_LIST, name, "benchmark knowledge point", questions).save()
+        names.append(name)
+    return names
+
+
+def cleanup(db, names):
+    from quiz_app import KnowledgePoint
+    import wrong_stats
+    for name in names:
+        ref = KnowledgePoint._doc_ref(db, BENCH_LIST, name)
+        for q in ref.collection("questions").stream():
+            q.reference.delete()
+        ref.delete()
+    user_ref = db.collection("users").document(BENCH_USER)
+    for kp_doc in user_ref.collection("wrong_questions").stream():
+        for q in kp_doc.reference.collection("questions").stream():
+            q.reference.delete()
+        kp_doc.reference.delete()
+    wrong_stats.stats_ref(db, BENCH_USER).delete()
+    for rec in db.collection("answer_records").where("user_id", "==", BENCH_USER).stream():
+        rec.reference.delete()
+
+
+def op_dashboard(db, names, rng):
+    from quiz_app import KnowledgePoint
+    return len(KnowledgePoint.get_all_summary(db, BENCH_LIST))
+
+
+def op_practice_get(db, names, rng):
+    from quiz_app import KnowledgePoint
+    kp = KnowledgePoint.get_by_name(db, BENCH_LIST, rng.choice(names), include_questions=False)
+    pages = max(1, kp.question_count // PAGE_SIZE)
+    return len(kp.get_questions_page(rng.randrange(pages) * PAGE_SIZE, PAGE_SIZE))
+
+
+def op_practice_post(db, names, rng):
+    import wrong_stats
+    kp_name = rng.choice(names)
+    now = datetime.now(timezone.utc)
+    batch = db.batch()
+    wrong = 0
+    for i in range(PAGE_SIZE):
+        is_correct = rng.random() < 0.7
+        batch.set(db.collection("answer_records").document(), {
+            "user_id": BENCH_USER,
+            "question": f"question {i}",
+            "user_answer": "A" if is_correct else "B",
+            "correct_answer": "A",
+            "is_correct": is_correct,
+            "knowledge_point": kp_name,
+            "timestamp": now,
+        })
+        if not is_correct:
+            wrong += 1
+            kp_ref = (db.collection("users").document(BENCH_USER)
+                        .collection("wrong_questions").document(kp_name))
+            batch.set(kp_ref, {"id": kp_name, "list_id": BENCH_LIST}, merge=True)
+            batch.set(kp_ref.collection("questions").document(), {
+                "question": f"question {i}", "std_answer": "A", "user_answer": "B", "timestamp": now,
+            })
+    wrong_stats.record_answers(db, BENCH_USER, kp_name, BENCH_LIST, PAGE_SIZE, wrong, now, batch=batch)
+    batch.commit()
+    return wrong
+
+
+def op_analysis(db, names, rng):
+    import wrong_stats
+    kps = wrong_stats.load_wrong_stats(db, BENCH_USER)
+    recent = db.collection("answer_records").where("user_id", "==", BENCH_USER).limit(20).get()
+    return len(kps) + len(recent)
+
+
+OPS = {
+    "dashboard": op_dashboard,
+    "practice_get": op_practice_get,
+    "practice_post": op_practice_post,
+    "analysis": op_analysis,
+}
+
+
+def run_worker(args):
+    """子进程: 在当前 STORAGE_BACKEND 上跑一遍请求组合"""
+    from db import fire_db, STORAGE_BACKEND
+    db = fire_db()
+    rng = random.Random(args.seed)
+
+    t0 = time.perf_counter()
+    names = seed(db, args.kps, args.questions)
+    seed_s = time.perf_counter() - t0
+
+    labels = [name for name, _ in MIX]
+    weights = [w for _, w in MIX]
+    timings = {name: [] for name in labels}
+    t0 = time.perf_counter()
+    for _ in range(args.requests):
+        name = rng.choices(labels, weights)[0]
+        start = time.perf_counter()
+        OPS[name](db, names, rng)
+        timings[name].append((time.perf_counter() - start) * 1000)
+    total_s = time.perf_counter() - t0
+
+    print(f"\n=== {STORAGE_BACKEND} ===")
+    print(f"seed: {args.kps} KPs x {args.questions} questions in {seed_s:.2f}s")
+    print(f"{'op':<14}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}  (ms)")
+    for name in labels:
+        values = sorted(timings[name])
+        if not values:
+            continue
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{name:<14}{len(values):>7}{statistics.mean(values):>10.2f}"
+              f"{statistics.median(values):>10.2f}{p95:>10.2f}")
+    print(f"{args.requests} requests in {total_s:.2f}s -> {args.requests / total_s:.1f} req/s")
+
+    if not args.keep:
+        cleanup(db, names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare storage backends on the quiz/practice request mix")
+    parser.add_argument("--backends", default="sqlite,firestore")
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("--kps", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded benchmark data")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    passthrough = ["--requests", str(args.requests), "--kps", str(args.kps),
+                   "--questions", str(args.questions), "--seed", str(args.seed)]
+    if args.keep:
+        passthrough.append("--keep")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends.split(","):
+            env = dict(os.environ, STORAGE_BACKEND=backend.strip())
+            if backend.strip() == "sqlite":
+                env.setdefault("SQLITE_PATH", os.path.join(tmp, "bench.sqlite3"))
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker"] + passthrough,
+                                    env=env, cwd=PROJECT_ROOT)
+            if result.returncode != 0:
+                print(f"[{backend}] benchmark failed (exit {result.returncode})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# scripts/check_background.py
+"""
+ER-NeRF 预处理 extract_background (distanceTransform 版) 与原 KD-tree 版的输出对照 + 计时
+
+    python scripts/check_background.py                         # 合成 100 帧 360x640 随机前景 (取其中 1/20)
+    python scripts/check_background.py --frames 400 --height 1080 --width 1920 --workers 4
+
+1) 在临时目录里合成 ori_imgs/*.jpg 与 parsing/*.png (随机椭圆前景, 白色为背景)
+2) 分别用原实现 (sklearn NearestNeighbors, 拷贝在下面) 和 data_utils/process.py 的新实现生成 bc.jpg
+3) 比较: 背景像素掩码 (max_dist > 5) 必须一致, 其颜色逐像素一致;
+   其余像素按最近背景像素填充, 新实现用 5x5 近似距离, 距离相同/相近时可能选到另一个像素:
+   要求所选像素的距离不超过精确最近距离的 (1 + --fill-tol) 倍, 并统计颜色不同的像素比例
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# process.py 不在包里, 直接把 data_utils 加进 sys.path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_UTILS = os.path.join(PROJECT_ROOT, "ernerf", "data_utils")
+if DATA_UTILS not in sys.path:
+    sys.path.insert(0, DATA_UTILS)
+
+import process
+
+
+# ---------- 原实现 (对照组) ----------
+def ref_extract_background(ori_imgs_dir):
+    from sklearn.neighbors import NearestNeighbors
+
+    image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
+    image_paths = image_paths[::20]
+    tmp_image = cv2.imread(image_paths[0], cv2.IMREAD_UNCHANGED)
+    h, w = tmp_image.shape[:2]
+
+    all_xys = np.mgrid[0:h, 0:w].reshape(2, -1).transpose()
+    distss = []
+    for image_path in image_paths:
+        parse_img = cv2.imread(image_path.replace('ori_imgs', 'parsing').replace('.jpg', '.png'))
+        bg = (parse_img[..., 0] == 255) & (parse_img[..., 1] == 255) & (parse_img[..., 2] == 255)
+        fg_xys = np.stack(np.nonzero(~bg)).transpose(1, 0)
+        nbrs = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(fg_xys)
+        dists, _ = nbrs.kneighbors(all_xys)
+        distss.append(dists)
+
+    distss = np.stack(distss)
+    max_dist = np.max(distss, 0)
+    max_id = np.argmax(distss, 0)
+
+    bc_pixs = max_dist > 5
+    bc_pixs_id = np.nonzero(bc_pixs)
+    bc_ids = max_id[bc_pixs]
+
+    imgs = []
+    num_pixs = distss.shape[1]
+    for image_path in image_paths:
+        imgs.append(cv2.imread(image_path))
+    imgs = np.stack(imgs).reshape(-1, num_pixs, 3)
+
+    bc_img = np.zeros((h*w, 3), dtype=np.uint8)
+    bc_img[bc_pixs_id, :] = imgs[bc_ids, bc_pixs_id, :]
+    bc_img = bc_img.reshape(h, w, 3)
+
+    max_dist = max_dist.reshape(h, w)
+    bc_pixs = max_dist > 5
+    bg_xys = np.stack(np.nonzero(~bc_pixs)).transpose()
+    fg_xys = np.stack(np.nonzero(bc_pixs)).transpose()
+    nbrs = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(fg_xys)
+    distances, indices = nbrs.kneighbors(bg_xys)
+    bg_fg_xys = fg_xys[indices[:, 0]]
+    bc_img[bg_xys[:, 0], bg_xys[:, 1], :] = bc_img[bg_fg_xys[:, 0], bg_fg_xys[:, 1], :]
+
+    # 额外返回每个填充像素到最近背景像素的精确距离, 用来约束新实现的近似填充
+    return bc_img, bc_pixs, distances[:, 0]
+
+
+def make_frames(base_dir, frames, h, w, seed=0):
+    # 每帧: 随机噪声图, 解析图里一个随机位置的椭圆作为前景
+    rng = np.random.default_rng(seed)
+    ori_dir = os.path.join(base_dir, 'ori_imgs')
+    parsing_dir = os.path.join(base_dir, 'parsing')
+    os.makedirs(ori_dir, exist_ok=True)
+    os.makedirs(parsing_dir, exist_ok=True)
+    for i in range(frames):
+        img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        # jpg 有损, 但两种实现读的是同一个文件, 不影响对照
+        cv2.imwrite(os.path.join(ori_dir, f'{i}.jpg'), img)
+        parse = np.full((h, w, 3), 255, dtype=np.uint8)
+        center = (int(w * rng.uniform(0.3, 0.7)), int(h * rng.uniform(0.4, 0.8)))
+        axes = (int(w * rng.uniform(0.1, 0.25)), int(h * rng.uniform(0.2, 0.4)))
+        cv2.ellipse(parse, center, axes, 0, 0, 360, (255, 0, 0), -1)
+        cv2.imwrite(os.path.join(parsing_dir, f'{i}.png'), parse)
+    return ori_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # 两种实现都只取 1/20 的帧, frames=20*k 时用到 k 帧
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk", type=int, default=2)
+    parser.add_argument("--fill-tol", type=float, default=0.05, help="填充像素所选来源的距离相对精确最近距离的最大超出比例")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        ori_dir = make_frames(base_dir, args.frames, args.height, args.width)
+
+        t = time.perf_counter()
+        ref_img, ref_pixs, ref_fill_dist = ref_extract_background(ori_dir)
+        t_ref = time.perf_counter() - t
+
+        t = time.perf_counter()
+        process.extract_background(base_dir, ori_dir, args.workers, args.chunk)
+        t_new = time.perf_counter() - t
+        # 新实现只写出 bc.jpg (有损), 掩码、颜色和填充再用 background_chunk / fill_background 算一遍做精确对照
+        paths = glob.glob(os.path.join(ori_dir, '*.jpg'))[::20]
+        dist, img = process.background_chunk(paths) # 距离的平方
+        new_pixs = dist > 25
+        new_img = img.copy()
+        new_img[~new_pixs] = 0
+        fill_xys, src_xys = process.fill_background(new_img, new_pixs)
+
+    ok = True
+    same_mask = np.array_equal(ref_pixs, new_pixs)
+    print(f"background mask identical: {same_mask} ({ref_pixs.sum()} / {ref_pixs.size} pixels)")
+    ok &= same_mask
+
+    # 原实现里 bc_pixs_id 是 (像素下标, 全 0) 的元组, bc_img[bc_pixs_id, :] 会把它当成 [2, K] 的下标,
+    # 顺带把像素 (0, 0) 写成某个无关帧的颜色; 这个像素不参与对照
+    cmp = ref_pixs.copy()
+    cmp[0, 0] = False
+    same_bc = np.array_equal(ref_img[cmp], img[cmp]) if same_mask else False
+    print(f"background colors identical: {same_bc} (pixel (0, 0) excluded)")
+    ok &= same_bc
+
+    if same_mask:
+        # 两边的填充像素都是 np.nonzero(~mask) 的顺序
+        fill_dist = np.sqrt(((fill_xys - src_xys) ** 2).sum(-1))
+        excess = float((fill_dist / ref_fill_dist - 1).max()) if fill_dist.size else 0.0
+        fill = ~ref_pixs
+        diff_color = (ref_img[fill] != new_img[fill]).any(-1).mean() if fill.any() else 0.0
+        print(f"filled pixels: {fill.sum()}, source distance at most {excess:.2%} over the nearest (tol {args.fill_tol:.0%}), "
+              f"{diff_color:.2%} take another (equidistant or near) source")
+        ok &= excess <= args.fill_tol
+
+    print(f"time: kd-tree {t_ref:.2f}s, distanceTransform {t_new:.2f}s ({t_ref / max(t_new, 1e-6):.1f}x)")
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+# scripts/check_ernerf_backend.py
+"""
+ER-NeRF 扩展的 PyTorch 后端 (ERNERF_BACKEND=torch) 校验 + CPU 基准
+
+    python scripts/check_ernerf_backend.py                 # 小规模数值对照 + 基准
+    python scripts/check_ernerf_backend.py --rays 4096 --repeat 5
+
+1) 数值对照: 在小的随机场景上, 把 torch_backend 的结果与逐条光线的标量参考实现
+   (照 raymarching.cu / gridencoder.cu 的 kernel 逐行翻译) 比较, 覆盖训练路径
+   (march_rays_train / composite_rays_train 及其反向) 和推理路径
+   (near_far_from_aabb / march_rays / composite_rays_triplane);
+   freq / sh 编码器与解析公式 (float64) 对照, 含反向;
+   有 GPU 且 CUDA 扩展可用时, 再与 CUDA 扩展的结果比较
+2) 基准: CPU 上 march_rays_train / composite_rays_train / march_rays + composite_rays / grid_encode 的耗时
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ernerf.raymarching import torch_backend as rm
+from ernerf.gridencoder import torch_backend as ge
+from ernerf.freqencoder import torch_backend as fe
+from ernerf.shencoder import torch_backend as se
+
+SQRT3 = math.sqrt(3)
+
+
+# ---------- 标量参考实现 (对照组, 逐条光线) ----------
+def ref_morton3D(x, y, z):
+    def expand(v):
+        v = (v * 0x00010001) & 0xFF0000FF
+        v = (v * 0x00000101) & 0x0F00F00F
+        v = (v * 0x00000011) & 0xC30C30C3
+        v = (v * 0x00000005) & 0x49249249
+        return v
+    return expand(x) | (expand(y) << 1) | (expand(z) << 2)
+
+
+def ref_mip(v, C):
+    _, exponent = math.frexp(v)
+    return min(C - 1, max(0, exponent))
+
+
+def ref_march_ray(o, d, t, far, limit, bitfield, bound, dt_gamma, max_steps, C, H):
+    # 与 kernel 一样用 float32 推进 t, 否则长光线上的步数会因舍入不同而漂移
+    f32 = np.float32
+    o, d = [f32(v) for v in o], [f32(v) for v in d]
+    t, far, dt_gamma = f32(t), f32(far), f32(dt_gamma)
+    dt_max = f32(2 * SQRT3 * (1 << (C - 1)) / H)
+    dt_min = min(dt_max, f32(2 * SQRT3 / max_steps))
+    clampf = lambda v, lo, hi: min(max(v, lo), hi)
+    points = []
+    while t < far and len(points) < limit:
+        x = [clampf(o[i] + t * d[i], f32(-bound), f32(bound)) for i in range(3)]
+        dt = clampf(t * dt_gamma, dt_min, dt_max)
+        level = max(ref_mip(float(max(abs(v) for v in x)), C), ref_mip(float(dt * f32(H) * f32(0.5)), C))
+        mip_bound = f32(min(2.0 ** level, bound))
+        n = [int(clampf(0.5 * float(x[i] * (f32(1) / mip_bound) + f32(1)) * H, 0, H - 1)) for i in range(3)]
+        index = level * H ** 3 + ref_morton3D(*n)
+        if (bitfield[index // 8] >> (index % 8)) & 1:
+            points.append(([float(v) for v in x], float(dt), float(t + dt)))
+            t = t + dt
+        else:
+            tn = [(((f32(n[i]) + f32(0.5) + f32(0.5) * f32(math.copysign(1, d[i]))) * f32(1 / H) * f32(2) - f32(1)) * mip_bound - x[i]) / d[i]
+                  for i in range(3)]
+            tt = t + max(f32(0), min(tn))
+            while True:
+                t = t + clampf(t * dt_gamma, dt_min, dt_max)
+                if t >= tt:
+                    break
+    return points
+
+
+def ref_composite(sigmas, rgbs, deltas, T_thresh):
+    T, ws, depth, image = 1.0, 0.0, 0.0, [0.0, 0.0, 0.0]
+    for s, c, (dt, t) in zip(sigmas, rgbs, deltas):
+        alpha = 1 - math.exp(-s * dt)
+        w = alpha * T
+        ws += w
+        depth += w * t
+        image = [image[i] + w * c[i] for i in range(3)]
+        T *= 1 - alpha
+        if T < T_thresh:
+            break
+    return ws, depth, image
+
+
+def ref_composite_infer(state, sigmas, rgbs, deltas, ambs_aud, ambs_eye, uncertainties, T_thresh):
+    # kernel_composite_rays_triplane: state = (t, weights_sum, depth, image, amb_aud_sum, amb_eye_sum, uncertainty_sum)
+    # 与 kernel 一样用 float32 累加, 否则 T 贴近 T_thresh 时提前结束的判断会不同
+    f32 = np.float32
+    t, ws, depth, image, a_aud, a_eye, u = [f32(v) for v in state[:3]] + [[f32(v) for v in state[3]]] + [f32(v) for v in state[4:]]
+    step, n_step = 0, len(sigmas)
+    while step < n_step:
+        dt, t_next = f32(deltas[step][0]), f32(deltas[step][1])
+        if dt == 0:
+            break
+        alpha = f32(1) - np.exp(-f32(sigmas[step]) * dt)
+        T = f32(1) - ws
+        w = alpha * T
+        ws = ws + w
+        t = t_next
+        depth = depth + w * t
+        image = [image[i] + w * f32(rgbs[step][i]) for i in range(3)]
+        a_aud = a_aud + f32(ambs_aud[step])
+        a_eye = a_eye + f32(ambs_eye[step])
+        u = u + w * f32(uncertainties[step])
+        if T < T_thresh:
+            break
+        step += 1
+    alive = step >= n_step
+    return alive, float(t), [float(v) for v in (ws, depth, *image, a_aud, a_eye, u)]
+
+
+def ref_near_far(o, d, aabb, min_near):
+    near, far = -math.inf, math.inf
+    for i in range(3):
+        t0 = (aabb[i] - o[i]) / d[i]
+        t1 = (aabb[i + 3] - o[i]) / d[i]
+        lo, hi = min(t0, t1), max(t0, t1)
+        if near > hi or lo > far:
+            return None
+        near, far = max(near, lo), min(far, hi)
+    return max(near, min_near), far
+
+
+def ref_freq_encode(x, deg):
+    out = list(x)
+    for f in range(deg):
+        out += [math.sin(2 ** f * v) for v in x]
+        out += [math.cos(2 ** f * v) for v in x]
+    return out
+
+
+def ref_sh(v, C):
+    # 实球谐 (带 Condon-Shortley 相位), 按 l = 0..C-1, m = -l..l 排列;
+    # sin^m(theta) e^{i m phi} 写成 (x + iy)^m, 于是每一项都是 x, y, z 的多项式, 与 kernel 的写法一致
+    x, y, z = v
+    out = []
+    for l in range(C):
+        dP = np.polynomial.legendre.Legendre.basis(l)
+        for m in range(-l, l + 1):
+            am = abs(m)
+            K = math.sqrt((2 * l + 1) / (4 * math.pi) * math.factorial(l - am) / math.factorial(l + am))
+            p = float(dP.deriv(am)(z)) if am else float(dP(z))
+            if m == 0:
+                out.append(K * p)
+            else:
+                c = complex(x, y) ** am
+                out.append(math.sqrt(2) * K * (-1) ** am * p * (c.real if m > 0 else c.imag))
+    return out
+
+
+def ref_grid_encode(x, embeddings, offsets, C, L, S, H):
+    primes = [1, 2654435761, 805459861, 3674653429]
+    out = []
+    for level in range(L):
+        size = offsets[level + 1] - offsets[level]
+        scale = float(np.float32(2 ** (level * S) * H - 1))
+        res = int(math.ceil(scale)) + 1
+        pos = [v * scale + 0.5 for v in x]
+        grid = [int(math.floor(p)) for p in pos]
+        frac = [p - g for p, g in zip(pos, grid)]
+        acc = np.zeros(C)
+        for idx in range(8):
+            w, local = 1.0, []
+            for dd in range(3):
+                bit = (idx >> dd) & 1
+                w *= frac[dd] if bit else 1 - frac[dd]
+                local.append(grid[dd] + bit)
+            if (res + 1) ** 3 > size:
+                index = 0
+                for dd in range(3):
+                    index ^= (local[dd] * primes[dd]) & 0xFFFFFFFF
+            else:
+                index = local[0] + local[1] * (res + 1) + local[2] * (res + 1) ** 2
+            acc += w * embeddings[offsets[level] + index % size]
+        out.append(acc)
+    return np.concatenate(out)
+
+
+# ---------- 场景 ----------
+def make_scene(N, C=2, H=32, bound=1.0, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    rays_o = torch.randn(N, 3, generator=g) * 0.1 + torch.tensor([0.0, 0.0, 2.5])
+    target = (torch.rand(N, 3, generator=g) - 0.5) * 1.2
+    rays_d = torch.nn.functional.normalize(target - rays_o, dim=-1)
+    density = torch.rand(C * H ** 3, generator=g) # 约一半的格子被占用
+    bitfield = torch.empty(C * H ** 3 // 8, dtype=torch.uint8)
+    rm.packbits(density, bitfield.shape[0], 0.5, bitfield)
+    aabb = torch.tensor([-bound] * 3 + [bound] * 3)
+    return rays_o, rays_d, bitfield, aabb
+
+
+def march_train(rays_o, rays_d, bitfield, aabb, C, H, bound, max_steps=128, dt_gamma=1 / 256):
+    N = rays_o.shape[0]
+    nears, fars = torch.empty(N), torch.empty(N)
+    rm.near_far_from_aabb(rays_o, rays_d, aabb, N, 0.05, nears, fars)
+    M = N * max_steps
+    xyzs, dirs, deltas = torch.zeros(M, 3), torch.zeros(M, 3), torch.zeros(M, 2)
+    rays = torch.empty(N, 3, dtype=torch.int32)
+    counter = torch.zeros(2, dtype=torch.int32)
+    rm.march_rays_train(rays_o, rays_d, bitfield, bound, dt_gamma, max_steps, N, C, H, M, nears, fars,
+                        xyzs, dirs, deltas, rays, counter, torch.zeros(N))
+    return nears, fars, xyzs, deltas, rays, int(counter[0])
+
+
+def check(name, ok, detail=""):
+    print(f"{'✓' if ok else '❌'} {name} {detail}")
+    return ok
+
+
+def run_checks(args):
+    C, H, bound, max_steps, dt_gamma = 2, 32, 1.0, 128, 1 / 256
+    rays_o, rays_d, bitfield, aabb = make_scene(args.check_rays, C, H, bound)
+    nears, fars, xyzs, deltas, rays, total = march_train(rays_o, rays_d, bitfield, aabb, C, H, bound, max_steps, dt_gamma)
+    bits = bitfield.tolist()
+    results = []
+
+    # march_rays_train vs 标量参考
+    worst = 0.0
+    for n in range(rays_o.shape[0]):
+        _, offset, count = rays[n].tolist()
+        ref = []
+        if nears[n] < fars[n]:
+            ref = ref_march_ray(rays_o[n].tolist(), rays_d[n].tolist(), float(nears[n]), float(fars[n]),
+                                max_steps, bits, bound, dt_gamma, max_steps, C, H)
+        if len(ref) != count:
+            worst = float('inf')
+            break
+        for k, (x, dt, t) in enumerate(ref):
+            worst = max(worst, float((xyzs[offset + k] - torch.tensor(x)).abs().max()), abs(float(deltas[offset + k, 1]) - t))
+    results.append(check("march_rays_train", worst < 1e-4, f"(points={total}, max err={worst:.2e})"))
+
+    # composite_rays_train vs 标量参考
+    N = rays.shape[0]
+    g = torch.Generator().manual_seed(1)
+    sigmas = torch.rand(xyzs.shape[0], generator=g) * 20
+    rgbs = torch.rand(xyzs.shape[0], 3, generator=g)
+    ambient = torch.rand(xyzs.shape[0], generator=g)
+    ws, amb, depth, image = torch.empty(N), torch.empty(N), torch.empty(N), torch.empty(N, 3)
+    rm.composite_rays_train_forward(sigmas, rgbs, ambient, deltas, rays, xyzs.shape[0], N, 1e-4, ws, amb, depth, image)
+    worst = 0.0
+    for n in range(N):
+        index, offset, count = rays[n].tolist()
+        r_ws, r_depth, r_image = ref_composite(sigmas[offset:offset + count].tolist(), rgbs[offset:offset + count].tolist(),
+                                              deltas[offset:offset + count].tolist(), 1e-4)
+        worst = max(worst, abs(float(ws[index]) - r_ws), abs(float(depth[index]) - r_depth),
+                    float((image[index] - torch.tensor(r_image)).abs().max()))
+    results.append(check("composite_rays_train", worst < 1e-4, f"(max err={worst:.2e})"))
+
+    # composite_rays_train 反向: 与中心差分对照
+    # 用低密度的场景 (sigma ~ U(0, 0.5)): sigma ~ 20 时透射率在前几个点就饱和, 梯度几乎处处为 0, 对照没有意义
+    b_sigmas = torch.rand(xyzs.shape[0], generator=g) * 0.5
+    b_ws, b_amb, b_image = torch.empty(N), torch.empty(N), torch.empty(N, 3)
+
+    def loss(s):
+        # L = sum(weights_sum) + sum(image), 全程 float64, 否则差分被 float32 舍入淹没
+        w, img = torch.empty(N, dtype=torch.float64), torch.empty(N, 3, dtype=torch.float64)
+        rm.composite_rays_train_forward(s.double(), rgbs.double(), ambient.double(), deltas.double(), rays, xyzs.shape[0], N, 1e-4,
+                                        w, torch.empty_like(w), torch.empty_like(w), img)
+        return float(w.sum()) + float(img.sum())
+
+    rm.composite_rays_train_forward(b_sigmas, rgbs, ambient, deltas, rays, xyzs.shape[0], N, 1e-4, b_ws, b_amb, torch.empty(N), b_image)
+    grad_sigmas, grad_rgbs, grad_amb = torch.empty_like(sigmas), torch.empty_like(rgbs), torch.empty_like(ambient)
+    rm.composite_rays_train_backward(torch.ones(N), torch.zeros(N), torch.ones(N, 3), b_sigmas, rgbs, ambient, deltas, rays,
+                                     b_ws, b_amb, b_image, xyzs.shape[0], N, 1e-4, grad_sigmas, grad_rgbs, grad_amb)
+    # 每条 (有采样点的) 光线取首、中、末三个点
+    points = []
+    for n in torch.nonzero(rays[:, 2] > 0).squeeze(-1)[:8].tolist():
+        _, offset, count = rays[n].tolist()
+        points += sorted({offset, offset + count // 2, offset + count - 1})
+    eps, worst, smallest = 1e-4, 0.0, float('inf')
+    for p in points:
+        hi, lo = b_sigmas.double(), b_sigmas.double()
+        hi[p] += eps
+        lo[p] -= eps
+        fd = (loss(hi) - loss(lo)) / (2 * eps)
+        worst = max(worst, abs(fd - float(grad_sigmas[p])) / max(abs(fd), 1e-3))
+        smallest = min(smallest, abs(fd))
+    # 梯度必须明显非 0, 否则说明场景又饱和了
+    results.append(check("composite_rays_train backward", worst < 1e-2 and smallest > 1e-4,
+                         f"(points={len(points)}, max rel err={worst:.2e}, min |grad|={smallest:.2e})"))
+
+    # near_far_from_aabb vs 标量参考 (含打不中包围盒和起点在盒内的光线)
+    gn = torch.Generator().manual_seed(2)
+    o = torch.cat([rays_o, (torch.rand(64, 3, generator=gn) - 0.5) * 6])
+    d = torch.nn.functional.normalize(torch.cat([rays_d, torch.randn(64, 3, generator=gn)]), dim=-1)
+    n_nears, n_fars = torch.empty(o.shape[0]), torch.empty(o.shape[0])
+    rm.near_far_from_aabb(o, d, aabb, o.shape[0], 0.05, n_nears, n_fars)
+    big = torch.finfo(torch.float32).max
+    worst, misses = 0.0, 0
+    for n in range(o.shape[0]):
+        ref = ref_near_far(o[n].tolist(), d[n].tolist(), aabb.tolist(), 0.05)
+        if ref is None:
+            misses += 1
+            worst = max(worst, 0.0 if float(n_nears[n]) == big and float(n_fars[n]) == big else float('inf'))
+        else:
+            worst = max(worst, abs(float(n_nears[n]) - ref[0]), abs(float(n_fars[n]) - ref[1]))
+    results.append(check("near_far_from_aabb", worst < 1e-4 and 0 < misses < o.shape[0], f"(misses={misses}, max err={worst:.2e})"))
+
+    # march_rays + composite_rays_triplane 推理循环 (renderer.run_cuda) vs 标量参考, 逐轮对照
+    N = rays_o.shape[0]
+    rays_alive = torch.arange(N, dtype=torch.int32)
+    rays_t = nears.clone()
+    sums = [torch.zeros(N), torch.zeros(N), torch.zeros(N, 3), torch.zeros(N), torch.zeros(N), torch.zeros(N)]
+    n_alive, steps, rounds, march_err, comp_err = N, 0, 0, 0.0, 0.0
+    while n_alive > 0 and steps < max_steps:
+        n_step = max(min(N // n_alive, 8), 1)
+        m = n_alive * n_step
+        x, dd, dl = torch.zeros(m, 3), torch.zeros(m, 3), torch.zeros(m, 2)
+        rm.march_rays(n_alive, n_step, rays_alive, rays_t, rays_o, rays_d, bound, dt_gamma, max_steps, C, H, bitfield,
+                      nears, fars, x, dd, dl, torch.zeros(n_alive))
+        for n in range(n_alive):
+            index = int(rays_alive[n])
+            ref = ref_march_ray(rays_o[index].tolist(), rays_d[index].tolist(), float(rays_t[index]), float(fars[index]),
+                                n_step, bits, bound, dt_gamma, max_steps, C, H)
+            base = n * n_step
+            for k, (p, dt, t) in enumerate(ref):
+                march_err = max(march_err, float((x[base + k] - torch.tensor(p)).abs().max()),
+                                abs(float(dl[base + k, 0]) - dt), abs(float(dl[base + k, 1]) - t))
+            # 没用到的槽位必须保持为 0, composite 靠 delta == 0 结束光线
+            if bool((dl[base + len(ref):base + n_step] != 0).any()):
+                march_err = float('inf')
+
+        values = [torch.rand(m, generator=g) * 20, torch.rand(m, 3, generator=g),
+                  torch.rand(m, generator=g), torch.rand(m, generator=g), torch.rand(m, generator=g)]
+        alive_before, t_before, sums_before = rays_alive.clone(), rays_t.clone(), [s.clone() for s in sums]
+        weights, depth, image, amb_aud, amb_eye, unc = sums
+        rm.composite_rays_triplane(n_alive, n_step, 1e-4, rays_alive, rays_t, values[0], values[1], dl, values[2], values[3], values[4],
+                                   weights, depth, image, amb_aud, amb_eye, unc)
+        for n in range(n_alive):
+            index = int(alive_before[n])
+            sl = slice(n * n_step, (n + 1) * n_step)
+            state = [float(t_before[index])] + [s[index].tolist() for s in sums_before]
+            alive, t, out = ref_composite_infer(state, values[0][sl].tolist(), values[1][sl].tolist(), dl[sl].tolist(),
+                                                values[2][sl].tolist(), values[3][sl].tolist(), values[4][sl].tolist(), 1e-4)
+            got = [float(weights[index]), float(depth[index]), *image[index].tolist(),
+                   float(amb_aud[index]), float(amb_eye[index]), float(unc[index])]
+            comp_err = max(comp_err, max(abs(a - b) for a, b in zip(got, out)))
+            if alive != (int(rays_alive[n]) >= 0) or (alive and abs(float(rays_t[index]) - t) > 1e-5):
+                comp_err = float('inf')
+        rays_alive = rays_alive[rays_alive >= 0]
+        n_alive = rays_alive.shape[0]
+        steps += n_step
+        rounds += 1
+    results.append(check("march_rays", march_err < 1e-4, f"(rounds={rounds}, max err={march_err:.2e})"))
+    results.append(check("composite_rays_triplane", comp_err < 1e-4, f"(max err={comp_err:.2e})"))
+
+    # freq 编码器 vs 解析式 (ER-NeRF 用到的两种配置: 2 维 x 8 阶, 6 维 x 3 阶)
+    worst = 0.0
+    for D, deg in ((2, 8), (6, 3)):
+        B, Cf = 64, D + D * deg * 2
+        inputs = torch.rand(B, D, generator=g) * 2 - 1
+        out = torch.empty(B, Cf)
+        fe.freq_encode_forward(inputs, B, D, deg, Cf, out)
+        ref = np.array([ref_freq_encode(inputs[b].tolist(), deg) for b in range(B)])
+        worst = max(worst, float(np.abs(out.numpy() - ref).max()))
+        # 反向: d/dx sin(2^f x) = 2^f cos(2^f x), d/dx cos(2^f x) = -2^f sin(2^f x)
+        grad = torch.randn(B, Cf, generator=g)
+        grad_inputs = torch.empty(B, D)
+        fe.freq_encode_backward(grad, out, B, D, deg, Cf, grad_inputs)
+        x64, g64 = inputs.double().numpy(), grad.double().numpy()
+        ref = g64[:, :D].copy()
+        for f in range(deg):
+            gs, gc = g64[:, D * (1 + 2 * f):D * (2 + 2 * f)], g64[:, D * (2 + 2 * f):D * (3 + 2 * f)]
+            ref += 2 ** f * (gs * np.cos(2 ** f * x64) - gc * np.sin(2 ** f * x64))
+        worst = max(worst, float(np.abs(grad_inputs.numpy() - ref).max()) / max(1.0, float(np.abs(ref).max())))
+    results.append(check("freq_encode", worst < 1e-4, f"(max err={worst:.2e})"))
+
+    # sh 编码器 vs 解析式 (所有阶), 反向 vs 参考的中心差分
+    B = 64
+    inputs = torch.nn.functional.normalize(torch.randn(B, 3, generator=g), dim=-1)
+    fwd, bwd = 0.0, 0.0
+    for Cs in range(1, 9):
+        out = torch.empty(B, Cs * Cs)
+        se.sh_encode_forward(inputs, out, B, 3, Cs, None)
+        ref = np.array([ref_sh(inputs[b].tolist(), Cs) for b in range(B)])
+        fwd = max(fwd, float(np.abs(out.numpy() - ref).max()))
+
+        grad = torch.randn(B, Cs * Cs, generator=g)
+        grad_inputs = torch.empty(B, 3)
+        se.sh_encode_backward(grad, inputs, B, 3, Cs, None, grad_inputs)
+        eps = 1e-6
+        for b in range(8):
+            v, gb = inputs[b].double().tolist(), grad[b].double().numpy()
+            for i in range(3):
+                hi, lo = list(v), list(v)
+                hi[i] += eps
+                lo[i] -= eps
+                fd = float(gb @ (np.array(ref_sh(hi, Cs)) - np.array(ref_sh(lo, Cs)))) / (2 * eps)
+                bwd = max(bwd, abs(fd - float(grad_inputs[b, i])) / max(1.0, abs(fd)))
+    results.append(check("sh_encode", fwd < 1e-4, f"(degree 1..8, max err={fwd:.2e})"))
+    results.append(check("sh_encode backward", bwd < 1e-3, f"(max rel err={bwd:.2e})"))
+
+    # grid_encode vs 标量参考 (hash + dense 层)
+    D, Cg, L, base, log2_size = 3, 2, 4, 4, 10
+    S = math.log2(2.0)
+    offsets, offset = [], 0
+    for i in range(L):
+        res = int(math.ceil(base * 2 ** i))
+        size = int(math.ceil(min(2 ** log2_size, (res + 1) ** D) / 8) * 8)
+        offsets.append(offset)
+        offset += size
+    offsets.append(offset)
+    embeddings = torch.randn(offset, Cg, generator=g)
+    inputs = torch.rand(64, D, generator=g)
+    out = torch.empty(L, 64, Cg)
+    ge.grid_encode_forward(inputs, embeddings, torch.tensor(offsets, dtype=torch.int32), out, 64, D, Cg, L, S, base, None, 0, False)
+    out = out.permute(1, 0, 2).reshape(64, L * Cg)
+    worst = max(float(np.abs(out[b].numpy() - ref_grid_encode(inputs[b].tolist(), embeddings.numpy(), offsets, Cg, L, S, base)).max())
+                for b in range(64))
+    results.append(check("grid_encode", worst < 1e-4, f"(max err={worst:.2e})"))
+
+    # CUDA 扩展对照 (可选)
+    if torch.cuda.is_available():
+        try:
+            from ernerf.raymarching.backend import _backend as cuda_rm
+        except Exception as e:
+            print(f"⚠️ CUDA extension unavailable, skip GPU comparison: {e}")
+        else:
+            cuda_inputs = [t.cuda() for t in (rays_o, rays_d, bitfield, nears, fars)]
+            M = xyzs.shape[0]
+            c_xyzs, c_dirs, c_deltas = torch.zeros(M, 3).cuda(), torch.zeros(M, 3).cuda(), torch.zeros(M, 2).cuda()
+            c_rays, c_counter = torch.empty(N, 3, dtype=torch.int32).cuda(), torch.zeros(2, dtype=torch.int32).cuda()
+            cuda_rm.march_rays_train(cuda_inputs[0], cuda_inputs[1], cuda_inputs[2], bound, dt_gamma, max_steps, N, C, H, M,
+                                     cuda_inputs[3], cuda_inputs[4], c_xyzs, c_dirs, c_deltas, c_rays, c_counter, torch.zeros(N).cuda())
+            # CUDA 的 offset 由 atomicAdd 决定, 按光线 id 对齐后比较
+            c_rays = c_rays.cpu()
+            order = torch.argsort(c_rays[:, 0].long())
+            same_counts = torch.equal(c_rays[order, 2], rays[:, 2])
+            worst = 0.0
+            for n in range(N):
+                _, c_off, count = c_rays[order[n]].tolist()
+                off = int(rays[n, 1])
+                if count:
+                    worst = max(worst, float((c_xyzs[c_off:c_off + count].cpu() - xyzs[off:off + count]).abs().max()))
+            results.append(check("march_rays_train vs CUDA", same_counts and worst < 1e-4, f"(max err={worst:.2e})"))
+
+    return all(results)
+
+
+# ---------- 基准 ----------
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def run_bench(args):
+    C, H, bound, max_steps = 2, 64, 1.0, 256
+    N = args.rays
+    rays_o, rays_d, bitfield, aabb = make_scene(N, C, H, bound)
+    print(f"\nCPU benchmark: {N} rays, grid {C}x{H}^3, threads={torch.get_num_threads()}")
+
+    t = timeit(lambda: march_train(rays_o, rays_d, bitfield, aabb, C, H, bound, max_steps), args.repeat)
+    nears, fars, xyzs, deltas, rays, total = march_train(rays_o, rays_d, bitfield, aabb, C, H, bound, max_steps)
+    print(f"  march_rays_train      {t:8.1f} ms  ({total} points)")
+
+    M = xyzs.shape[0]
+    sigmas, rgbs, ambient = torch.rand(M) * 20, torch.rand(M, 3), torch.rand(M)
+    outs = [torch.empty(N), torch.empty(N), torch.empty(N), torch.empty(N, 3)]
+    t = timeit(lambda: rm.composite_rays_train_forward(sigmas, rgbs, ambient, deltas, rays, M, N, 1e-4, *outs), args.repeat)
+    print(f"  composite_rays_train  {t:8.1f} ms")
+
+    def infer():
+        # renderer.run_cuda 的推理循环: 每轮 n_step 个点, 直到所有光线结束
+        rays_alive = torch.arange(N, dtype=torch.int32)
+        rays_t = nears.clone()
+        weights, depth, image = torch.zeros(N), torch.zeros(N), torch.zeros(N, 3)
+        n_alive, steps = N, 0
+        while n_alive > 0 and steps < max_steps:
+            n_step = max(min(N // n_alive, 8), 1)
+            m = n_alive * n_step
+            x, dd, dl = torch.zeros(m, 3), torch.zeros(m, 3), torch.zeros(m, 2)
+            rm.march_rays(n_alive, n_step, rays_alive, rays_t, rays_o, rays_d, bound, 1 / 256, max_steps, C, H, bitfield,
+                          nears, fars, x, dd, dl, torch.zeros(n_alive))
+            rm.composite_rays(n_alive, n_step, 1e-4, rays_alive, rays_t, torch.rand(m) * 20, torch.rand(m, 3), dl, weights, depth, image)
+            rays_alive = rays_alive[rays_alive >= 0]
+            n_alive = rays_alive.shape[0]
+            steps += n_step
+
+    t = timeit(infer, args.repeat)
+    print(f"  march_rays + composite_rays (infer loop) {t:8.1f} ms")
+
+    L, Cg, base, log2_size = 16, 2, 16, 19
+    offsets, offset = [], 0
+    for i in range(L):
+        res = int(math.ceil(base * 1.447 ** i))
+        size = int(math.ceil(min(2 ** log2_size, (res + 1) ** 3) / 8) * 8)
+        offsets.append(offset)
+        offset += size
+    offsets.append(offset)
+    embeddings = torch.randn(offset, Cg) * 1e-2
+    inputs = torch.rand(total, 3)
+    out = torch.empty(L, total, Cg)
+    offsets = torch.tensor(offsets, dtype=torch.int32)
+    t = timeit(lambda: ge.grid_encode_forward(inputs, embeddings, offsets, out, total, 3, Cg, L, math.log2(1.447), base, None, 0, False), args.repeat)
+    print(f"  grid_encode (16 levels, {total} points) {t:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check-rays", type=int, default=64, help="数值对照用的光线数 (标量参考实现较慢)")
+    parser.add_argument("--rays", type=int, default=1024, help="基准用的光线数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-bench", action="store_true")
+    args = parser.parse_args()
+
+    ok = run_checks(args)
+    if not args.skip_bench:
+        run_bench(args)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
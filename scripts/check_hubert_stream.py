@@ -0,0 +1,151 @@
+# scripts/check_hubert_stream.py
+"""
+ultralight HubertStream (复用上一窗口的卷积特征) 与逐窗口 get_hubert_from_16k_speech 的对照 + 计时
+
+    python scripts/check_hubert_stream.py                      # 合成音频, l=r=10, batch_size=16
+    python scripts/check_hubert_stream.py --wav data/xxx.wav --steps 20
+
+按 HubertASR.run_step 的方式切窗口 (左 stride + 2*batch_size 新帧 + 右 stride), 每个窗口:
+1) 精确对照: 关闭归一化, HubertStream 的输出必须与整窗 HubertModel 前向一致 (只差浮点误差)
+2) 精确对照: 窗口归一化 + drift_tol=0 (均值/方差一变就整窗重算), 必须与 get_hubert_from_16k_speech 一致
+3) 默认 (窗口归一化, drift_tol=0.05): 复用帧沿用上一窗口的归一化, 与 get_hubert_from_16k_speech 比较:
+   逐帧最小余弦相似度 >= --min-cos, feature2chunks 之后的最大绝对差 <= --chunk-rtol * 参考的最大绝对值
+4) 短于卷积核的窗口 get_hubert_from_16k_speech 不再报错
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from ultralight.audio2feature import Audio2Feature
+
+
+def load_audio(args, chunk):
+    if args.wav:
+        import soundfile as sf
+        speech, sr = sf.read(args.wav, dtype='float32')
+        assert sr == 16000, f'{args.wav}: 需要 16k 采样率, 实际 {sr}'
+        if speech.ndim == 2:
+            speech = speech[:, 0]
+    else:
+        # 合成: 几个随时间变化的谐波 + 噪声, 中间夹一段静音
+        rng = np.random.default_rng(0)
+        t = np.arange(16000 * 8, dtype=np.float32) / 16000
+        f0 = 120 + 40 * np.sin(2 * np.pi * 0.5 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / 16000
+        speech = sum(np.sin(k * phase) / k for k in range(1, 6)) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+        speech = (0.3 * speech + 0.01 * rng.standard_normal(t.shape)).astype(np.float32)
+        speech[16000 * 3:16000 * 4] = 0
+    return speech[:len(speech) // chunk * chunk]
+
+
+def windows(speech, chunk, left, right, batch_size, steps):
+    # 与 HubertASR.run_step 一致: 每步新增 2*batch_size 帧, 窗口保留上一窗口最后 left+right 帧
+    frames = [speech[i:i + chunk] for i in range(0, len(speech), chunk)]
+    window = []
+    pos = 0
+    for _ in range(steps):
+        if pos + batch_size * 2 > len(frames):
+            break
+        window.extend(frames[pos:pos + batch_size * 2])
+        pos += batch_size * 2
+        if len(window) <= left + right:
+            continue
+        yield np.concatenate(window), batch_size * 2 * chunk
+        window = window[-(left + right):]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wav", type=str, default="", help="16k wav, 默认用合成音频")
+    parser.add_argument("-l", type=int, default=10)
+    parser.add_argument("-r", type=int, default=10)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--atol", type=float, default=1e-3, help="精确对照的容差")
+    parser.add_argument("--min-cos", type=float, default=0.99, help="默认归一化路径: 逐帧余弦相似度下限")
+    parser.add_argument("--chunk-rtol", type=float, default=0.05, help="默认归一化路径: feature2chunks 最大绝对差 / 参考最大绝对值 的上限")
+    args = parser.parse_args()
+
+    chunk = 320
+    a2f = Audio2Feature()
+    speech = load_audio(args, chunk)
+    ok = True
+
+    # 1) 精确对照 (不归一化)
+    stream = a2f.stream()
+    stream.do_normalize = False
+    max_diff = 0
+    for window, new in windows(speech, chunk, args.l, args.r, args.batch_size, args.steps):
+        feats = stream.get_hubert(window, new)
+        with torch.no_grad():
+            ref = a2f.model(torch.from_numpy(window).unsqueeze(0).to(a2f.device)).last_hidden_state[0].cpu()
+        assert feats.shape == ref.shape, (feats.shape, ref.shape)
+        max_diff = max(max_diff, (feats - ref).abs().max().item())
+    exact = max_diff <= args.atol
+    print(f"[exact] no normalization: max abs diff {max_diff:.2e} (atol {args.atol}) {'OK' if exact else 'MISMATCH'}")
+    ok &= exact
+
+    # 2) 精确对照 (窗口归一化, 均值/方差有变化就不复用)
+    stream = a2f.stream()
+    stream.drift_tol = 0
+    max_diff = 0
+    for window, new in windows(speech, chunk, args.l, args.r, args.batch_size, args.steps):
+        feats = stream.get_hubert(window, new)
+        ref = a2f.get_hubert_from_16k_speech(window)
+        assert feats.shape == ref.shape, (feats.shape, ref.shape)
+        max_diff = max(max_diff, (feats - ref).abs().max().item())
+    exact = max_diff <= args.atol
+    print(f"[exact] window normalization, drift_tol=0: max abs diff {max_diff:.2e} (atol {args.atol}) {'OK' if exact else 'MISMATCH'}")
+    ok &= exact
+
+    # 3) 默认: 窗口归一化
+    stream = a2f.stream()
+    min_cos, max_chunk_diff, max_chunk_ref = 1.0, 0, 0
+    t_stream = t_ref = 0
+    n = reused = 0
+    for window, new in windows(speech, chunk, args.l, args.r, args.batch_size, args.steps):
+        t = time.perf_counter()
+        feats = stream.get_hubert(window, new)
+        t_stream += time.perf_counter() - t
+        t = time.perf_counter()
+        ref = a2f.get_hubert_from_16k_speech(window)
+        t_ref += time.perf_counter() - t
+        n += 1
+        reused += stream.reused > 0
+
+        assert feats.shape == ref.shape, (feats.shape, ref.shape)
+        cos = torch.nn.functional.cosine_similarity(feats, ref, dim=-1).min().item()
+        min_cos = min(min_cos, cos)
+        # feature2chunks 的取帧方式与 HubertASR 一致
+        kwargs = dict(fps=25, batch_size=args.batch_size, start=args.l / 2)
+        chunks = np.stack(a2f.feature2chunks(feature_array=feats, **kwargs))
+        ref_chunks = np.stack(a2f.feature2chunks(feature_array=ref, **kwargs))
+        assert chunks.shape == ref_chunks.shape
+        max_chunk_diff = max(max_chunk_diff, np.abs(chunks - ref_chunks).max())
+        max_chunk_ref = max(max_chunk_ref, np.abs(ref_chunks).max())
+    close = min_cos >= args.min_cos and max_chunk_diff <= args.chunk_rtol * max_chunk_ref
+    print(f"[window normalization] {n} windows ({reused} reusing frames), min frame cosine {min_cos:.4f} (min {args.min_cos}), "
+          f"feature2chunks max abs diff {max_chunk_diff:.3e} / max abs {max_chunk_ref:.3e} (rtol {args.chunk_rtol}) "
+          f"{'OK' if close else 'MISMATCH'}")
+    ok &= close
+    print(f"time per window: get_hubert_from_16k_speech {t_ref / max(n, 1) * 1000:.1f} ms, HubertStream {t_stream / max(n, 1) * 1000:.1f} ms")
+
+    # 4) 短于卷积核的输入
+    short = a2f.get_hubert_from_16k_speech(np.zeros(300, dtype=np.float32))
+    print(f"[short input] 300 samples -> {tuple(short.shape)}")
+
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# scripts/generate_questions.py
+"""
+命令行批量出题 (question_pipeline 的入口)
+
+用法:
+    python scripts/generate_questions.py 1 --kp "Pointers: address arithmetic" --kp "References: aliases"
+    python scripts/generate_questions.py 1 --course Lecture/notes1.txt Lecture/notes2.txt
+    python scripts/generate_questions.py 1 --kp "Arrays: basics" --stub       # 本地假模型, 不调用 Kimi
+"""
+import argparse
+import os
+import sys
+import time
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from db import fire_db
+from kimi_utils import StubLLM
+import question_pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-generate questions for a question list")
+    parser.add_argument("list_id")
+    parser.add_argument("--kp", action="append", default=[], help='"Name: description" (repeatable)')
+    parser.add_argument("--course", nargs="*", default=[], help="course text files to extract knowledge points from")
+    parser.add_argument("--stub", action="store_true", help="use the local stub LLM")
+    args = parser.parse_args()
+
+    kps = [question_pipeline.parse_kp_spec(item) for item in args.kp]
+    texts = []
+    for path in args.course:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+    if not kps and not texts:
+        parser.error("give at least one --kp or --course file")
+
+    job = question_pipeline.start_job(fire_db(), args.list_id, kps=kps, course_texts=texts,
+                                      llm=StubLLM(latency=0.01) if args.stub else None)
+    while True:
+        p = job.snapshot()
+        total = p["kps_total"] or p["texts_total"]
+        done = p["kps_done"] if p["kps_total"] else p["texts_done"]
+        print(f"\r{p['status']:<8} {p['stage']:<12} {done}/{total}  committed={p['committed']} "
+              f"duplicates={p['duplicates']} retries={p['retries']}", end="", flush=True)
+        if p["status"] in ("done", "failed"):
+            break
+        time.sleep(0.5)
+    print()
+    for err in p["errors"]:
+        print("error:", err)
+    print(f"job id: {job.id} (progress is also stored in {question_pipeline.JOBS_COLLECTION}/{job.id})")
+
+
+if __name__ == "__main__":
+    main()
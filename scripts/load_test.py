@@ -0,0 +1,103 @@
+# scripts/load_test.py
+"""
+并发压测: N 个虚拟用户同时循环发请求, 统计 requests/second 与延迟分位数。
+
+请求组合 (按权重随机):
+    /human 普通问答 (需要已登录的 session_id, 走 X-Session-ID 头)
+    Flask 页面 GET (dashboard / practice 等, 需要登录 cookie)
+
+用法:
+    python scripts/load_test.py --url http://127.0.0.1:5000 --users 200 --duration 60 \\
+        --session-id <sid> --cookie "session=..." \\
+        --get /quiz/dashboard --get "/quiz/practice/1/Arrays"
+
+--human-weight / --page-weight 调整两类请求的比例; 不给 --session-id 时只压页面。
+服务端可通过 BLOCKING_POOL_SIZE / BLOCKING_QUEUE_LIMIT / WSGI_POOL_SIZE 调整线程池 (见 async_runtime.py)。
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+import aiohttp
+
+QUESTIONS = [
+    "What is a pointer in C++?",
+    "Explain the difference between pass by value and pass by reference.",
+    "How do I declare a two dimensional array?",
+    "What does the const keyword mean for member functions?",
+    "Why does my for loop run one time too many?",
+]
+
+
+async def one_request(session, args, rng):
+    use_human = args.session_id and (not args.get or rng.random() < args.human_weight /
+                                     (args.human_weight + args.page_weight))
+    if use_human:
+        url = args.url.rstrip("/") + "/human"
+        payload = {"type": "echo", "text": rng.choice(QUESTIONS), "sessionid": 0, "history": []}
+        headers = {"X-Session-ID": rng.choice(args.session_id)}
+        async with session.post(url, json=payload, headers=headers) as resp:
+            await resp.read()
+            return "human", resp.status
+    path = rng.choice(args.get)
+    async with session.get(args.url.rstrip("/") + path, allow_redirects=False) as resp:
+        await resp.read()
+        return "page", resp.status
+
+
+async def user_loop(session, args, deadline, results, seed):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            kind, status = await one_request(session, args, rng)
+        except Exception as e:
+            kind, status = "error", type(e).__name__
+        results.append((kind, status, (time.perf_counter() - start) * 1000))
+        if args.think_ms:
+            await asyncio.sleep(rng.uniform(0, args.think_ms) / 1000)
+
+
+def report(results, elapsed, users):
+    print(f"\n{users} concurrent users, {elapsed:.1f}s")
+    print(f"{'kind':<8}{'count':>8}{'req/s':>9}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for kind in sorted({r[0] for r in results}):
+        lat = sorted(r[2] for r in results if r[0] == kind)
+        pick = lambda q: lat[min(len(lat) - 1, int(len(lat) * q))]
+        print(f"{kind:<8}{len(lat):>8}{len(lat) / elapsed:>9.1f}{statistics.mean(lat):>10.1f}"
+              f"{pick(0.5):>10.1f}{pick(0.95):>10.1f}{pick(0.99):>10.1f}")
+    print(f"total: {len(results)} requests, {len(results) / elapsed:.1f} req/s")
+    print("status:", dict(Counter(str(r[1]) for r in results)))
+
+
+async def main(args):
+    if not args.session_id and not args.get:
+        raise SystemExit("need --session-id for /human and/or --get <path> for page requests")
+    headers = {"Cookie": args.cookie} if args.cookie else None
+    connector = aiohttp.TCPConnector(limit=args.users)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    results = []
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(user_loop(session, args, deadline, results, i) for i in range(args.users)))
+        elapsed = time.perf_counter() - start
+    report(results, elapsed, args.users)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test for /human and quiz pages")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--session-id", action="append", default=[], help="logged-in session id (repeatable)")
+    parser.add_argument("--cookie", default="", help="Cookie header for Flask pages")
+    parser.add_argument("--get", action="append", default=[], help="page path to GET (repeatable)")
+    parser.add_argument("--human-weight", type=float, default=1.0)
+    parser.add_argument("--page-weight", type=float, default=3.0)
+    parser.add_argument("--think-ms", type=float, default=0, help="random pause between requests per user")
+    parser.add_argument("--timeout", type=float, default=120)
+    asyncio.run(main(parser.parse_args()))
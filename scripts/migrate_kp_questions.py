@@ -0,0 +1,88 @@
+# scripts/migrate_kp_questions.py
+"""
+把旧布局的知识点 (questions 数组内嵌在摘要文档里) 迁移到新布局:
+    knowledge_points/{list}/items/{name}                  摘要 + layout_version=2
+    knowledge_points/{list}/items/{name}/questions/{qid}  每道题一个文档, 带 order 字段
+
+已经是新布局的知识点, 给缺少结构化字段 (stem / options / answer_letter) 的题目文档补齐,
+之后练习页直接渲染这些字段, 不再每次渲染时解析题目文本。
+
+用法:
+    python scripts/migrate_kp_questions.py              # 所有题库
+    python scripts/migrate_kp_questions.py 1 2          # 指定 list_id
+    python scripts/migrate_kp_questions.py --dry-run    # 只打印, 不写入
+"""
+import os
+import sys
+
+# 确保可以从项目根目录导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from db import fire_db, DELETE_FIELD
+from kimi_utils import structure_question
+from quiz_app import KnowledgePoint
+
+STRUCTURED_FIELDS = ('stem', 'options', 'answer_letter', 'explanation')
+
+
+def backfill_structured(db, doc_ref, dry_run=False):
+    """给一个新布局知识点下缺少结构化字段的题目文档补齐; 返回补齐的题目数"""
+    batch = db.batch()
+    pending = 0
+    for qdoc in doc_ref.collection('questions').stream():
+        data = qdoc.to_dict() or {}
+        if 'stem' in data and 'options' in data:
+            continue
+        pending += 1
+        if not dry_run:
+            structured = structure_question(data)
+            batch.update(qdoc.reference, {k: structured[k] for k in STRUCTURED_FIELDS})
+            if pending % 400 == 0:     # Firestore 单个 WriteBatch 最多 500 次写入
+                batch.commit()
+                batch = db.batch()
+    if pending % 400 and not dry_run:
+        batch.commit()
+    return pending
+
+
+def migrate(list_ids=None, dry_run=False):
+    db = fire_db()
+    if list_ids:
+        docs = []
+        for list_id in list_ids:
+            docs.extend(db.collection('knowledge_points').document(list_id).collection('items').stream())
+    else:
+        docs = list(db.collection_group('items').stream())
+
+    migrated = 0
+    structured = 0
+    for doc in docs:
+        data = doc.to_dict() or {}
+        if data.get('layout_version', 1) >= KnowledgePoint.LAYOUT_VERSION:
+            n = backfill_structured(db, doc.reference, dry_run=dry_run)
+            if n:
+                print(f"[{data.get('list')}] {data.get('name') or doc.id}: {n} questions structured")
+                structured += n
+            continue
+        questions = data.get('questions') or []
+        list_id = data.get('list') or doc.reference.parent.parent.id
+        name = data.get('name') or doc.id
+        print(f"[{list_id}] {name}: {len(questions)} questions")
+        if dry_run:
+            continue
+
+        kp = KnowledgePoint(db, list_id, name, data.get('description', ""), questions)
+        kp.save()
+        # save() 用 set 覆盖了摘要文档; 再显式删除一次以防并发写入带回旧字段
+        doc.reference.update({'questions': DELETE_FIELD})
+        migrated += 1
+
+    print(f"Migrated {migrated} knowledge point(s), structured {structured} question(s).")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    dry = '--dry-run' in args
+    migrate([a for a in args if a != '--dry-run'], dry_run=dry)
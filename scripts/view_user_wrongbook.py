@@ -8,13 +8,29 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 from db import fire_db
+import wrong_stats
 
-def view_wrongbook(username: str):
+def view_wrongbook(username: str, details: bool = False):
     db = fire_db()
+
+    # 汇总只读聚合文档 (一次读取)
+    kps = wrong_stats.load_wrong_stats(db, username)
+    print(f"== Wrongbook summary of user '{username}' ==")
+    if not kps:
+        print("No wrong questions found.")
+        return
+    for kp_name, entry in sorted(kps.items(), key=lambda kv: -int(kv[1].get('wrong') or 0)):
+        print(f"  {kp_name}: wrong={entry.get('wrong', 0)} attempted={entry.get('attempted', 0)} "
+              f"last={entry.get('last_ts')}")
+
+    if not details:
+        return
+
+    # 明细需要逐个知识点读取错题记录
     wrong_questions_ref = db.collection('users').document(username).collection('wrong_questions')
     keypoints = wrong_questions_ref.stream()
 
-    print(f"== Wrongbook of user '{username}' ==")
+    print(f"\n== Wrongbook of user '{username}' ==")
     empty = True
 
     for kp_doc in keypoints:
@@ -41,4 +57,5 @@ def view_wrongbook(username: str):
         print("No wrong questions found.")
 
 if __name__ == "__main__":
-    view_wrongbook("dya")
\ No newline at end of file
+    args = [a for a in sys.argv[1:] if a != "--details"]
+    view_wrongbook(args[0] if args else "dya", details="--details" in sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,266 @@
+# session_store.py
+"""
+会话 / 用户组件存储
+
+1) ExpiringLRU: 进程内对象 (如 SessionComponentProxy) 的有序 LRU
+   - 所有条目的空闲超时相同, 按最近访问排序的 OrderedDict 里最久未访问的条目就是最先过期的,
+     所以 touch (move_to_end)、过期 (从表头弹出)、超容量淘汰都是 O(1), 不需要全表扫描或排序
+   - 锁只保护链表操作; on_evict 回调 (释放组件) 在锁外执行, 不阻塞请求线程
+
+2) 共享会话元数据 (可选, 多个前端进程共用): session_id -> username + 过期时间
+   进程 A 登录的会话被路由到进程 B 时, B 从共享存储查到用户名, 在本地懒创建组件。
+       SESSION_BACKEND=memory  (默认) 只在本进程内, 不额外存储
+       SESSION_BACKEND=sqlite  SESSION_SQLITE_PATH (默认 ./data/sessions.sqlite3), expires_at 索引
+       SESSION_BACKEND=redis   REDIS_URL (默认 redis://localhost:6379/0), 用 key TTL 过期
+   touch 写入按 SESSION_TOUCH_INTERVAL 秒节流, 活跃会话不会每个请求都写一次
+
+配置: SESSION_IDLE_TIMEOUT (默认 600 秒), SESSION_REAP_INTERVAL (默认 120 秒), SESSION_TOUCH_INTERVAL (默认 30 秒)
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "600"))
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "120"))
+SESSION_TOUCH_INTERVAL = float(os.getenv("SESSION_TOUCH_INTERVAL", "30"))
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", os.path.join("data", "sessions.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class ExpiringLRU:
+    """
+    key -> value, 按最近访问排序。
+    ttl: 空闲超时 (秒, None 表示不过期); capacity: 最大条目数 (None 表示不限), 超出时淘汰最久未访问的;
+    on_evict(key, value): 条目因过期 / 超容量被移除时调用 (锁外)。
+    """
+
+    def __init__(self, ttl=None, capacity=None, on_evict=None):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self._data = OrderedDict()      # key -> [value, last_accessed]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def _expired(self, entry, now, max_idle=None):
+        idle = self.ttl if max_idle is None else max_idle
+        return idle is not None and now - entry[1] > idle
+
+    def get(self, key, touch=True):
+        """返回 value 并刷新访问时间; 不存在或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, now):
+                del self._data[key]
+                evicted = [(key, entry[0])]
+            else:
+                if touch:
+                    entry[1] = now
+                    self._data.move_to_end(key)
+                return entry[0]
+        self._notify(evicted)
+        return None
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._data[key] = [value, now]
+            self._data.move_to_end(key)
+            evicted = self._trim()
+        self._notify(evicted)
+
+    def get_or_create(self, key, factory):
+        """已有则返回 (并刷新访问时间), 否则用 factory() 创建; factory 在锁外执行, 并发创建时只保留先插入的"""
+        value = self.get(key)
+        if value is not None:
+            return value, False
+        created = factory()
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not self._expired(entry, now):
+                entry[1] = now
+                self._data.move_to_end(key)
+                return entry[0], False
+            self._data[key] = [created, now]
+            self._data.move_to_end(key)
+            evicted = self._trim()
+        self._notify(evicted)
+        return created, True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def expire(self, max_idle=None):
+        """从表头弹出所有空闲超过 max_idle (默认 ttl) 的条目, 只触及过期的条目; 返回 [(key, value)]"""
+        now = time.time()
+        evicted = []
+        with self._lock:
+            while self._data:
+                key, entry = next(iter(self._data.items()))
+                if not self._expired(entry, now, max_idle):
+                    break
+                self._data.popitem(last=False)
+                evicted.append((key, entry[0]))
+        self._notify(evicted)
+        return evicted
+
+    def items(self):
+        """[(key, value, last_accessed)] 快照 (最久未访问在前), 仅供状态页使用"""
+        with self._lock:
+            return [(k, e[0], e[1]) for k, e in self._data.items()]
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def _trim(self):
+        evicted = []
+        if self.capacity is not None and self.capacity > 0:
+            while len(self._data) > self.capacity:
+                key, entry = self._data.popitem(last=False)
+                evicted.append((key, entry[0]))
+        return evicted
+
+    def _notify(self, evicted):
+        if self.on_evict:
+            for key, value in evicted:
+                try:
+                    self.on_evict(key, value)
+                except Exception as e:
+                    print(f"❌ Error releasing {key}: {e}")
+
+
+class _ThrottledTouch:
+    """记录每个会话上次写入共享存储的时间, SESSION_TOUCH_INTERVAL 内的重复 touch 直接跳过"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._last = ExpiringLRU(ttl=interval)
+
+    def due(self, session_id):
+        if self._last.get(session_id, touch=False) is not None:
+            return False
+        self._last.put(session_id, True)
+        return True
+
+    def forget(self, session_id):
+        self._last.pop(session_id)
+
+    def reap(self):
+        self._last.expire()
+
+
+class SQLiteSessionStore:
+    """sessions(session_id, username, expires_at), expires_at 上有索引: 过期清理为 O(log n + k)"""
+
+    def __init__(self, path=SESSION_SQLITE_PATH, ttl=SESSION_IDLE_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._touch = _ThrottledTouch(SESSION_TOUCH_INTERVAL)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                            session_id TEXT PRIMARY KEY,
+                            username   TEXT NOT NULL,
+                            expires_at REAL NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def touch(self, session_id, username, force=False):
+        if not force and not self._touch.due(session_id):
+            return
+        self._conn().execute(
+            "INSERT INTO sessions (session_id, username, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET username = excluded.username, expires_at = excluded.expires_at",
+            (session_id, username, time.time() + self.ttl))
+
+    def get(self, session_id):
+        row = self._conn().execute(
+            "SELECT username FROM sessions WHERE session_id = ? AND expires_at > ?",
+            (session_id, time.time())).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        self._touch.forget(session_id)
+        self._conn().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def expire(self):
+        self._touch.reap()
+        return self._conn().execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class RedisSessionStore:
+    """session:{id} -> username, 过期交给 Redis 的 key TTL"""
+
+    def __init__(self, url=REDIS_URL, ttl=SESSION_IDLE_TIMEOUT):
+        import redis
+        self.ttl = int(ttl)
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._touch = _ThrottledTouch(SESSION_TOUCH_INTERVAL)
+
+    @staticmethod
+    def _key(session_id):
+        return f"session:{session_id}"
+
+    def touch(self, session_id, username, force=False):
+        if not force and not self._touch.due(session_id):
+            return
+        self._redis.set(self._key(session_id), username, ex=self.ttl)
+
+    def get(self, session_id):
+        return self._redis.get(self._key(session_id))
+
+    def delete(self, session_id):
+        self._touch.forget(session_id)
+        self._redis.delete(self._key(session_id))
+
+    def expire(self):
+        self._touch.reap()
+        return 0
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """进程内共享的会话元数据存储; memory 后端返回 None (只用本进程的 ExpiringLRU)"""
+    global _store
+    if SESSION_BACKEND == "memory":
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_BACKEND == "sqlite":
+                    _store = SQLiteSessionStore()
+                elif SESSION_BACKEND == "redis":
+                    _store = RedisSessionStore()
+                else:
+                    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+                print(f"✓ Shared session store: {SESSION_BACKEND}")
+    return _store
@@ -0,0 +1,136 @@
+# speech_text.py
+"""
+数字人播报文本工具
+
+- normalize_for_speech: 本地确定性规整 (去掉引用 / 代码 / Markdown, 把 % 等符号读出来),
+  用来替代原先专门调用一次 LLM 做 "口语化改写" 的步骤
+- SpeechAnswerSplitter: 解析 "展示答案 + 播报文本" 一次性流式输出的结构
+"""
+import re
+from typing import Callable, Optional, Tuple
+
+# 组合生成模式下, 模型先输出展示答案, 再输出这一行分隔符, 之后是给 TTS 的口语版本
+SPEECH_MARKER = "===SPEECH==="
+
+LEARNING_REPORT_SPEECH = (
+    "I have generated your learning report. Please take a look at it on the page."
+)
+LEARNING_REPORT_PENDING_SPEECH = (
+    "I am preparing your learning report now. Please ask me again in a minute."
+)
+LEARNING_REPORT_NO_DATA_SPEECH = (
+    "You have not answered any quiz questions yet. Try some practice questions first, then ask me for your report."
+)
+
+_RE_CODE_BLOCK = re.compile(r"```.*?(```|$)", re.DOTALL)
+_RE_INLINE_CODE = re.compile(r"`([^`]*)`")
+_RE_CITATIONS_TAIL = re.compile(r"(?im)^\s*\**\s*citations?\s*:.*\Z", re.DOTALL)
+_RE_BRACKET_SOURCE = re.compile(r"\s*\[(?:[^\[\]]*?\.pdf[^\[\]]*|来源[^\[\]]*|\d+(?:\s*,\s*\d+)*)\]", re.IGNORECASE)
+_RE_URL = re.compile(r"https?://\S+")
+_RE_MD_HEADING = re.compile(r"(?m)^\s{0,3}#{1,6}\s*")
+_RE_MD_BULLET = re.compile(r"(?m)^\s*[-*•]\s+")
+_RE_MD_EMPHASIS = re.compile(r"(\*\*|__|\*|_)(?=\S)(.+?)(?<=\S)\1")
+_RE_MD_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_RE_SPACES = re.compile(r"[ \t]+")
+_RE_BLANK_LINES = re.compile(r"\n{2,}")
+
+# 顺序有意义: 先替换多字符记号, 再替换单字符
+_SYMBOL_WORDS = (
+    (re.compile(r"C\+\+", re.IGNORECASE), "C plus plus"),
+    (re.compile(r"(\d)\s*%"), r"\1 percent"),
+    (re.compile(r"%"), " percent "),
+    (re.compile(r"\s*&&\s*"), " and "),
+    (re.compile(r"\s*\|\|\s*"), " or "),
+    (re.compile(r"\s*==\s*"), " equals "),
+    (re.compile(r"\s*!=\s*"), " not equal to "),
+    (re.compile(r"\s*<=\s*"), " less than or equal to "),
+    (re.compile(r"\s*>=\s*"), " greater than or equal to "),
+    (re.compile(r"\s*->\s*"), " arrow "),
+    (re.compile(r"\s+<\s+"), " less than "),
+    (re.compile(r"\s+>\s+"), " greater than "),
+    (re.compile(r"\s+=\s+"), " equals "),
+    (re.compile(r"\s*&\s*"), " and "),
+    (re.compile(r"[<>{}\[\]|\\^~#*_=]+"), " "),
+)
+
+
+def normalize_for_speech(text: str) -> str:
+    """把展示用的答案转换为适合 TTS 朗读的纯文本 (不调用 LLM)"""
+    if not text:
+        return ""
+    out = _RE_CITATIONS_TAIL.sub("", text)
+    out = _RE_CODE_BLOCK.sub(" (see the code on the page) ", out)
+    out = _RE_INLINE_CODE.sub(r"\1", out)
+    out = _RE_MD_LINK.sub(r"\1", out)
+    out = _RE_URL.sub("", out)
+    out = _RE_BRACKET_SOURCE.sub("", out)
+    out = _RE_MD_HEADING.sub("", out)
+    out = _RE_MD_BULLET.sub("", out)
+    out = _RE_MD_EMPHASIS.sub(r"\2", out)
+    for pattern, words in _SYMBOL_WORDS:
+        out = pattern.sub(words, out)
+    out = _RE_SPACES.sub(" ", out)
+    out = "\n".join(line.strip() for line in out.splitlines())
+    out = _RE_BLANK_LINES.sub("\n", out)
+    return out.strip()
+
+
+def speech_for_intent(answer: str, intent: str, report_ready: bool = True, report_no_data: bool = False) -> str:
+    """按意图给出播报文本; 学习报告只需要一句提示, 其余走本地规整"""
+    if intent == "LEARNING_REPORT":
+        if report_no_data:
+            return LEARNING_REPORT_NO_DATA_SPEECH
+        return LEARNING_REPORT_SPEECH if report_ready else LEARNING_REPORT_PENDING_SPEECH
+    return normalize_for_speech(answer)
+
+
+class SpeechAnswerSplitter:
+    """
+    增量解析组合输出: "<展示答案>\\n===SPEECH===\\n<播报文本>"
+
+    feed() 接收流式 chunk, 通过 on_delta(part, text) 回调实时推送
+    ("answer" / "speech") 两部分的增量; finish() 返回 (answer, speech)。
+    模型没有输出分隔符时, 播报文本由 normalize_for_speech 本地生成。
+    """
+
+    def __init__(self, on_delta: Optional[Callable[[str, str], None]] = None):
+        self.on_delta = on_delta
+        self._answer = []
+        self._speech = []
+        self._pending = ""
+        self._in_speech = False
+
+    def _emit(self, part: str, text: str):
+        if not text:
+            return
+        (self._speech if part == "speech" else self._answer).append(text)
+        if self.on_delta:
+            self.on_delta(part, text)
+
+    def feed(self, chunk: str):
+        if not chunk:
+            return
+        if self._in_speech:
+            self._emit("speech", chunk)
+            return
+        buf = self._pending + chunk
+        idx = buf.find(SPEECH_MARKER)
+        if idx >= 0:
+            self._emit("answer", buf[:idx])
+            self._pending = ""
+            self._in_speech = True
+            self._emit("speech", buf[idx + len(SPEECH_MARKER):].lstrip("\n"))
+            return
+        # 保留可能是分隔符前缀的尾巴, 其余立即推送
+        keep = len(SPEECH_MARKER) - 1
+        self._emit("answer", buf[:-keep] if len(buf) > keep else "")
+        self._pending = buf[-keep:] if len(buf) > keep else buf
+
+    def finish(self) -> Tuple[str, str]:
+        if self._pending:
+            self._emit("answer", self._pending)
+            self._pending = ""
+        answer = "".join(self._answer).strip()
+        # 模型给出的口语版本也再过一遍本地规整, 兜底残留的符号
+        speech = normalize_for_speech("".join(self._speech)) or normalize_for_speech(answer)
+        return answer, speech
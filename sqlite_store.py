@@ -0,0 +1,511 @@
+# sqlite_store.py
+"""
+嵌入式 SQLite 文档存储, 接口与项目里用到的 Firestore 子集保持一致,
+可以直接替换 fire_db().db (见 db.py 的 STORAGE_BACKEND)。
+
+- 所有文档存在一张 docs 表里, path 形如 users/dya/wrong_questions/kp1
+  (parent = 所在集合路径, collection = 集合 id, 供 collection_group 使用)
+- 文档内容为 JSON; datetime 统一转成 UTC 定长字符串, 可以直接比较和排序
+- WAL 模式, 每个线程一个连接; 批量写在一个事务里提交
+- 对 user_id / knowledge_point / timestamp / order 建了表达式索引, where 条件下推到 SQL
+
+支持: collection / document / collection_group / where / order_by / limit / select /
+stream / get / set(merge) / update / delete / add / batch, 以及 Increment / DELETE_FIELD。
+不支持 on_snapshot (supports_snapshots = False, kp_cache 据此改为轮询 update_time)。
+每个线程一个连接, 所以不支持 ":memory:" (每个线程会各自得到一个空库), 测试请用临时文件。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "./data/quiz.sqlite3")
+
+_DT_PREFIX = "__dt__:"
+_DT_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+_FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+# 常用查询字段的表达式索引; where 下推时表达式必须与这里完全一致才会命中索引
+INDEXED_FIELDS = ("user_id", "knowledge_point", "timestamp", "order", "list")
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS docs (
+        path TEXT PRIMARY KEY,
+        parent TEXT NOT NULL,
+        collection TEXT NOT NULL,
+        doc_id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        create_time TEXT NOT NULL,
+        update_time TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_docs_parent ON docs(parent, doc_id)",
+    "CREATE INDEX IF NOT EXISTS idx_docs_collection ON docs(collection)",
+] + [
+    f"CREATE INDEX IF NOT EXISTS idx_docs_{f} ON docs(parent, json_extract(data, '$.{f}'))"
+    for f in INDEXED_FIELDS
+]
+
+
+class Increment:
+    """对应 firestore.Increment: 在原值上累加, 字段不存在时视为 0"""
+    def __init__(self, value):
+        self.value = value
+
+
+class _DeleteField:
+    def __repr__(self):
+        return "DELETE_FIELD"
+
+
+DELETE_FIELD = _DeleteField()
+
+
+# ---------- 编码 ----------
+def _encode_dt(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return _DT_PREFIX + value.strftime(_DT_FORMAT)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return _encode_dt(value)
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, str) and value.startswith(_DT_PREFIX):
+        return datetime.strptime(value[len(_DT_PREFIX):], _DT_FORMAT).replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# ---------- 字段写入语义 ----------
+def _resolve(new, old):
+    """把 Increment 等哨兵换成实际值"""
+    if isinstance(new, Increment):
+        base = old if isinstance(old, (int, float)) and not isinstance(old, bool) else 0
+        return base + new.value
+    if isinstance(new, dict):
+        old = old if isinstance(old, dict) else {}
+        return {k: _resolve(v, old.get(k)) for k, v in new.items() if v is not DELETE_FIELD}
+    return new
+
+
+def _merge(old, new):
+    """set(merge=True): map 递归合并, 其他类型直接覆盖"""
+    out = dict(old)
+    for k, v in new.items():
+        if v is DELETE_FIELD:
+            out.pop(k, None)
+        elif isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = _merge(out[k], v)
+        else:
+            out[k] = _resolve(v, out.get(k))
+    return out
+
+
+def _update(old, updates):
+    """update(): key 可以是 "a.b" 形式的字段路径"""
+    out = dict(old)
+    for path, v in updates.items():
+        parts = path.split(".")
+        node = out
+        for p in parts[:-1]:
+            if not isinstance(node.get(p), dict):
+                node[p] = {}
+            node[p] = dict(node[p])
+            node = node[p]
+        if v is DELETE_FIELD:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = _resolve(v, node.get(parts[-1]))
+    return out
+
+
+def _get_field(data, path):
+    node = data
+    for p in path.split("."):
+        if not isinstance(node, dict) or p not in node:
+            return None
+        node = node[p]
+    return node
+
+
+def _project(data, fields):
+    out = {}
+    for f in fields:
+        value = _get_field(data, f)
+        if value is not None:
+            out[f] = value
+    return out
+
+
+# ---------- 引用 / 快照 ----------
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+    def get(self, field_path):
+        return _get_field(self._data or {}, field_path)
+
+
+class CollectionReference:
+    def __init__(self, client, path, parent=None):
+        self._client = client
+        self._path = path
+        self.id = path.rsplit("/", 1)[-1]
+        self.parent = parent  # DocumentReference 或 None (顶层集合)
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = uuid.uuid4().hex[:20]
+        return DocumentReference(self._client, f"{self._path}/{document_id}", self)
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return _now(), ref
+
+    def _query(self):
+        return Query(self._client, parent=self._path)
+
+    def where(self, field_path, op_string, value):
+        return self._query().where(field_path, op_string, value)
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._query().order_by(field_path, direction)
+
+    def limit(self, count):
+        return self._query().limit(count)
+
+    def select(self, field_paths):
+        return self._query().select(field_paths)
+
+    def stream(self):
+        return self._query().stream()
+
+    def get(self):
+        return self._query().get()
+
+
+class DocumentReference:
+    def __init__(self, client, path, parent=None):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+        if parent is None:
+            parent_path = path.rsplit("/", 1)[0]
+            grand = parent_path.rsplit("/", 2)
+            doc_parent = (DocumentReference(client, parent_path.rsplit("/", 1)[0])
+                          if len(grand) > 1 else None)
+            parent = CollectionReference(client, parent_path, doc_parent)
+        self.parent = parent
+
+    def collection(self, collection_id):
+        return CollectionReference(self._client, f"{self.path}/{collection_id}", self)
+
+    def get(self, field_paths=None):
+        snap = self._client._get(self)
+        if field_paths is not None and snap.exists:
+            snap._data = _project(snap._data, field_paths)
+        return snap
+
+    def set(self, document_data, merge=False):
+        self._client._write([("set", self, document_data, merge)])
+
+    def update(self, field_updates):
+        self._client._write([("update", self, field_updates, False)])
+
+    def delete(self):
+        self._client._write([("delete", self, None, False)])
+
+
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    _SQL_OPS = {"==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+    def __init__(self, client, parent=None, collection_id=None):
+        self._client = client
+        self._parent = parent
+        self._collection_id = collection_id
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._fields = None
+
+    def _copy(self, **changes):
+        q = Query(self._client, self._parent, self._collection_id)
+        q._filters = list(self._filters)
+        q._orders = list(self._orders)
+        q._limit = self._limit
+        q._fields = self._fields
+        for k, v in changes.items():
+            setattr(q, k, v)
+        return q
+
+    def where(self, field_path, op_string, value):
+        return self._copy(_filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(_orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(_limit=count)
+
+    def select(self, field_paths):
+        return self._copy(_fields=list(field_paths))
+
+    def _sql(self):
+        """能下推的条件 / 排序翻译成 SQL, 其余在 Python 里处理"""
+        clauses, params, post_filters = [], [], []
+        if self._parent is not None:
+            clauses.append("parent = ?")
+            params.append(self._parent)
+        if self._collection_id is not None:
+            clauses.append("collection = ?")
+            params.append(self._collection_id)
+        for field, op, value in self._filters:
+            if not _FIELD_RE.match(field):
+                post_filters.append((field, op, value))
+                continue
+            expr = f"json_extract(data, '$.{field}')"
+            if op in self._SQL_OPS:
+                clauses.append(f"{expr} {self._SQL_OPS[op]} ?")
+                params.append(_encode(value))
+            elif op == "in":
+                values = [_encode(v) for v in value]
+                if not values:
+                    clauses.append("0")
+                else:
+                    clauses.append(f"{expr} IN ({', '.join('?' * len(values))})")
+                    params.extend(values)
+            else:
+                post_filters.append((field, op, value))
+
+        orders = []
+        if all(_FIELD_RE.match(f) for f, _ in self._orders):
+            for field, direction in self._orders:
+                desc = "DESC" if direction == self.DESCENDING else "ASC"
+                orders.append(f"json_extract(data, '$.{field}') {desc}")
+        sorted_in_sql = len(orders) == len(self._orders)
+        orders.append("path ASC")
+
+        sql = "SELECT path, data, create_time, update_time FROM docs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY " + ", ".join(orders)
+        if self._limit is not None and not post_filters and sorted_in_sql:
+            sql += f" LIMIT {int(self._limit)}"
+        return sql, params, post_filters, sorted_in_sql
+
+    def stream(self):
+        sql, params, post_filters, sorted_in_sql = self._sql()
+        rows = self._client._execute(sql, params)
+        snaps = [self._client._snapshot(DocumentReference(self._client, path), data, ct, ut)
+                 for path, data, ct, ut in rows]
+        for field, op, value in post_filters:
+            snaps = [s for s in snaps if _matches(s._data, field, op, value)]
+        if not sorted_in_sql:
+            for field, direction in reversed(self._orders):
+                snaps.sort(key=lambda s: _sort_key(_get_field(s._data, field)),
+                           reverse=direction == self.DESCENDING)
+        if self._limit is not None:
+            snaps = snaps[:self._limit]
+        if self._fields is not None:
+            for s in snaps:
+                s._data = _project(s._data, self._fields)
+        return iter(snaps)
+
+    def get(self):
+        return list(self.stream())
+
+
+def _sort_key(value):
+    return (value is not None, value if value is not None else 0)
+
+
+def _matches(data, field, op, value):
+    actual = _get_field(data, field)
+    try:
+        if op == "==":
+            return actual == value
+        if op == "!=":
+            return actual != value
+        if op == "<":
+            return actual is not None and actual < value
+        if op == "<=":
+            return actual is not None and actual <= value
+        if op == ">":
+            return actual is not None and actual > value
+        if op == ">=":
+            return actual is not None and actual >= value
+        if op == "in":
+            return actual in value
+        if op == "not-in":
+            return actual not in value
+        if op == "array_contains":
+            return isinstance(actual, list) and value in actual
+        if op == "array_contains_any":
+            return isinstance(actual, list) and any(v in actual for v in value)
+    except TypeError:
+        return False
+    raise ValueError(f"unsupported operator: {op}")
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(("set", reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._ops.append(("update", reference, field_updates, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+
+    def commit(self):
+        # 失败时保留写操作 (事务已回滚), 调用方可以重试或转存
+        if self._ops:
+            self._client._write(self._ops)
+            self._ops = []
+        return []
+
+
+class SQLiteClient:
+    """firestore.Client 的替代品; 每个线程一个 sqlite3 连接"""
+    supports_snapshots = False  # 没有变更推送
+
+    def __init__(self, path=SQLITE_PATH):
+        if path == ":memory:" or str(path).startswith("file::memory:"):
+            raise ValueError("sqlite backend uses one connection per thread; "
+                             "an in-memory database would be empty in every other thread, use a file path")
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+        print(f"✓ SQLite storage ready: {path}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql, params=()):
+        return self._conn().execute(sql, params).fetchall()
+
+    # ---------- Firestore 风格入口 ----------
+    def collection(self, collection_id):
+        return CollectionReference(self, collection_id)
+
+    def collection_group(self, collection_id):
+        return Query(self, collection_id=collection_id)
+
+    def document(self, document_path):
+        return DocumentReference(self, document_path)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    # ---------- 内部读写 ----------
+    def _snapshot(self, ref, data, create_time, update_time):
+        return DocumentSnapshot(
+            ref,
+            _decode(json.loads(data)) if data is not None else None,
+            _decode(create_time) if create_time else None,
+            _decode(update_time) if update_time else None,
+        )
+
+    def _get(self, ref):
+        rows = self._execute("SELECT data, create_time, update_time FROM docs WHERE path = ?", (ref.path,))
+        if not rows:
+            return DocumentSnapshot(ref, None)
+        return self._snapshot(ref, *rows[0])
+
+    def _write(self, ops):
+        """一组写操作在一个事务里完成 (BEGIN IMMEDIATE 保证读-改-写不被打断)"""
+        conn = self._conn()
+        now = _encode_dt(_now())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, ref, payload, merge in ops:
+                if kind == "delete":
+                    conn.execute("DELETE FROM docs WHERE path = ?", (ref.path,))
+                    continue
+                row = conn.execute("SELECT data FROM docs WHERE path = ?", (ref.path,)).fetchone()
+                old = _decode(json.loads(row[0])) if row else None
+                if kind == "update":
+                    if old is None:
+                        raise KeyError(f"No document to update: {ref.path}")
+                    data = _update(old, payload)
+                elif merge and old is not None:
+                    data = _merge(old, payload)
+                else:
+                    data = _resolve(payload, None)
+                encoded = json.dumps(_encode(data), ensure_ascii=False)
+                conn.execute(
+                    """INSERT INTO docs (path, parent, collection, doc_id, data, create_time, update_time)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(path) DO UPDATE SET data = excluded.data, update_time = excluded.update_time""",
+                    (ref.path, ref.parent._path, ref.parent.id, ref.id, encoded, now, now),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_sqlite_client(path=SQLITE_PATH):
+    """同一个数据库文件在进程内只打开一个客户端"""
+    client = _clients.get(path)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(path)
+            if client is None:
+                client = SQLiteClient(path)
+                _clients[path] = client
+    return client
@@ -39,8 +39,8 @@ class Audio2Feature():
             input_values = input_values_all
         if input_values.shape[1] >= kernel:  # if the last batch is shorter than kernel_size, skip it            
             hidden_states = self.model(input_values).last_hidden_state  # [B=1, T=pts//320, hid=1024]
-        res_lst.append(hidden_states[0])
-        ret = torch.cat(res_lst, dim=0).cpu()  # [T, 1024]
+            res_lst.append(hidden_states[0])
+        ret = torch.cat(res_lst, dim=0).cpu() if res_lst else torch.zeros(0, self.model.config.hidden_size)  # [T, 1024]
         assert abs(ret.shape[0] - expected_T) <= 1
         if ret.shape[0] < expected_T:
             ret = torch.nn.functional.pad(ret, (0,0,0,expected_T-ret.shape[0]))
@@ -48,6 +48,10 @@ class Audio2Feature():
             ret = ret[:expected_T]
         return ret
 
+    def stream(self):
+        # streaming get_hubert_from_16k_speech for one audio stream (one HubertASR), see HubertStream
+        return HubertStream(self)
+
     def get_sliced_feature(self,
                            feature_array,
                            vid_idx,
@@ -94,3 +98,95 @@ class Audio2Feature():
             i += 1
 
         return whisper_chunks
+
+
+class HubertStream():
+    """
+    get_hubert_from_16k_speech over a sliding window (left stride + new audio + right stride),
+    without re-running the conv feature extractor on audio already seen by the previous window.
+
+    The conv feature extractor + feature projection are frame local (frame t only sees samples
+    [320t, 320t + 400)), so their outputs for the overlap with the previous window are reused and
+    only the frames touching the new audio are computed. The transformer still runs on the whole
+    window, so the context stays bounded by the window size and the positional conv sees the same input.
+
+    The window is normalized like the processor (zero mean, unit variance over the window), the reused
+    frames keep the normalization of the window they were computed in. When the mean / std of the current
+    window drift from the ones a reused frame was normalized with by more than drift_tol (relative to the
+    current std), the whole window is projected again, so the reused frames never stray far from the full pass.
+    """
+    def __init__(self, audio2feature, kernel=400, stride=320, drift_tol=0.05):
+        self.audio2feature = audio2feature
+        self.model = audio2feature.model
+        self.device = audio2feature.device
+        feature_extractor = getattr(audio2feature.processor, 'feature_extractor', audio2feature.processor)
+        self.do_normalize = getattr(feature_extractor, 'do_normalize', True)
+        self.kernel = kernel
+        self.stride = stride
+        self.drift_tol = drift_tol
+        self.cache = None  # projected conv features of the previous window, [T, 1024]
+        self.cache_norm = None  # (mean, std) each cached frame was normalized with, [T, 2]
+        self.reused = 0  # frames reused by the last get_hubert
+
+    def reset(self):
+        self.cache = None
+        self.cache_norm = None
+        self.reused = 0
+
+    def drift(self, norm, mean, std):
+        # norm: [T, 2] (mean, std) of reused frames --> max error of their normalized input, relative to the current std
+        # (x - m0) / s0 = (x - m) / s * (s / s0) + (m - m0) / s0
+        return ((std / norm[:, 1] - 1).abs() + (mean - norm[:, 0]).abs() / norm[:, 1]).max().item()
+
+    @torch.no_grad()
+    def project(self, input_values):
+        # input_values: [1, S] --> [T, 1024], conv feature extractor + feature projection
+        extract_features = self.model.feature_extractor(input_values).transpose(1, 2)
+        hidden_states = self.model.feature_projection(extract_features)
+        if isinstance(hidden_states, tuple):  # wav2vec2 style projection returns (hidden_states, norm_hidden_states)
+            hidden_states = hidden_states[0]
+        return hidden_states[0]
+
+    @torch.no_grad()
+    def get_hubert(self, speech, new):
+        """
+        speech: [S,] the current window, whose first S - new samples are the end of the previous window
+        new: number of new samples at the end of the window
+        return: [T, 1024] on cpu, same as get_hubert_from_16k_speech(speech)
+        """
+        if speech.ndim == 2:
+            speech = speech[:, 0]  # [T, 2] ==> [T,]
+        # only whole strides can reuse frames, otherwise fall back to the full pass
+        if speech.shape[0] % self.stride != 0 or new % self.stride != 0 or speech.shape[0] < self.kernel:
+            self.reset()
+            return self.audio2feature.get_hubert_from_16k_speech(speech)
+
+        num_frames = (speech.shape[0] - (self.kernel - self.stride)) // self.stride  # expected_T
+        old_frames = max(0, (speech.shape[0] - new - (self.kernel - self.stride)) // self.stride)  # frames entirely in the old audio
+        # the old audio is the end of the previous window, whose last frames are the old frames of this one
+        reuse = old_frames if self.cache is not None and self.cache.shape[0] >= old_frames else 0
+
+        input_values = torch.from_numpy(np.ascontiguousarray(speech, dtype=np.float32)).to(self.device)
+        if self.do_normalize:
+            var, mean = torch.var_mean(input_values, unbiased=False)
+            std = torch.sqrt(var + 1e-7)
+        else:
+            mean, std = torch.zeros((), device=self.device), torch.ones((), device=self.device)
+        if reuse > 0 and self.do_normalize and self.drift(self.cache_norm[-reuse:], mean, std) > self.drift_tol:
+            reuse = 0  # the loudness changed too much, the reused frames would be normalized too differently
+        input_values = input_values[reuse * self.stride:].unsqueeze(0)  # frames reuse.. only
+        if self.do_normalize:
+            input_values = (input_values - mean) / std
+
+        features = self.project(input_values)
+        norm = torch.stack([mean, std]).expand(features.shape[0], 2)
+        if reuse > 0:
+            features = torch.cat([self.cache[-reuse:], features], dim=0)
+            norm = torch.cat([self.cache_norm[-reuse:], norm], dim=0)
+        features = features[:num_frames]
+        self.cache = features
+        self.cache_norm = norm[:num_frames]
+        self.reused = reuse
+
+        hidden_states = self.model.encoder(features.unsqueeze(0))[0]  # [B=1, T=pts//320, hid=1024]
+        return hidden_states[0].cpu()
@@ -1,5 +1,6 @@
 from db import fire_db
-from firebase_admin import credentials, firestore
+import wrong_stats
+from report_service import get_report_service
 
 class User:
     def __init__(self, username, password, is_admin=False):
@@ -38,4 +39,8 @@ class User:
             .collection('wrong_questions') \
             .document(keypoint) \
             .collection('questions') \
-            .add(wrong_answer_data)
\ No newline at end of file
+            .add(wrong_answer_data)
+
+        wrong_stats.record_answers(self.fdb, self.username, keypoint, None,
+                                   attempted=1, wrong=1, timestamp=timestamp)
+        get_report_service(self.fdb).note_answers(self.username, 1)
@@ -0,0 +1,158 @@
+# write_behind.py
+"""
+Firestore 写后队列 (write-behind)
+
+请求线程只负责组装 WriteBatch 并放入队列, 后台线程负责 commit (带重试),
+这样练习提交的结果页可以立即渲染, 不用等待网络往返。
+通过环境变量 QUIZ_WRITE_BEHIND=1 开启; 默认关闭, 即在请求内同步提交。
+
+批量写里有 Increment 计数 (见 wrong_stats.py), 重复提交会重复累加, 所以只重试确定没有生效的错误;
+超时 / 服务不可用等结果不确定的错误, 以及重试用尽的批次, 写入 QUIZ_WRITE_BEHIND_FAILED 文件 (JSON Lines),
+由人工核对后补写, 不会静默丢弃。
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+WRITE_BEHIND_ENABLED = os.getenv("QUIZ_WRITE_BEHIND", "0") == "1"
+FAILED_PATH = os.getenv("QUIZ_WRITE_BEHIND_FAILED", "write_behind_failed.jsonl")
+MAX_RETRIES = 3
+
+try:
+    from sqlite_store import WriteBatch as _SQLiteWriteBatch
+    LOCAL_BATCH_TYPES = (_SQLiteWriteBatch,)
+except ImportError:
+    LOCAL_BATCH_TYPES = ()
+
+
+def _api_exceptions():
+    try:
+        from google.api_core import exceptions as api_exceptions
+    except ImportError:
+        return None
+    return api_exceptions
+
+
+def may_have_applied(batch, exc):
+    """提交报错后写入是否可能已经生效 (超时 / 服务不可用 / 连接中断等)"""
+    if isinstance(batch, LOCAL_BATCH_TYPES):
+        return False  # sqlite 后端在本地事务里提交, 失败即回滚
+    api_exceptions = _api_exceptions()
+    # 4xx (含 ABORTED / RESOURCE_EXHAUSTED) 表示服务端拒绝了这次提交
+    return not (api_exceptions is not None and isinstance(exc, api_exceptions.ClientError))
+
+
+def is_retryable(batch, exc):
+    """只有确定没有生效、且重试可能成功的错误才重试"""
+    if may_have_applied(batch, exc):
+        return False
+    if isinstance(batch, LOCAL_BATCH_TYPES):
+        return isinstance(exc, sqlite3.OperationalError)  # database is locked 等
+    api_exceptions = _api_exceptions()
+    return isinstance(exc, (api_exceptions.Aborted, api_exceptions.ResourceExhausted))
+
+
+def describe_writes(batch):
+    """尽量把批量写的内容转成可记录的形式 (Firestore / sqlite_store 的 WriteBatch)"""
+    try:
+        ops = getattr(batch, '_ops', None)
+        if ops is not None:
+            return [{'op': kind, 'path': ref.path, 'data': repr(payload), 'merge': merge}
+                    for kind, ref, payload, merge in ops]
+        write_pbs = getattr(batch, '_write_pbs', None)
+        if write_pbs is not None:
+            return [json.loads(type(pb).to_json(pb)) for pb in write_pbs]
+    except Exception as e:
+        return f"<unavailable: {e}>"
+    return None
+
+
+class WriteBehindQueue:
+    def __init__(self, maxsize=1000, failed_path=FAILED_PATH):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.failed_path = failed_path
+        self.failed = deque(maxlen=100)  # 最近失败的 (batch, label, error, ambiguous), 便于排查 / 补写
+        self.failed_count = 0
+        self._thread = threading.Thread(target=self._worker, daemon=True, name="FirestoreWriteBehind")
+        self._thread.start()
+        print("✓ Firestore write-behind queue started")
+
+    def submit(self, batch, label=""):
+        """放入待提交的批量写; 队列满时退化为同步提交, 避免丢数据"""
+        try:
+            self._queue.put_nowait((batch, label))
+        except queue.Full:
+            print(f"⚠️ Write-behind queue full, committing synchronously: {label}")
+            batch.commit()
+
+    def flush(self, timeout=None):
+        """等待队列中已有的写入全部完成 (测试 / 退出前使用)"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _worker(self):
+        while True:
+            batch, label = self._queue.get()
+            try:
+                for attempt in range(1, MAX_RETRIES + 1):
+                    try:
+                        batch.commit()
+                        break
+                    except Exception as e:
+                        if not is_retryable(batch, e) or attempt == MAX_RETRIES:
+                            self._record_failure(batch, label, e, ambiguous=may_have_applied(batch, e),
+                                                 attempts=attempt)
+                            break
+                        time.sleep(0.2 * (2 ** (attempt - 1)))
+            finally:
+                self._queue.task_done()
+
+    def _record_failure(self, batch, label, error, ambiguous, attempts):
+        """提交失败的批次写入失败文件; ambiguous 表示可能已经生效, 补写前需要先核对"""
+        self.failed_count += 1
+        self.failed.append((batch, label, error, ambiguous))
+        state = "may have been applied" if ambiguous else f"not applied after {attempts} attempt(s)"
+        print(f"❌ Write-behind commit failed ({label}), {state}: {error!r}")
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'label': label,
+            'error': repr(error),
+            'ambiguous': ambiguous,
+            'attempts': attempts,
+            'writes': describe_writes(batch),
+        }
+        try:
+            with open(self.failed_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"❌ Could not record failed write-behind batch to {self.failed_path}: {e}")
+
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind():
+    global _write_behind
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                _write_behind = WriteBehindQueue()
+    return _write_behind
+
+
+def commit_batch(batch, label=""):
+    """按配置同步提交或交给后台队列"""
+    if WRITE_BEHIND_ENABLED:
+        get_write_behind().submit(batch, label)
+    else:
+        batch.commit()
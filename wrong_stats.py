@@ -0,0 +1,190 @@
+# wrong_stats.py
+"""
+按用户聚合的错题统计
+
+文档位置: users/{user_id}/stats/wrong_answers
+    {
+        "kps": {
+            "<知识点>": {"wrong": 3, "attempted": 10, "last_ts": <datetime>, "list_id": "..."},
+            ...
+        },
+        "backfilled": true,   # 已按历史记录重算过, 缺失时首次读取会重算
+        "updated_at": <datetime>
+    }
+
+PracticeView.post 提交答案时用 Increment 原子累加 (Firestore / SQLite 后端均支持);
+分析页 / 学习报告只读这一个小文档, 不再逐个知识点扫描错题子集合。
+"""
+import threading
+from datetime import datetime, timezone
+
+from db import Increment
+
+STATS_COLLECTION = 'stats'
+STATS_DOC = 'wrong_answers'
+WEAK_POINT_THRESHOLD = 3
+REBUILD_ATTEMPTS = 3
+
+_rebuild_locks = {}
+_rebuild_locks_guard = threading.Lock()
+
+
+def stats_ref(db, user_id):
+    return (db.collection('users').document(str(user_id))
+              .collection(STATS_COLLECTION).document(STATS_DOC))
+
+
+def record_answers(db, user_id, kp_name, list_id, attempted, wrong, timestamp, batch=None):
+    """累加某知识点的作答 / 错题次数; 传入 batch 时只加入批量写, 由调用方提交"""
+    if attempted <= 0 and wrong <= 0:
+        return
+    entry = {
+        'attempted': Increment(attempted),
+        'wrong': Increment(wrong),
+        'last_ts': timestamp,
+    }
+    if list_id is not None:
+        entry['list_id'] = list_id
+    payload = {'kps': {kp_name: entry}, 'updated_at': timestamp}
+    ref = stats_ref(db, user_id)
+    if batch is not None:
+        batch.set(ref, payload, merge=True)
+    else:
+        ref.set(payload, merge=True)
+
+
+def scan_wrong_stats(db, user_id):
+    """旧的全量扫描方式: 用于回填和聚合文档缺失时的兜底"""
+    kps = {}
+    wrong_questions_ref = db.collection('users').document(str(user_id)).collection('wrong_questions')
+    for kp_doc in wrong_questions_ref.stream():
+        kp_data = kp_doc.to_dict() or {}
+        wrong = 0
+        last_ts = None
+        for q_doc in kp_doc.reference.collection('questions').stream():
+            data = q_doc.to_dict() or {}
+            if (data.get('user_answer') or '').strip() != (data.get('std_answer') or '').strip():
+                wrong += 1
+            ts = data.get('timestamp')
+            if ts is not None and (last_ts is None or ts > last_ts):
+                last_ts = ts
+        if wrong > 0:
+            kps[kp_doc.id] = {
+                'wrong': wrong,
+                'attempted': 0,
+                'last_ts': last_ts,
+                'list_id': kp_data.get('list_id'),
+            }
+
+    # answer_records 里有完整的作答次数 (包括答对的)
+    for rec in db.collection('answer_records').where('user_id', '==', str(user_id)).stream():
+        data = rec.to_dict() or {}
+        kp_name = data.get('knowledge_point')
+        if not kp_name:
+            continue
+        entry = kps.setdefault(kp_name, {'wrong': 0, 'attempted': 0, 'last_ts': None, 'list_id': None})
+        entry['attempted'] = entry.get('attempted', 0) + 1
+        ts = data.get('timestamp')
+        if ts is not None and (entry['last_ts'] is None or ts > entry['last_ts']):
+            entry['last_ts'] = ts
+    for entry in kps.values():
+        entry['attempted'] = max(entry['attempted'], entry['wrong'])
+    return kps
+
+
+def _live_kps(snap):
+    return (snap.to_dict() or {}).get('kps') or {} if snap.exists else {}
+
+
+def _later(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def rebuild_wrong_stats(db, user_id, max_attempts=REBUILD_ATTEMPTS):
+    """
+    全量重算聚合文档并打上 backfilled 标记 (回填脚本 / 首次读取使用)。
+    不直接覆盖计数: 扫描前后各读一次实时文档, 期间没有新的提交时
+    用 Increment 写入 (重算值 - 实时值), 之后并发提交的 Increment 不会被覆盖;
+    扫描期间有提交则重试
+    """
+    ref = stats_ref(db, user_id)
+    for _ in range(max_attempts):
+        before = ref.get()
+        kps = scan_wrong_stats(db, user_id)
+        after = ref.get()
+        if before.exists == after.exists and before.update_time == after.update_time:
+            break
+    else:
+        print(f"wrong_stats: {user_id} kept changing during rebuild, applying last scan")
+
+    live = _live_kps(after)
+    now = datetime.now(timezone.utc)
+    payload = {}
+    for kp_name in set(kps) | set(live):
+        target = kps.get(kp_name) or {'wrong': 0, 'attempted': 0, 'last_ts': None, 'list_id': None}
+        current = live.get(kp_name) or {}
+        entry = {
+            'wrong': Increment(int(target.get('wrong') or 0) - int(current.get('wrong') or 0)),
+            'attempted': Increment(int(target.get('attempted') or 0) - int(current.get('attempted') or 0)),
+        }
+        last_ts = _later(target.get('last_ts'), current.get('last_ts'))
+        if last_ts is not None:
+            entry['last_ts'] = last_ts
+        list_id = current.get('list_id') or target.get('list_id')
+        if list_id is not None:
+            entry['list_id'] = list_id
+        payload[kp_name] = entry
+        target['last_ts'], target['list_id'] = last_ts, list_id
+        kps[kp_name] = target
+    ref.set({'kps': payload, 'backfilled': True, 'updated_at': now}, merge=True)
+    return kps
+
+
+def _rebuild_once(db, user_id):
+    """同一进程内同一用户只重算一次, 拿到锁后再确认一次标记"""
+    with _rebuild_locks_guard:
+        lock = _rebuild_locks.setdefault(str(user_id), threading.Lock())
+    with lock:
+        snap = stats_ref(db, user_id).get()
+        if snap.exists and (snap.to_dict() or {}).get('backfilled'):
+            return _live_kps(snap)
+        return rebuild_wrong_stats(db, user_id)
+
+
+def load_wrong_stats(db, user_id):
+    """读取聚合文档; 没有 backfilled 标记 (尚未回填, 或回填前已有新的提交) 时现场重算一次并写回"""
+    snap = stats_ref(db, user_id).get()
+    if snap.exists and (snap.to_dict() or {}).get('backfilled'):
+        return _live_kps(snap)
+    return _rebuild_once(db, user_id)
+
+
+async def load_wrong_stats_async(adb, user_id, db=None):
+    """
+    load_wrong_stats 的异步版本 (adb 见 async_db.get_async_db);
+    需要重算时要全量扫描, 交给线程池用同步客户端 db 完成
+    """
+    snap = await stats_ref(adb, user_id).get()
+    if snap.exists and (snap.to_dict() or {}).get('backfilled'):
+        return _live_kps(snap)
+    if db is None:
+        return _live_kps(snap)
+    from async_runtime import run_blocking
+    return await run_blocking(_rebuild_once, db, user_id)
+
+
+def summarize(kps, weak_threshold=WEAK_POINT_THRESHOLD):
+    """转换成分析页 / 学习报告原来使用的 (kp_stats, weak_points) 结构"""
+    kp_stats = {}
+    weak_points = []
+    for kp_name, entry in kps.items():
+        wrong = int(entry.get('wrong') or 0)
+        if wrong > 0:
+            kp_stats[kp_name] = {'wrong': wrong, 'attempted': int(entry.get('attempted') or 0)}
+            if wrong >= weak_threshold:
+                weak_points.append(kp_name)
+    return kp_stats, weak_points